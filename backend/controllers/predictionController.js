@@ -4,15 +4,57 @@ import { PythonShell } from 'python-shell';
 import PatientData from '../models/PatientData.js';
 import path from 'path';
 import { fileURLToPath } from 'url';
+import { predictWithWorker, getWorkerMetrics, getWorkerDrift } from '../utils/mlWorker.js';
 
 
 // Define __dirname for ES Modules
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
+// 'persistent' keeps one warm ml_model.py worker; 'spawn' starts Python per request.
+const USE_PERSISTENT_WORKER = (process.env.ML_WORKER_MODE || 'persistent') !== 'spawn';
+
+/**
+ * @desc Legacy path: runs ml_model.py once with the features as argv[1].
+ */
+const runPredictionProcess = async (mlFeatures, res) => {
+  // Python-Shell configuration
+  const options = {
+    mode: 'text',
+    pythonOptions: ['-u'],
+    scriptPath: path.join(__dirname, '..', 'ml_service'),
+    args: [JSON.stringify(mlFeatures)]
+  };
+
+  let results;
+  try {
+    results = await PythonShell.run('ml_model.py', options);
+  } catch (error) {
+    console.error('Python Shell Execution Error:', error);
+    res.status(500);
+    throw new Error(`ML Script execution error: ${error.message}`);
+  }
+
+  if (!results || results.length === 0) {
+    res.status(500);
+    throw new Error('ML Prediction failed. Python script returned no output.');
+  }
+
+  try {
+    const predictionJson = results[results.length - 1];
+    return JSON.parse(predictionJson);
+  } catch (error) {
+    console.error('Python Output Error:', error);
+    res.status(500);
+    throw new Error(`ML Prediction failed or returned malformed data: ${error.message}`);
+  }
+};
+
 /**
  * @route POST /api/predict/patient/:id
- * @desc Trigger ML prediction for a specific patient (Doctor, Admin)
+ * @desc Trigger ML prediction for a specific patient (Doctor, Admin).
+ *       `?explain=1` (persistent worker only) adds `topFeatures`, the
+ *       features that drove the model's score; they are not stored.
  */
 const runPrediction = asyncHandler(async (req, res) => {
     const patientId = req.params.id;
@@ -63,36 +105,19 @@ const runPrediction = asyncHandler(async (req, res) => {
     fetal_station: patient.fetal_station || 0,
   };
 
-  // Python-Shell configuration
-  const options = {
-    mode: 'text',
-    pythonOptions: ['-u'],
-    scriptPath: path.join(__dirname, '..', 'ml_service'),
-    args: [JSON.stringify(mlFeatures)]
-  };
-
-  let results;
-  try {
-    results = await PythonShell.run('ml_model.py', options);
-  } catch (error) {
-    console.error('Python Shell Execution Error:', error);
-    res.status(500);
-    throw new Error(`ML Script execution error: ${error.message}`);
-  }
-
-  if (!results || results.length === 0) {
-    res.status(500);
-    throw new Error('ML Prediction failed. Python script returned no output.');
-  }
+  const explain = ['1', 'true'].includes(String(req.query.explain).toLowerCase());
 
   let prediction;
-  try {
-    const predictionJson = results[results.length - 1];
-    prediction = JSON.parse(predictionJson);
-  } catch (error) {
-    console.error('Python Output Error:', error);
-    res.status(500);
-    throw new Error(`ML Prediction failed or returned malformed data: ${error.message}`);
+  if (USE_PERSISTENT_WORKER) {
+    try {
+      prediction = await predictWithWorker(mlFeatures, { explain });
+    } catch (error) {
+      console.error('ML Worker Prediction Error:', error);
+      res.status(500);
+      throw new Error(`ML Prediction failed: ${error.message}`);
+    }
+  } else {
+    prediction = await runPredictionProcess(mlFeatures, res);
   }
 
   let finalPredictionResult = prediction.prediction_result || 'Error: No result';
@@ -104,9 +129,64 @@ const runPrediction = asyncHandler(async (req, res) => {
 
   patient.predictionResult = finalPredictionResult;
   patient.confidenceScore = confidence;
+  patient.predictionModelVersion = prediction.model_version || null;
 
   const updatedPatient = await patient.save();
+  if (explain) {
+    res.json({ ...updatedPatient.toObject(), topFeatures: prediction.top_features || [] });
+    return;
+  }
   res.json(updatedPatient);
 });
 
-export { runPrediction };
+/**
+ * @route GET /api/predict/metrics
+ * @desc ML service stage latencies and route counts (Admin). Collected only
+ *       when the worker runs with ML_METRICS=1; ?format=prometheus for scraping.
+ */
+const getPredictionMetrics = asyncHandler(async (req, res) => {
+  if (!USE_PERSISTENT_WORKER) {
+    res.status(503);
+    throw new Error('ML metrics need the persistent worker (ML_WORKER_MODE=persistent).');
+  }
+
+  const format = req.query.format === 'prometheus' ? 'prometheus' : 'json';
+  let metrics;
+  try {
+    metrics = await getWorkerMetrics(format);
+  } catch (error) {
+    res.status(500);
+    throw new Error(`ML metrics unavailable: ${error.message}`);
+  }
+
+  if (format === 'prometheus') {
+    res.type('text/plain; version=0.0.4').send(metrics);
+  } else {
+    res.json(metrics);
+  }
+});
+
+/**
+ * @route GET /api/predict/drift
+ * @desc How far recent patients and predictions have moved from the training
+ *       data (Admin): per-feature PSI/KS, class mix and rule override shares.
+ *       With ML_POOL_WORKERS one child answers, so the snapshot covers that
+ *       child's traffic only; `pid` says which child it was.
+ */
+const getPredictionDrift = asyncHandler(async (req, res) => {
+  if (!USE_PERSISTENT_WORKER) {
+    res.status(503);
+    throw new Error('ML drift monitoring needs the persistent worker (ML_WORKER_MODE=persistent).');
+  }
+
+  let drift;
+  try {
+    drift = await getWorkerDrift();
+  } catch (error) {
+    res.status(500);
+    throw new Error(`ML drift snapshot unavailable: ${error.message}`);
+  }
+  res.json(drift);
+});
+
+export { runPrediction, getPredictionMetrics, getPredictionDrift };
@@ -0,0 +1,158 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# --- Configuration (environment) ---
+# ML_BATCH_WINDOW_MS  how long the first request of a batch waits for company (default 5, 0 disables)
+# ML_MAX_BATCH        batch is flushed as soon as it holds this many requests (default 64)
+DEFAULT_WINDOW_MS = 5.0
+DEFAULT_MAX_BATCH = 64
+
+# Upper edges of the batch-size histogram reported by stats()
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_STOP = object()
+
+class MicroBatchScheduler:
+    """
+    Coalesces single-record predictions that arrive close together into one
+    predict_batch(records) call. A batch is flushed when `max_batch` requests
+    are waiting or `window_ms` after its first request arrived, whichever
+    comes first, so no request waits longer than the window for the flush.
+    Scoring runs on one background thread; callers get a Future each.
+    """
+
+    def __init__(self, predict_batch, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.predict_batch = predict_batch
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_batch = max(int(max_batch), 1)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'scored_requests': 0, 'batches': 0, 'failed_batches': 0,
+            'max_batch_size': 0, 'max_queue_depth': 0, 'max_wait_ms': 0.0,
+            'full_flushes': 0, 'window_flushes': 0,
+        }
+        self._size_histogram = {edge: 0 for edge in BATCH_SIZE_BUCKETS}
+        self._size_histogram['+Inf'] = 0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ml-batch-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        """Flushes everything already submitted, then ends the scoring thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+        self._thread = None
+
+    # --- Submission ---
+
+    def submit(self, record):
+        """Queues one input dict; the Future resolves to its prediction dict."""
+        future = Future()
+        self._queue.put((record, future, time.monotonic()))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['requests'] += 1
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return future
+
+    def predict(self, record, timeout=None):
+        """Blocking drop-in for predict_delivery_type_merged."""
+        return self.submit(record).result(timeout)
+
+    # --- Scoring thread ---
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Put it back so the loop ends after this batch
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        records = [record for record, _, _ in batch]
+        failed = False
+        try:
+            results = self.predict_batch(records)
+        except Exception:
+            # One bad record must not fail its neighbours: score them one by one
+            failed = True
+            results = None
+
+        for i, (record, future, _) in enumerate(batch):
+            if not future.set_running_or_notify_cancel():
+                continue
+            if results is not None:
+                future.set_result(results[i])
+                continue
+            try:
+                future.set_result(self.predict_batch([record])[0])
+            except Exception as e:
+                future.set_exception(e)
+
+        self._record_batch(batch, started, failed)
+
+    def _record_batch(self, batch, started, failed):
+        size = len(batch)
+        max_wait = max(started - enqueued for _, _, enqueued in batch) * 1000
+        with self._lock:
+            stats = self._stats
+            stats['batches'] += 1
+            stats['scored_requests'] += size
+            stats['failed_batches'] += failed
+            stats['max_batch_size'] = max(stats['max_batch_size'], size)
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], round(max_wait, 3))
+            stats['full_flushes' if size >= self.max_batch else 'window_flushes'] += 1
+            bucket = next((edge for edge in BATCH_SIZE_BUCKETS if size <= edge), '+Inf')
+            self._size_histogram[bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['batch_size_histogram'] = {str(k): v for k, v in self._size_histogram.items()}
+        stats.update({
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'queue_depth': self._queue.qsize(),
+            'mean_batch_size': round(stats['scored_requests'] / stats['batches'], 2) if stats['batches'] else 0.0,
+        })
+        return stats
+
+def scheduler_from_env(predict_batch):
+    """Returns None when ML_BATCH_WINDOW_MS is 0 (requests are scored inline)."""
+    window_ms = float(os.environ.get("ML_BATCH_WINDOW_MS", DEFAULT_WINDOW_MS))
+    if window_ms <= 0:
+        return None
+    max_batch = int(os.environ.get("ML_MAX_BATCH", DEFAULT_MAX_BATCH))
+    return MicroBatchScheduler(predict_batch, window_ms=window_ms, max_batch=max_batch)
@@ -0,0 +1,375 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+
+# --- Configuration ---
+DATASET_FILE = 'maternal_dataset.csv'
+RESULTS_FILE = 'benchmark_results.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_SEED = 20240601
+
+# A metric regresses when it is this much worse than the baseline
+DEFAULT_THRESHOLD = 0.25
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+QUICK_BATCH_SIZES = (1, 10, 100, 1000)
+
+# JSON vs columnar (.npy) batch request -> response, end to end
+IO_FORMAT_SIZES = (1000, 100000)
+QUICK_IO_FORMAT_SIZES = (1000,)
+
+# Sizes below this fraction of a millisecond are too noisy to gate on
+MIN_GATED_MS = 0.05
+
+SCENARIOS = ('rule_exclusion', 'model_A', 'model_B', 'clinical_high_risk', 'dataset_mix')
+
+# ======================================================
+# SYNTHETIC INPUTS (drawn from maternal_dataset.csv)
+# ======================================================
+
+def _yes_no(flag):
+    return "Yes" if float(flag or 0) >= 0.5 else "No"
+
+def load_dataset_rows(script_dir):
+    """Complete dataset rows; each synthetic patient is one real row's measurements."""
+    with open(os.path.join(script_dir, DATASET_FILE), newline="") as f:
+        return [row for row in csv.DictReader(f) if all(value != "" for value in row.values())]
+
+def _row_to_input(row, rnd):
+    """API payload (as sent by predictionController.js) for one dataset row."""
+    return {
+        "age": round(float(row['Maternal_Age'])),
+        "weight": round(float(row['Weight_kg']), 1),
+        "height": round(float(row['Height_cm']), 1),
+        "bmi": round(float(row['BMI']), 1),
+        "bp_systolic": round(float(row['BP_Systolic'])),
+        "bp_diastolic": round(float(row['BP_Diastolic'])),
+        "glucoseLevel": round(float(row['Glucose_Level'])),
+        "gestational_age": round(float(row['Gest_Age_Weeks'])),
+        "amniotic_fluid_index": round(float(row['Amniotic_Fluid_Index_AFI']), 1),
+        "estimated_fetal_weight": round(float(row['Estimated_Fetal_Weight_g'])),
+        "previous_cesarean": _yes_no(row['Prev_Ceaserean']),
+        "previous_vaginal_birth": _yes_no(row['Prev_Vaginal_Birth']),
+        "previous_assisted": _yes_no(row['Prev_Assisted']),
+        "gestational_diabetes": _yes_no(row['Gest_Diabetes']),
+        "hypertension": _yes_no(row['Hypertension_PE']),
+        "fetal_presentation": row['Fetal_Presentation'].capitalize(),
+        "bishop_score": int(float(row['Bishop_Score'])),
+        "induction_of_labor": _yes_no(row['Induction_Labor']),
+        "oxytocin_augmentation": _yes_no(row['Oxytocin_Augmentation']),
+        # Not in the dataset: the controller's defaults plus a plausible labour state
+        "prior_shoulder_dystocia": "No",
+        "placenta_location": "Normal",
+        "fetal_heart_rate_category": rnd.choice(["I", "II"]),
+        "cervical_dilation": rnd.randint(0, 10),
+        "fetal_station": rnd.randint(-3, 3),
+    }
+
+def _has_history(payload):
+    return any(payload[key] == "Yes" for key in
+               ("previous_cesarean", "previous_vaginal_birth", "previous_assisted"))
+
+def generate_inputs(rows, scenario, n, seed=DEFAULT_SEED):
+    """`n` payloads that all take the `scenario` path; same seed, same inputs."""
+    rnd = random.Random(f"{seed}:{scenario}")
+    inputs = []
+    while len(inputs) < n:
+        payload = _row_to_input(rnd.choice(rows), rnd)
+        if scenario == 'dataset_mix':
+            # Presentation as recorded: most breech/transverse rows are rule-excluded
+            pass
+        elif scenario == 'rule_exclusion':
+            rule = rnd.randrange(4)
+            if rule == 0:
+                payload["placenta_location"] = "Previa"
+            elif rule == 1:
+                payload["prior_shoulder_dystocia"] = "Yes"
+            elif rule == 2:
+                payload["fetal_heart_rate_category"] = "III"
+            else:
+                payload["fetal_presentation"] = rnd.choice(["Breech", "Transverse"])
+        else:
+            payload["fetal_presentation"] = "Cephalic"
+            if scenario == 'model_B':
+                for key in ("previous_cesarean", "previous_vaginal_birth", "previous_assisted"):
+                    payload[key] = "No"
+            elif not _has_history(payload):
+                continue
+            if scenario == 'clinical_high_risk':
+                # Scores "High" in calculate_clinical_risk_score
+                payload.update({"previous_cesarean": "Yes", "cervical_dilation": rnd.randint(0, 2),
+                                "fetal_station": rnd.randint(-5, -3)})
+        inputs.append(payload)
+    return inputs
+
+def model_mix_inputs(rows, n, seed=DEFAULT_SEED):
+    """Cephalic patients with their recorded history: every row reaches a model."""
+    rnd = random.Random(f"{seed}:model_mix")
+    inputs = []
+    for _ in range(n):
+        payload = _row_to_input(rnd.choice(rows), rnd)
+        payload["fetal_presentation"] = "Cephalic"
+        inputs.append(payload)
+    return inputs
+
+# ======================================================
+# MEASUREMENTS
+# ======================================================
+
+def _percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+
+    def pick(q):
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    return {
+        'calls': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 4),
+        'p50_ms': round(pick(0.50), 4),
+        'p95_ms': round(pick(0.95), 4),
+        'p99_ms': round(pick(0.99), 4),
+    }
+
+def bench_warm_single(ml_model, rows, n_calls, seed):
+    """Per-call latency of predict_delivery_type_merged with the models already loaded."""
+    report = {}
+    for scenario in SCENARIOS:
+        inputs = generate_inputs(rows, scenario, n_calls, seed)
+        for payload in inputs[:5]:
+            ml_model.predict_delivery_type_merged(payload)
+        samples = []
+        routes = {}
+        for payload in inputs:
+            start = time.perf_counter()
+            result = ml_model.predict_delivery_type_merged(payload)
+            samples.append((time.perf_counter() - start) * 1000)
+            route = result['model_used'].split(" (")[0].split(" + ")[0]
+            routes[route] = routes.get(route, 0) + 1
+        report[scenario] = dict(_percentiles(samples), routes=routes)
+    return report
+
+def bench_batches(ml_model, rows, sizes, seed):
+    """Whole-call time of predict_delivery_type_batch per batch size (median of repeats)."""
+    report = {}
+    for size in sizes:
+        inputs = model_mix_inputs(rows, size, seed)
+        repeats = max(3, min(30, 3000 // size))
+        ml_model.predict_delivery_type_batch(inputs[:min(size, 10)])
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ml_model.predict_delivery_type_batch(inputs)
+            samples.append((time.perf_counter() - start) * 1000)
+        median_ms = statistics.median(samples)
+        report[str(size)] = {
+            'repeats': repeats,
+            'median_ms': round(median_ms, 4),
+            'per_row_us': round(median_ms * 1000 / size, 3),
+            'rows_per_second': round(size / (median_ms / 1000), 1),
+        }
+    return report
+
+def bench_io_formats(ml_model, rows, sizes, seed):
+    """
+    Request bytes -> response bytes for one batch: JSON (parse, score the
+    dicts, serialize) against the columnar format (map the .npy buffer,
+    score the columns, write the result codes). Encoding the request is the
+    client's cost and is not timed.
+    """
+    import columnar
+
+    report = {}
+    for size in sizes:
+        inputs = model_mix_inputs(rows, size, seed)
+        json_request = json.dumps({"op": "predict_batch", "inputs": inputs})
+        columnar_request = columnar.dumps(columnar.encode_records(inputs))
+
+        def via_json():
+            request = json.loads(json_request)
+            return json.dumps({"results": ml_model.predict_delivery_type_batch(request["inputs"])})
+
+        def via_columnar():
+            results, info = ml_model.predict_delivery_type_columnar(columnar.loads(columnar_request))
+            return columnar.dumps(results), json.dumps(info)
+
+        repeats = max(3, min(30, 3000 // size))
+        numbers = {}
+        for name, run, request in (('json', via_json, json_request), ('columnar', via_columnar, columnar_request)):
+            run()
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                response = run()
+                samples.append((time.perf_counter() - start) * 1000)
+            median_ms = statistics.median(samples)
+            numbers[name] = {
+                'median_ms': round(median_ms, 4),
+                'rows_per_second': round(size / (median_ms / 1000), 1),
+                'request_bytes': len(request),
+                'response_bytes': len(response) if name == 'json' else len(response[0]) + len(response[1]),
+            }
+        numbers['speedup'] = round(numbers['json']['median_ms'] / numbers['columnar']['median_ms'], 2)
+        report[str(size)] = dict(numbers, repeats=repeats)
+    return report
+
+def bench_memory(ml_model, rows, size, seed):
+    """Python heap peak for one batch, plus the process high-water mark."""
+    import tracemalloc
+    import resource
+
+    inputs = model_mix_inputs(rows, size, seed)
+    tracemalloc.start()
+    ml_model.predict_delivery_type_batch(inputs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'batch_size': size,
+        'batch_heap_peak_mb': round(peak / 2 ** 20, 2),
+        'process_max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def _environment(engine):
+    import numpy as np
+
+    try:
+        import sklearn
+        sklearn_version = sklearn.__version__
+    except ImportError:
+        sklearn_version = None
+    return {
+        'engine': engine,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def run_benchmarks(script_dir, engine, quick=False, seed=DEFAULT_SEED, cold_start=True):
+    # The engine is fixed at import time, and a warm cache would hide model cost
+    os.environ["ML_ENGINE"] = engine
+    os.environ["ML_CACHE_SIZE"] = "0"
+    sys.path.insert(0, script_dir)
+    import ml_model
+    from model_store import measure_cold_start
+
+    rows = load_dataset_rows(script_dir)
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'seed': seed,
+        'quick': quick,
+        'environment': _environment(engine),
+    }
+    if cold_start:
+        # Fresh interpreter per route: import + artifact load + first answer
+        results['cold_start'] = measure_cold_start(script_dir)
+
+    start = time.perf_counter()
+    if ml_model.load_models_lazy() is None:
+        raise RuntimeError("Prediction models failed to load.")
+    results['warm_load_seconds'] = round(time.perf_counter() - start, 3)
+
+    results['warm_single'] = bench_warm_single(ml_model, rows, 50 if quick else 300, seed)
+    sizes = QUICK_BATCH_SIZES if quick else BATCH_SIZES
+    results['batch'] = bench_batches(ml_model, rows, sizes, seed)
+    results['io_formats'] = bench_io_formats(ml_model, rows, QUICK_IO_FORMAT_SIZES if quick else IO_FORMAT_SIZES, seed)
+    results['memory'] = bench_memory(ml_model, rows, sizes[-1], seed)
+    return results
+
+# ======================================================
+# BASELINE COMPARISON
+# ======================================================
+
+def _gated_metrics(results):
+    """Flat {name: value} of lower-is-better numbers used for the regression gate."""
+    metrics = {}
+    for layout, routes in results.get('cold_start', {}).items():
+        for route, numbers in routes.items():
+            metrics[f"cold_start.{layout}.{route}.seconds"] = numbers['seconds']
+            metrics[f"cold_start.{layout}.{route}.max_rss_mb"] = numbers['max_rss_mb']
+    for scenario, numbers in results.get('warm_single', {}).items():
+        for key in ('p50_ms', 'p95_ms'):
+            if numbers[key] >= MIN_GATED_MS:
+                metrics[f"warm_single.{scenario}.{key}"] = numbers[key]
+    for size, numbers in results.get('batch', {}).items():
+        if numbers['median_ms'] >= MIN_GATED_MS:
+            metrics[f"batch.{size}.median_ms"] = numbers['median_ms']
+    for size, numbers in results.get('io_formats', {}).items():
+        for name in ('json', 'columnar'):
+            metrics[f"io_formats.{size}.{name}.median_ms"] = numbers[name]['median_ms']
+    memory = results.get('memory')
+    if memory:
+        # Keyed by batch size so --quick runs are only compared with --quick runs
+        for key in ('batch_heap_peak_mb', 'process_max_rss_mb'):
+            metrics[f"memory.batch_{memory['batch_size']}.{key}"] = memory[key]
+    return metrics
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns (rows, regressions); a row is (metric, baseline, current, change)."""
+    current = _gated_metrics(results)
+    previous = _gated_metrics(baseline)
+    rows, regressions = [], []
+    for name in sorted(set(current) & set(previous)):
+        before, after = previous[name], current[name]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def print_comparison(rows, regressions, threshold):
+    print(f"\n{'metric':<62} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, before, after, change in rows:
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<62} {before:>11.4g} {after:>11.4g} {change:>+7.1%}{flag}")
+    print(f"\n{len(regressions)} regression(s) above {threshold:.0%} out of {len(rows)} metrics.")
+
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="BirthSense inference benchmarks")
+    parser.add_argument("--engine", choices=("compiled", "sklearn"),
+                        default=os.environ.get("ML_ENGINE", "compiled"))
+    parser.add_argument("--quick", action="store_true", help="fewer calls, batches up to 1k")
+    parser.add_argument("--no-cold-start", action="store_true", help="skip the fresh-process runs")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default=os.path.join(script_dir, RESULTS_FILE))
+    parser.add_argument("--baseline", default=os.path.join(script_dir, BASELINE_FILE))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction (default 0.25)")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(script_dir, args.engine, quick=args.quick, seed=args.seed,
+                             cold_start=not args.no_cold_start)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results saved as '{args.output}'")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved as '{args.baseline}'")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at '{args.baseline}'; run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment', {}).get('engine') != args.engine:
+        print(f"Baseline was recorded with engine '{baseline.get('environment', {}).get('engine')}'.")
+    rows, regressions = compare_to_baseline(results, baseline, args.threshold)
+    print_comparison(rows, regressions, args.threshold)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+from collections import deque
+
+# Bulk rescoring of stored patients after a model update.
+#
+#   mongoexport --collection=patientdatas --out=patients.jsonl
+#   python bulk_rescore.py patients.jsonl --out rescore_diff.jsonl
+#   mongoimport --collection=patientdatas --mode=merge --file=rescore_diff.jsonl
+#
+# The export is streamed in batches; at most `jobs * IN_FLIGHT_PER_JOB`
+# batches are held at once. Each diff line holds only the patient's `_id`
+# and the fields that changed, so it can be merged straight back.
+
+# --- Configuration ---
+BATCH_ROWS = 2000
+IN_FLIGHT_PER_JOB = 2
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+ERRORS_SUFFIX = '.errors.jsonl'
+CHECKPOINT_FORMAT_VERSION = 1
+
+# Large batches are faster through sklearn than the compiled tree engine,
+# whose cost grows linearly with the number of rows.
+DEFAULT_ENGINE = 'sklearn'
+
+# Confidence scores closer than this are treated as unchanged
+CONFIDENCE_TOLERANCE = 1e-9
+
+# ======================================================
+# PATIENT -> ML FEATURES (as predictionController.js builds them)
+# ======================================================
+
+ML_FEATURE_FIELDS = (
+    'age', 'height', 'weight', 'bmi',
+    'previous_cesarean', 'previous_vaginal_birth', 'previous_assisted', 'bishop_score',
+    'gestational_age', 'gestational_diabetes', 'hypertension',
+    'estimated_fetal_weight', 'amniotic_fluid_index',
+    'induction_of_labor', 'oxytocin_augmentation',
+    'bp_systolic', 'bp_diastolic', 'glucoseLevel',
+)
+
+# `patient.field || default` in runPrediction
+ML_FEATURE_DEFAULTS = {
+    'fetal_presentation': 'Cephalic',
+    'prior_shoulder_dystocia': 'No',
+    'placenta_location': 'Normal',
+    'fetal_heart_rate_category': 'I',
+    'cervical_dilation': 0,
+    'fetal_station': 0,
+}
+
+def ml_features(patient):
+    """The `mlFeatures` payload runPrediction sends for this patient document."""
+    features = {name: patient[name] for name in ML_FEATURE_FIELDS if name in patient}
+    for name, default in ML_FEATURE_DEFAULTS.items():
+        features[name] = patient.get(name) or default
+    return features
+
+def stored_result(prediction):
+    """(predictionResult, confidenceScore) as runPrediction saves them."""
+    result = prediction.get('prediction_result') or 'Error: No result'
+    if isinstance(result, str) and result.lower() == 'forceps':
+        result = 'Assisted'
+    return result, prediction.get('confidence_score') or 0.0
+
+def _changes(patient, prediction, include_unchanged):
+    result, confidence = stored_result(prediction)
+    changes = {}
+    if include_unchanged or patient.get('predictionResult') != result:
+        changes['predictionResult'] = result
+    old_confidence = patient.get('confidenceScore')
+    if (include_unchanged or not isinstance(old_confidence, (int, float))
+            or abs(old_confidence - confidence) > CONFIDENCE_TOLERANCE):
+        changes['confidenceScore'] = confidence
+    # The version is only rewritten together with a result it produced
+    if changes and prediction.get('model_version') is not None:
+        changes['predictionModelVersion'] = prediction['model_version']
+    return changes
+
+# ======================================================
+# WORKER: parse and score one batch of export lines
+# ======================================================
+
+def _single_threaded(estimator):
+    """Sets n_jobs=1 on an estimator and its fitted members (one worker per core)."""
+    if hasattr(estimator, 'n_jobs'):
+        estimator.n_jobs = 1
+    for member in getattr(estimator, 'estimators_', None) or []:
+        if not isinstance(member, (list, tuple)):
+            _single_threaded(member)
+    return estimator
+
+def load_models(engine):
+    """Loads the served models in this process; forked workers share them."""
+    os.environ['ML_ENGINE'] = engine
+    os.environ.setdefault('ML_CACHE_SIZE', '0')  # every patient is scored once
+    import ml_model
+
+    components = ml_model.load_models_lazy()
+    if components is None:
+        raise SystemExit("❌ The prediction models failed to load.")
+    if not components['compiled']:
+        _single_threaded(components['model_A'])
+        _single_threaded(components['ft_model'])
+    return components['model_version']
+
+def _limit_worker_threads():
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=1)
+
+def _predict_isolating_failures(ml_model, features):
+    """
+    predict_delivery_type_batch, except that a failing batch is split in
+    half until the bad records are isolated; those come back as exceptions.
+    """
+    if not features:
+        return []
+    try:
+        return ml_model.predict_delivery_type_batch(features)
+    except Exception as e:
+        if len(features) == 1:
+            return [e]
+    middle = len(features) // 2
+    return (_predict_isolating_failures(ml_model, features[:middle]) +
+            _predict_isolating_failures(ml_model, features[middle:]))
+
+def score_batch(task):
+    """
+    Scores one batch of raw export lines. Returns the diff lines, the error
+    lines and the counts; one bad patient never fails the rest of the batch.
+    """
+    import ml_model
+
+    lines, include_unchanged = task['lines'], task['include_unchanged']
+    patients, diff, errors = [], [], []
+    for number, line in lines:
+        try:
+            patient = json.loads(line)
+            if not isinstance(patient, dict):
+                raise ValueError("not a JSON object")
+            patients.append(patient)
+        except ValueError as e:
+            errors.append(json.dumps({'line': number, 'error': f"Invalid record: {e}"}))
+
+    predictions = _predict_isolating_failures(ml_model, [ml_features(patient) for patient in patients])
+
+    changed = failed = 0
+    for patient, prediction in zip(patients, predictions):
+        if isinstance(prediction, Exception):
+            errors.append(json.dumps({'_id': patient.get('_id'), 'error': repr(prediction)}))
+            failed += 1
+            continue
+        changes = _changes(patient, prediction, False)
+        changed += bool(changes)
+        if include_unchanged:
+            changes = _changes(patient, prediction, True)
+        if changes:
+            diff.append(json.dumps({'_id': patient.get('_id'), **changes}))
+    return {
+        'diff': diff,
+        'errors': errors,
+        'counts': {'rows': len(lines), 'scored': len(patients) - failed, 'changed': changed, 'errors': len(errors)},
+    }
+
+# ======================================================
+# CHECKPOINT (resume where an interrupted run stopped)
+# ======================================================
+
+def _input_signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _open_output(path, size):
+    """Opens an output for appending, cut back to what the checkpoint recorded."""
+    f = open(path, "ab")
+    f.truncate(size)
+    f.seek(size)
+    return f
+
+def _read_batches(f, next_line, batch_rows):
+    """Yields ([(line number, text)], next line number, offset after the batch) from the current position."""
+    lines = []
+    for number, raw in enumerate(iter(f.readline, b""), start=next_line):
+        if raw.strip():
+            lines.append((number, raw.decode('utf-8')))
+        if len(lines) == batch_rows:
+            yield lines, number + 1, f.tell()
+            lines = []
+    if lines:
+        yield lines, lines[-1][0] + 1, f.tell()
+
+# ======================================================
+# MAIN LOOP
+# ======================================================
+
+def run_rescore(input_file, out_file, engine=DEFAULT_ENGINE, batch_rows=BATCH_ROWS, n_jobs=None,
+                include_unchanged=False, fresh=False):
+    """
+    Streams `input_file` (one patient document per line) through the
+    current models and appends one merge line per changed patient to
+    `out_file`. Progress is checkpointed after every batch, in input
+    order, so rerunning the same command continues an interrupted run.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    checkpoint_path = out_file + CHECKPOINT_SUFFIX
+    errors_file = out_file + ERRORS_SUFFIX
+    model_version = load_models(engine)
+    config = {
+        'format_version': CHECKPOINT_FORMAT_VERSION,
+        'input': _input_signature(input_file),
+        'model_version': model_version,
+        'engine': engine,
+        'include_unchanged': include_unchanged,
+    }
+
+    checkpoint = None if fresh else _load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint['config'] != config:
+        raise SystemExit(f"❌ {checkpoint_path} was written for a different input or model; "
+                         f"rerun with --fresh to start over.")
+    if checkpoint is None:
+        checkpoint = {
+            'config': config,
+            'done': False,
+            'input_offset': 0, 'next_line': 1, 'diff_bytes': 0, 'errors_bytes': 0,
+            'counts': {'rows': 0, 'scored': 0, 'changed': 0, 'errors': 0},
+        }
+    elif checkpoint['done']:
+        print(f"✅ {input_file} was already rescored into {out_file}")
+        return checkpoint
+    else:
+        print(f"↩️  Resuming after {checkpoint['counts']['rows']} patients")
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    started = time.perf_counter()
+    counts = checkpoint['counts']
+    pending = deque()
+
+    # Forked workers share the models loaded above
+    gc.collect()
+    gc.freeze()
+    with open(input_file, "rb") as source, \
+            _open_output(out_file, checkpoint['diff_bytes']) as diff_out, \
+            _open_output(errors_file, checkpoint['errors_bytes']) as errors_out, \
+            ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('fork'),
+                                initializer=_limit_worker_threads) as executor:
+        source.seek(checkpoint['input_offset'])
+        batches = _read_batches(source, checkpoint['next_line'], batch_rows)
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            lines, next_line, offset = batch
+            task = {'lines': lines, 'include_unchanged': include_unchanged}
+            pending.append((executor.submit(score_batch, task), next_line, offset))
+            return True
+
+        while len(pending) < n_jobs * IN_FLIGHT_PER_JOB and submit_next():
+            pass
+        while pending:
+            # Oldest first: the outputs stay in input order and the checkpoint never skips a batch
+            future, next_line, offset = pending.popleft()
+            result = future.result()
+            for name, lines in (('diff', diff_out), ('errors', errors_out)):
+                if result[name]:
+                    lines.write(("\n".join(result[name]) + "\n").encode('utf-8'))
+                lines.flush()
+                os.fsync(lines.fileno())
+            for name, value in result['counts'].items():
+                counts[name] += value
+            checkpoint.update(input_offset=offset, next_line=next_line,
+                              diff_bytes=diff_out.tell(), errors_bytes=errors_out.tell())
+            _save_checkpoint(checkpoint_path, checkpoint)
+            print(f"   {counts['rows']} patients, {counts['changed']} changed, {counts['errors']} errors "
+                  f"({counts['rows'] / (time.perf_counter() - started):.0f}/s this run)")
+            submit_next()
+
+    checkpoint['done'] = True
+    _save_checkpoint(checkpoint_path, checkpoint)
+    print(f"✅ Rescored {counts['rows']} patients: {counts['changed']} changed -> {out_file}")
+    if counts['errors']:
+        print(f"⚠️  {counts['errors']} records could not be scored -> {errors_file}")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore every stored patient with the current models")
+    parser.add_argument("input", help="JSONL export of patient documents (mongoexport)")
+    parser.add_argument("--out", default="rescore_diff.jsonl", help="JSONL of {_id, changed fields} merge lines")
+    parser.add_argument("--engine", choices=("sklearn", "compiled"), default=DEFAULT_ENGINE)
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--all", action="store_true", help="write every patient, not only the changed ones")
+    parser.add_argument("--fresh", action="store_true", help="discard the checkpoint and start over")
+    args = parser.parse_args()
+
+    run_rescore(args.input, args.out, args.engine, args.batch_rows, args.jobs, args.all, args.fresh)
+    sys.exit(0)
@@ -0,0 +1,427 @@
+import bisect
+import operator
+import threading
+
+# Standard library only at module level: single records are evaluated
+# without NumPy, which is imported the first time a large batch arrives.
+
+# --- Configuration ---
+# Batches at least this large are evaluated with NumPy masks
+VECTORIZE_MIN_ROWS = 32
+
+# ======================================================
+# RULE TABLES
+# ======================================================
+# A text field is read as str(input.get(field, default)) in the given case;
+# a numeric field is compared as given (input.get(field, default)).
+
+# Checked in order; the first match answers without the model.
+# '{value}' in the reason is the matched value, capitalized.
+EXCLUSION_RULES = (
+    {'name': 'placenta_previa', 'field': 'placenta_location', 'default': '', 'case': 'lower',
+     'values': ('previa',), 'reason': 'Placenta Previa'},
+    {'name': 'prior_shoulder_dystocia', 'field': 'prior_shoulder_dystocia', 'default': '', 'case': 'lower',
+     'values': ('yes',), 'reason': 'Prior Shoulder Dystocia'},
+    {'name': 'fetal_distress', 'field': 'fetal_heart_rate_category', 'default': '', 'case': 'upper',
+     'values': ('III',), 'reason': 'Fetal Distress - Cat III'},
+    {'name': 'malpresentation', 'field': 'fetal_presentation', 'default': '', 'case': 'lower',
+     'values': ('transverse', 'breech'), 'reason': '{value} Lie'},
+)
+EXCLUSION_RESULT = {"prediction_result": "C-Section", "confidence_score": 100.0}
+
+# Every matching rule adds its points
+RISK_RULES = (
+    # Bishop score & labour progress
+    {'name': 'unfavourable_cervix', 'field': 'bishop_score', 'default': 0, 'op': '<', 'value': 6, 'points': 1},
+    {'name': 'slow_dilation', 'field': 'cervical_dilation', 'default': 0, 'op': '<', 'value': 3, 'points': 1},
+    {'name': 'high_station', 'field': 'fetal_station', 'default': 0, 'op': '<', 'value': -2, 'points': 1},
+    # Previous history
+    {'name': 'previous_cesarean', 'field': 'previous_cesarean', 'default': None, 'case': 'lower',
+     'op': 'in', 'value': ('yes',), 'points': 2},
+    # Breech is handled by the pre-filter, but if it slips through it is high risk
+    {'name': 'breech', 'field': 'fetal_presentation', 'default': '', 'case': 'lower',
+     'op': 'in', 'value': ('breech',), 'points': 3},
+    # Comorbidities
+    {'name': 'gestational_diabetes', 'field': 'gestational_diabetes', 'default': None, 'case': 'lower',
+     'op': 'in', 'value': ('yes',), 'points': 1},
+    {'name': 'hypertension', 'field': 'hypertension', 'default': None, 'case': 'lower',
+     'op': 'in', 'value': ('yes',), 'points': 1},
+    # Maternal factors
+    {'name': 'advanced_age', 'field': 'age', 'default': 0, 'op': '>', 'value': 35, 'points': 1},
+    {'name': 'obesity', 'field': 'bmi', 'default': 0, 'op': '>', 'value': 30, 'points': 1},
+)
+
+# First level whose minimum the points reach
+RISK_LEVELS = (('High', 4), ('Medium', 2), ('Low', None))
+
+# (model label, risk level) -> confidence change, bound, model_used suffix, route metric
+CONFIDENCE_ADJUSTMENTS = {
+    ("C-Section", "High"): (+15.0, 99.9, " + Clinical Boost (High Risk)", 'clinical_boost'),
+    ("C-Section", "Low"): (-10.0, 50.1, " + Clinical Caution (Low Risk)", 'clinical_caution'),
+    ("Vaginal", "High"): (-15.0, 50.1, " + Clinical Warning (High Risk)", 'clinical_warning'),
+}
+
+_OPS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+# ======================================================
+# COMPILATION
+# ======================================================
+# Rules are grouped per input field. A text field becomes one dict lookup
+# (value -> outcome); a numeric field becomes one bisect over its sorted
+# thresholds into precomputed regions. Per record the cost is one step per
+# field, however many rules read that field.
+
+def _normalizer(case):
+    return str.upper if case == 'upper' else str.lower
+
+class _TextField:
+    def __init__(self, field, default, case):
+        self.field, self.default, self.case = field, default, case
+        self.normalize = _normalizer(case)
+        self.outcomes = {}
+
+    def read(self, record):
+        return self.normalize(str(record.get(self.field, self.default)))
+
+class _NumericField:
+    """
+    Thresholds t0 < t1 < ... split the line into regions: 2i is the open
+    interval below t_i, 2i+1 is exactly t_i and 2n is above the last one.
+    Region n_regions is NaN (every comparison is False).
+    """
+
+    def __init__(self, field, default, rules):
+        self.field, self.default, self.rules = field, default, rules
+        self.thresholds = sorted({rule['value'] for rule in rules.values()})
+        ts = self.thresholds
+        samples = []
+        for i, t in enumerate(ts):
+            samples.append(t - 1 if i == 0 else (ts[i - 1] + t) / 2)
+            samples.append(t)
+        samples.append(ts[-1] + 1)
+        samples.append(float('nan'))
+        self.region_rules = [
+            tuple(index for index, rule in rules.items() if _OPS[rule['op']](x, rule['value']))
+            for x in samples
+        ]
+
+    def region(self, value):
+        if value != value:
+            return len(self.region_rules) - 1
+        i = bisect.bisect_left(self.thresholds, value)
+        if i < len(self.thresholds) and self.thresholds[i] == value:
+            return 2 * i + 1
+        return 2 * i
+
+    def match(self, value):
+        """(points, matched rule indexes) for one value."""
+        if isinstance(value, (int, float)):
+            region = self.region(value)
+            return self.region_points[region], self.region_rules[region]
+        # Anything else is compared rule by rule, so it fails (or not) exactly as a comparison would
+        matched = tuple(index for index, rule in self.rules.items() if _OPS[rule['op']](value, rule['value']))
+        return sum(self.points[index] for index in matched), matched
+
+def _text_key(rule):
+    return (rule['field'], rule['default'], rule.get('case', 'lower'))
+
+class RuleEngine:
+    """
+    Compiled EXCLUSION_RULES + RISK_RULES. Single records use the standard
+    library; batches of VECTORIZE_MIN_ROWS or more use NumPy masks. Both
+    give the same answers. Rule hit counters are kept for monitoring.
+    """
+
+    def __init__(self, exclusion_rules=EXCLUSION_RULES, risk_rules=RISK_RULES,
+                 risk_levels=RISK_LEVELS, adjustments=CONFIDENCE_ADJUSTMENTS):
+        self.exclusion_rules = exclusion_rules
+        self.risk_rules = risk_rules
+        self.risk_levels = risk_levels
+        self.adjustments = adjustments
+        self._compile()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def _compile(self):
+        # --- Exclusions: per field, value -> (rule index, result template) ---
+        # Every distinct result template is also numbered, so batches can carry an outcome id per row
+        fields = {}
+        self.exclusion_results = []
+        for index, rule in enumerate(self.exclusion_rules):
+            key = _text_key(rule)
+            field = fields.setdefault(key, _TextField(*key))
+            for value in rule['values']:
+                if value in field.outcomes:
+                    continue  # an earlier rule already claims this value
+                reason = rule['reason'].replace('{value}', value.capitalize())
+                field.outcomes[value] = (index, dict(
+                    EXCLUSION_RESULT, model_used=f"Clinical_Rule_Exclusion ({reason})"
+                ), len(self.exclusion_results))
+                self.exclusion_results.append(field.outcomes[value][1])
+        self._exclusion_fields = list(fields.values())
+
+        # --- Risk: text fields map value -> rule indexes, numeric fields bisect ---
+        text, numeric = {}, {}
+        for index, rule in enumerate(self.risk_rules):
+            if rule['op'] == 'in':
+                key = _text_key(rule)
+                field = text.setdefault(key, _TextField(*key))
+                for value in rule['value']:
+                    field.outcomes[value] = field.outcomes.get(value, ()) + (index,)
+            else:
+                numeric.setdefault((rule['field'], rule['default']), {})[index] = rule
+        self._risk_text = list(text.values())
+        self._risk_numeric = [_NumericField(field, default, rules) for (field, default), rules in numeric.items()]
+        self._points = [rule['points'] for rule in self.risk_rules]
+        for field in self._risk_text:
+            field.points = {value: sum(self._points[i] for i in rules) for value, rules in field.outcomes.items()}
+        for field in self._risk_numeric:
+            field.points = self._points
+            field.region_points = [sum(self._points[i] for i in rules) for rules in field.region_rules]
+
+    # --- Hit counters ---
+
+    def reset_stats(self):
+        with self._lock:
+            self._exclusion_hits = [0] * len(self.exclusion_rules)
+            self._risk_hits = [0] * len(self.risk_rules)
+            self._level_counts = {level: 0 for level, _ in self.risk_levels}
+            self._screened = 0
+            self._scored = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'screened': self._screened,
+                'exclusions': {rule['name']: hits for rule, hits in zip(self.exclusion_rules, self._exclusion_hits)},
+                'risk_scored': self._scored,
+                'risk_rules': {rule['name']: hits for rule, hits in zip(self.risk_rules, self._risk_hits)},
+                'risk_levels': dict(self._level_counts),
+            }
+
+    def prometheus(self):
+        """Rule hit counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = [
+            "# HELP birthsense_ml_rule_hits_total Records matched per clinical rule.",
+            "# TYPE birthsense_ml_rule_hits_total counter",
+        ]
+        for kind in ('exclusions', 'risk_rules'):
+            for name, hits in stats[kind].items():
+                lines.append(f'birthsense_ml_rule_hits_total{{rule="{name}"}} {hits}')
+        lines += [
+            "# HELP birthsense_ml_risk_level_total Model-scored records per clinical risk level.",
+            "# TYPE birthsense_ml_risk_level_total counter",
+        ]
+        for level, count in stats['risk_levels'].items():
+            lines.append(f'birthsense_ml_risk_level_total{{level="{level}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    # --- Single record (standard library) ---
+
+    def _exclusion_index(self, record):
+        best = None
+        for field in self._exclusion_fields:
+            outcome = field.outcomes.get(field.read(record))
+            if outcome is not None and (best is None or outcome[0] < best[0]):
+                best = outcome
+        return best
+
+    def pre_filter(self, record):
+        """The exclusion result for the first matching rule, or None."""
+        best = self._exclusion_index(record)
+        with self._lock:
+            self._screened += 1
+            if best is not None:
+                self._exclusion_hits[best[0]] += 1
+        return dict(best[1]) if best is not None else None
+
+    def _level(self, points):
+        for level, minimum in self.risk_levels:
+            if minimum is None or points >= minimum:
+                return level
+        return self.risk_levels[-1][0]
+
+    def risk_level(self, record):
+        """'High', 'Medium' or 'Low' from the summed points of every matching risk rule."""
+        points, matched = 0, []
+        for field in self._risk_numeric:
+            field_points, rules = field.match(record.get(field.field, field.default))
+            points += field_points
+            matched.append(rules)
+        for field in self._risk_text:
+            value = field.read(record)
+            points += field.points.get(value, 0)
+            matched.append(field.outcomes.get(value, ()))
+        level = self._level(points)
+        with self._lock:
+            self._scored += 1
+            self._level_counts[level] += 1
+            for rules in matched:
+                for index in rules:
+                    self._risk_hits[index] += 1
+        return level
+
+    # --- Batches (NumPy masks) ---
+    # The cores below only ask `masks(field)` for a function value -> boolean
+    # row mask, so the same code serves lists of records (values read and
+    # normalized per record) and columnar batches (precoded categories).
+
+    def _exclusion_outcomes(self, masks, n_rows):
+        """Per row, the index into exclusion_results of the first matching rule's result, or -1."""
+        import numpy as np
+
+        n_rules = len(self.exclusion_rules)
+        first = np.full(n_rows, n_rules)
+        outcomes = np.full(n_rows, -1)
+        for field in self._exclusion_fields:
+            mask_of = masks(field)
+            for value, (index, _, outcome) in field.outcomes.items():
+                mask = mask_of(value) & (first > index)
+                first[mask] = index
+                outcomes[mask] = outcome
+
+        hits = np.bincount(first, minlength=n_rules + 1)
+        with self._lock:
+            self._screened += n_rows
+            for index in range(n_rules):
+                self._exclusion_hits[index] += int(hits[index])
+        return outcomes
+
+    def _risk_level_array(self, numeric, masks, n_rows):
+        """Risk level per row; `numeric` holds one float64 array per numeric field."""
+        import numpy as np
+
+        points = np.zeros(n_rows, dtype=np.int64)
+        hits = np.zeros(len(self.risk_rules), dtype=np.int64)
+        for field, values in zip(self._risk_numeric, numeric):
+            thresholds = np.asarray(field.thresholds, dtype=np.float64)
+            i = np.searchsorted(thresholds, values, side='left')
+            exact = thresholds[np.minimum(i, len(thresholds) - 1)] == values
+            region = np.where(np.isnan(values), len(field.region_rules) - 1, 2 * i + (exact & (i < len(thresholds))))
+            points += np.asarray(field.region_points)[region]
+            counts = np.bincount(region, minlength=len(field.region_rules))
+            for rules, count in zip(field.region_rules, counts):
+                for index in rules:
+                    hits[index] += count
+        for field in self._risk_text:
+            mask_of = masks(field)
+            for value, rules in field.outcomes.items():
+                mask = mask_of(value)
+                points += mask * field.points[value]
+                for index in rules:
+                    hits[index] += int(mask.sum())
+
+        conditions, choices = [], []
+        for level, minimum in self.risk_levels:
+            conditions.append(np.ones(n_rows, dtype=bool) if minimum is None else points >= minimum)
+            choices.append(level)
+        levels = np.select(conditions, choices, default=self.risk_levels[-1][0])
+
+        level_counts = dict(zip(*np.unique(levels, return_counts=True)))
+        with self._lock:
+            self._scored += n_rows
+            for index, count in enumerate(hits):
+                self._risk_hits[index] += int(count)
+            for level, count in level_counts.items():
+                self._level_counts[str(level)] += int(count)
+        return levels
+
+    def pre_filter_batch(self, records):
+        """pre_filter() for every record, as one NumPy pass per field."""
+        if len(records) < VECTORIZE_MIN_ROWS:
+            return [self.pre_filter(record) for record in records]
+        outcomes = self._exclusion_outcomes(_record_masks(records), len(records))
+        return [None if outcome < 0 else dict(self.exclusion_results[outcome]) for outcome in outcomes]
+
+    def risk_levels_batch(self, records):
+        """risk_level() for every record, as one NumPy pass per field."""
+        if len(records) < VECTORIZE_MIN_ROWS:
+            return [self.risk_level(record) for record in records]
+        import numpy as np
+
+        numeric = []
+        for field in self._risk_numeric:
+            raw = [record.get(field.field, field.default) for record in records]
+            try:
+                if not all(isinstance(value, (int, float)) for value in raw):
+                    raise TypeError(field.field)
+                numeric.append(np.asarray(raw, dtype=np.float64))
+            except (TypeError, OverflowError):
+                # Let the single-record path raise exactly what a comparison would
+                return [self.risk_level(record) for record in records]
+        return self._risk_level_array(numeric, _record_masks(records), len(records)).tolist()
+
+    # --- Columnar batches ---
+    # `columns` maps a field to a float64 array (numeric fields) or to
+    # (codes, labels) (text fields: row i holds labels[codes[i]]). Fields it
+    # does not have read as their default on every row.
+
+    def pre_filter_columns(self, columns, n_rows):
+        """Per row, the index into exclusion_results of the pre-filter answer, or -1 for the models."""
+        return self._exclusion_outcomes(_column_masks(columns, n_rows), n_rows)
+
+    def risk_levels_columns(self, columns, n_rows):
+        """risk_level() per row of a columnar batch, as an array of level names."""
+        import numpy as np
+
+        numeric = [
+            np.broadcast_to(np.asarray(columns.get(field.field, field.default), dtype=np.float64), (n_rows,))
+            for field in self._risk_numeric
+        ]
+        return self._risk_level_array(numeric, _column_masks(columns, n_rows), n_rows)
+
+    # --- Post-processing ---
+
+    def adjust(self, predicted_label, confidence_pct, model_name, level):
+        """Applies CONFIDENCE_ADJUSTMENTS; returns (confidence, model_name, route metric or None)."""
+        adjustment = self.adjustments.get((predicted_label, level))
+        if adjustment is None:
+            return confidence_pct, model_name, None
+        change, bound, suffix, route = adjustment
+        if change > 0:
+            confidence_pct = min(confidence_pct + change, bound)
+        else:
+            confidence_pct = max(confidence_pct + change, bound)
+        return confidence_pct, model_name + suffix, route
+
+    def adjust_columns(self, labels, confidence_pct, levels):
+        """
+        adjust() for arrays of labels, confidences and risk levels. Returns
+        the adjusted confidences and, per row, the index into
+        list(self.adjustments) of the adjustment applied (-1 for none).
+        """
+        import numpy as np
+
+        confidence_pct = np.array(confidence_pct, dtype=np.float64)
+        applied = np.full(len(confidence_pct), -1)
+        for index, ((label, level), (change, bound, _, _)) in enumerate(self.adjustments.items()):
+            mask = (labels == label) & (levels == level)
+            if change > 0:
+                confidence_pct[mask] = np.minimum(confidence_pct[mask] + change, bound)
+            else:
+                confidence_pct[mask] = np.maximum(confidence_pct[mask] + change, bound)
+            applied[mask] = index
+        return confidence_pct, applied
+
+def _record_masks(records):
+    import numpy as np
+
+    def masks(field):
+        values = np.array([field.read(record) for record in records], dtype=object)
+        return lambda value: values == value
+    return masks
+
+def _column_masks(columns, n_rows):
+    import numpy as np
+
+    def masks(field):
+        if field.field not in columns:
+            default = field.normalize(str(field.default))
+            return lambda value: np.full(n_rows, value == default)
+        codes, labels = columns[field.field]
+        normalized = [field.normalize(str(label)) for label in labels]
+        return lambda value: np.isin(codes, [code for code, label in enumerate(normalized) if label == value])
+    return masks
+
+rules = RuleEngine()
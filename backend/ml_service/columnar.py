@@ -0,0 +1,193 @@
+import os
+import numpy as np
+
+# Columnar batch format for bulk scoring.
+#
+# A batch is one .npy buffer (NumPy's own header + raw little-endian
+# records, no pickles) holding a structured array with one record per
+# patient. Yes/no fields arrive as 0/1 and categorical fields as codes into
+# CATEGORIES, so nothing is parsed or string-compared per row: the reader
+# maps the file (or wraps the bytes) without copying and every field is a
+# strided view that goes straight into the feature matrix.
+#
+#   python ml_model.py --columnar patients.npy results.npy
+#   {"op": "predict_columnar", "input_path": "...", "output_path": "..."}
+#
+# Results are written the same way (RESULT_DTYPE); the "prediction" and
+# "model_used" codes index the "labels" and "models" lists of the JSON reply.
+
+# --- Wire format ---
+# Missing numbers are 0 (as `input.get(field, 0)` in map_input_features)
+NUMERIC_FIELDS = (
+    'age', 'weight', 'height', 'bmi', 'bishop_score',
+    'gestational_age', 'amniotic_fluid_index', 'estimated_fetal_weight',
+    'glucoseLevel', 'bp_systolic', 'bp_diastolic',
+    'cervical_dilation', 'fetal_station',
+)
+
+# 1 for "Yes" (any case), 0 for anything else
+FLAG_FIELDS = (
+    'previous_cesarean', 'previous_vaginal_birth', 'previous_assisted',
+    'gestational_diabetes', 'hypertension', 'induction_of_labor', 'oxytocin_augmentation',
+    'prior_shoulder_dystocia',
+)
+FLAG_LABELS = ('no', 'yes')
+
+# field -> (normalization, labels); code 0 is "missing or anything else".
+# Labels are in the case clinical_rules.py compares them in.
+CATEGORIES = {
+    'fetal_presentation': (str.lower, ('', 'cephalic', 'breech', 'transverse')),
+    'placenta_location': (str.lower, ('', 'normal', 'previa')),
+    'fetal_heart_rate_category': (str.upper, ('', 'I', 'II', 'III')),
+}
+
+INPUT_DTYPE = np.dtype(
+    [(name, '<f8') for name in NUMERIC_FIELDS] +
+    [(name, 'i1') for name in FLAG_FIELDS] +
+    [(name, 'u1') for name in CATEGORIES]
+)
+
+RESULT_DTYPE = np.dtype([('prediction', 'u1'), ('confidence_score', '<f8'), ('model_used', 'u1')])
+
+# Training column -> API field (as map_input_features reads them)
+FEATURE_FIELDS = {
+    'maternal_age': 'age',
+    'weight_kg': 'weight',
+    'height_cm': 'height',
+    'bmi': 'bmi',
+    'prev_ceaserean': 'previous_cesarean',
+    'prev_vaginal_birth': 'previous_vaginal_birth',
+    'prev_assisted': 'previous_assisted',
+    'bishop_score': 'bishop_score',
+    'gest_age_weeks': 'gestational_age',
+    'amniotic_fluid_index_afi': 'amniotic_fluid_index',
+    'estimated_fetal_weight_g': 'estimated_fetal_weight',
+    'gestational_diabetes': 'gestational_diabetes',
+    'hypertension_preeclampsia': 'hypertension',
+    'induction_of_labor': 'induction_of_labor',
+    'oxytocin_augmentation': 'oxytocin_augmentation',
+    'glucose_level': 'glucoseLevel',
+    'bp_systolic': 'bp_systolic',
+    'bp_diastolic': 'bp_diastolic',
+}
+# One-hot training column -> (API field, label)
+ONE_HOT_FIELDS = {
+    'fetal_presentation_cephalic': ('fetal_presentation', 'cephalic'),
+    'fetal_presentation_breech': ('fetal_presentation', 'breech'),
+    'fetal_presentation_transverse': ('fetal_presentation', 'transverse'),
+}
+
+# ======================================================
+# ENCODING (JSON payloads -> columnar batch)
+# ======================================================
+
+def encode_records(records):
+    """The columnar batch for a list of API payloads (as predictionController.js sends them)."""
+    table = np.zeros(len(records), dtype=INPUT_DTYPE)
+    for name in NUMERIC_FIELDS:
+        table[name] = [record.get(name, 0) for record in records]
+    for name in FLAG_FIELDS:
+        table[name] = [str(record.get(name)).lower() == 'yes' for record in records]
+    for name, (normalize, labels) in CATEGORIES.items():
+        codes = {label: code for code, label in enumerate(labels)}
+        table[name] = [codes.get(normalize(str(record.get(name, ''))), 0) for record in records]
+    return table
+
+def decode_results(results, labels, models, model_version=None):
+    """Result records back as the dicts predict_delivery_type_batch returns."""
+    return [
+        {
+            "prediction_result": labels[prediction],
+            "confidence_score": float(confidence),
+            "model_used": models[model_used],
+            "model_version": model_version,
+        }
+        for prediction, confidence, model_used in results.tolist()
+    ]
+
+# ======================================================
+# READING AND WRITING
+# ======================================================
+
+def validate(table):
+    """Checks that `table` is a 1-D structured array with every input field and valid codes."""
+    if not isinstance(table, np.ndarray) or table.dtype.names is None or table.ndim != 1:
+        raise ValueError("A columnar batch must be a 1-D structured array")
+    missing = [name for name in INPUT_DTYPE.names if name not in table.dtype.names]
+    if missing:
+        raise ValueError(f"Columnar batch is missing fields: {', '.join(missing)}")
+    if not len(table):
+        return table
+    for name in FLAG_FIELDS:
+        if not np.isin(table[name], (0, 1)).all():
+            raise ValueError(f"{name} must be 0 or 1")
+    for name, (_, labels) in CATEGORIES.items():
+        if int(table[name].max()) >= len(labels):
+            raise ValueError(f"Unknown {name} code {int(table[name].max())}")
+    return table
+
+def loads(buffer):
+    """The array in an in-memory .npy buffer, as a read-only view of it (no copy)."""
+    stream = memoryview(buffer)
+    header = _BufferReader(stream)
+    if np.lib.format.read_magic(header) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    if fortran_order or len(shape) != 1:
+        raise ValueError("A columnar batch must be a 1-D structured array")
+    return np.frombuffer(stream, dtype=dtype, count=shape[0], offset=header.offset)
+
+def load(path):
+    """The array in a .npy file, memory-mapped read-only."""
+    return np.load(path, mmap_mode='r', allow_pickle=False)
+
+def dumps(table):
+    import io
+
+    buffer = io.BytesIO()
+    np.save(buffer, table, allow_pickle=False)
+    return buffer.getvalue()
+
+def save(path, table):
+    """Writes a .npy file atomically (readers never see a partial batch)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, table, allow_pickle=False)
+    os.replace(tmp, path)
+
+class _BufferReader:
+    """Minimal file-like reader over a memoryview, for the .npy header parser."""
+
+    def __init__(self, view):
+        self.view = view
+        self.offset = 0
+
+    def read(self, size):
+        data = self.view[self.offset:self.offset + size].tobytes()
+        self.offset += len(data)
+        return data
+
+# ======================================================
+# BATCH -> MODEL / RULE INPUTS
+# ======================================================
+
+def feature_columns(table, rows=None):
+    """Training column -> array, what map_input_features gives per record, for every row (or `rows`)."""
+    def column(name):
+        values = table[name]
+        return values if rows is None else values[rows]
+
+    columns = {training: column(field) for training, field in FEATURE_FIELDS.items()}
+    for training, (field, label) in ONE_HOT_FIELDS.items():
+        columns[training] = column(field) == CATEGORIES[field][1].index(label)
+    return columns
+
+def rule_columns(table):
+    """The `columns` argument of clinical_rules' columnar methods."""
+    columns = {name: table[name] for name in NUMERIC_FIELDS}
+    for name in FLAG_FIELDS:
+        columns[name] = (table[name], FLAG_LABELS)
+    for name, (_, labels) in CATEGORIES.items():
+        columns[name] = (table[name], labels)
+    return columns
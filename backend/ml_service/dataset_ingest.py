@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+DATASET_FILE = 'maternal_dataset.csv'
+CACHE_DIRNAME = 'dataset_cache'
+META_FILENAME = 'meta.json'
+CACHE_FORMAT_VERSION = 1
+CHUNK_ROWS = 100_000
+
+LABEL_MAP = {'normal': 0, 'caesarean': 1, 'forceps': 2}
+LABEL_ALIASES = {
+    'svd': 'normal',
+    'normal_vaginal': 'normal',
+    'c_section': 'caesarean',
+    'assisted': 'assisted',
+}
+
+FLAG = 'int8'
+VITAL = 'float32'
+# Categories stay sorted: get_dummies(drop_first=True) drops the first one (breech)
+FETAL_PRESENTATIONS = ('breech', 'cephalic', 'transverse')
+
+# Normalized column name -> stored dtype ('category' columns are int8 codes)
+SCHEMA = {
+    'maternal_age': VITAL,
+    'gravida': VITAL,
+    'parity': VITAL,
+    'bp_systolic': VITAL,
+    'bp_diastolic': VITAL,
+    'gest_age_weeks': VITAL,
+    'estimated_fetal_weight_g': VITAL,
+    'height_cm': VITAL,
+    'weight_kg': VITAL,
+    'bmi': VITAL,
+    'prev_vaginal_birth': FLAG,
+    'gest_diabetes': FLAG,
+    'hypertension_pe': FLAG,
+    'fetal_presentation': 'category',
+    'amniotic_fluid_index_afi': VITAL,
+    'induction_labor': FLAG,
+    'oxytocin_augmentation': FLAG,
+    'bishop_score': 'int8',
+    'del_type': 'category',
+    'prev_ceaserean': FLAG,
+    'glucose_level': VITAL,
+    'prev_assisted': FLAG,
+    'pulse_pressure': VITAL,
+    'bp_ratio': VITAL,
+}
+
+CATEGORIES = {
+    'fetal_presentation': FETAL_PRESENTATIONS,
+    'del_type': tuple(LABEL_MAP),
+    'first_time_del_type': tuple(LABEL_MAP),
+}
+
+# Added to every cached dataset; load_training_data() splits them off
+DERIVED_COLUMNS = {
+    'first_time': FLAG,
+    'first_time_del_type': 'category',
+}
+
+# ======================================================
+# CLEANING (vectorized, one chunk at a time)
+# ======================================================
+
+def normalize_column(name):
+    return name.strip().lower().replace(" ", "_")
+
+def _read_dtypes(header):
+    """read_csv dtypes by raw header name: text for categories, float64 for the rest."""
+    dtypes = {}
+    for raw in header:
+        name = normalize_column(raw)
+        if name not in SCHEMA:
+            raise ValueError(f"Column '{raw}' is not in the dataset schema")
+        dtypes[raw] = str if SCHEMA[name] == 'category' else np.float64
+    return dtypes
+
+def _codes(values, name, categories):
+    codes = pd.Categorical(values, categories=categories).codes
+    if (codes < 0).any():
+        unknown = sorted(set(values[codes < 0]))
+        raise ValueError(f"Unexpected {name} values: {', '.join(map(repr, unknown[:10]))}")
+    return codes.astype(np.int8)
+
+def _text(series):
+    return series.fillna('').str.strip().str.lower().to_numpy(dtype=object)
+
+def clean_chunk(chunk):
+    """
+    One raw chunk (normalized column names) -> {column: compact array}.
+    Missing numbers become 0 (the old fillna(0)); labels are corrected from
+    the delivery history and first-time mothers relabelled from the Bishop
+    score. Comparisons use the float64 values, before the float32 cast.
+    """
+    numbers = {
+        name: chunk[name].fillna(0).to_numpy(dtype=np.float64)
+        for name in chunk.columns if SCHEMA[name] != 'category'
+    }
+
+    # --- Label correction (later rules of the old .loc chain win) ---
+    label = pd.Series(_text(chunk['del_type'])).replace(LABEL_ALIASES).to_numpy(dtype=object)
+    prev_c, prev_v, prev_a = numbers['prev_ceaserean'], numbers['prev_vaginal_birth'], numbers['prev_assisted']
+    label = np.select(
+        [(prev_v == 1) & (prev_a == 0), (prev_a == 1) & (prev_c == 0), prev_c == 1],
+        ['normal', 'forceps', 'caesarean'], default=label,
+    )
+
+    # --- First-time mothers: relabelled from the Bishop score ---
+    first_time = (prev_c == 0) & (prev_v == 0) & (prev_a == 0)
+    bishop, bmi = numbers['bishop_score'], numbers['bmi']
+    first_time_label = np.select(
+        [bishop >= 7, bishop <= 5, (bishop == 6) & (bmi >= 30)],
+        ['normal', 'caesarean', 'forceps'], default=label,
+    )
+
+    out = {}
+    for name in chunk.columns:
+        kind = SCHEMA[name]
+        if name == 'del_type':
+            out[name] = _codes(label, name, CATEGORIES[name])
+        elif kind == 'category':
+            out[name] = _codes(_text(chunk[name]), name, CATEGORIES[name])
+        else:
+            values = numbers[name]
+            if np.dtype(kind).kind == 'i' and (values != np.round(values)).any():
+                raise ValueError(f"Column '{name}' must hold whole numbers")
+            out[name] = values.astype(kind)
+    out['first_time'] = first_time.astype(np.int8)
+    out['first_time_del_type'] = np.where(
+        first_time, _codes(first_time_label, 'del_type', CATEGORIES['first_time_del_type']), -1
+    ).astype(np.int8)
+    return out
+
+# ======================================================
+# CACHE (one raw column file per column + meta.json)
+# ======================================================
+
+def _as_sources(sources):
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    return [os.path.abspath(path) for path in sources]
+
+def source_signature(sources):
+    """Changes whenever a source file, the schema or the cache format changes."""
+    schema = json.dumps([SCHEMA, CATEGORIES, LABEL_ALIASES, CACHE_FORMAT_VERSION], sort_keys=True)
+    files = []
+    for path in _as_sources(sources):
+        stat = os.stat(path)
+        files.append([path, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps([schema, files]).encode()).hexdigest()
+
+def _stored_dtype(kind):
+    return np.int8 if kind == 'category' else np.dtype(kind)
+
+def build_cache(sources, cache_dir, chunk_rows=CHUNK_ROWS):
+    """
+    Streams every source CSV in chunks of `chunk_rows`, so memory stays
+    bounded by the chunk size, and appends each cleaned column to its own
+    file. The directory is built next to `cache_dir` and swapped in.
+    """
+    sources = _as_sources(sources)
+    cache_dir = os.path.abspath(cache_dir)
+    staging = cache_dir + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    columns, files, n_rows = None, {}, 0
+    try:
+        for path in sources:
+            header = pd.read_csv(path, nrows=0).columns
+            names = [normalize_column(c) for c in header]
+            if columns is None:
+                columns = names + list(DERIVED_COLUMNS)
+                files = {name: open(os.path.join(staging, f"{name}.bin"), "wb") for name in columns}
+            elif sorted(names) != sorted(columns[:-len(DERIVED_COLUMNS)]):
+                raise ValueError(f"{path} does not have the same columns as {sources[0]}")
+
+            for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=_read_dtypes(header)):
+                chunk.columns = names
+                for name, values in clean_chunk(chunk).items():
+                    files[name].write(np.ascontiguousarray(values).tobytes())
+                n_rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    kinds = {**SCHEMA, **DERIVED_COLUMNS}
+    meta = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'signature': source_signature(sources),
+        'sources': sources,
+        'n_rows': n_rows,
+        'columns': [
+            {'name': name, 'dtype': np.dtype(_stored_dtype(kinds[name])).str,
+             'categories': list(CATEGORIES[name]) if kinds[name] == 'category' else None}
+            for name in columns
+        ],
+    }
+    # meta.json is written last: without it the directory is not a cache
+    with open(os.path.join(staging, META_FILENAME), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.exists(cache_dir):
+        retired = cache_dir + ".old"
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(cache_dir, retired)
+        os.replace(staging, cache_dir)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, cache_dir)
+    return meta
+
+def _cache_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_cache(cache_dir, meta=None):
+    """The cached dataset as a DataFrame with the compact dtypes (categories included)."""
+    meta = meta or _cache_meta(cache_dir)
+    data = {}
+    for column in meta['columns']:
+        path = os.path.join(cache_dir, f"{column['name']}.bin")
+        values = np.fromfile(path, dtype=np.dtype(column['dtype']), count=meta['n_rows'])
+        if column['categories'] is not None:
+            values = pd.Categorical.from_codes(values, categories=column['categories'])
+        data[column['name']] = values
+    return pd.DataFrame(data)
+
+def load_dataset(sources=DATASET_FILE, cache_dir=None, rebuild=False, chunk_rows=CHUNK_ROWS):
+    """
+    The cleaned dataset. The columnar cache next to the first source is
+    reused while the source files (size, mtime), schema and format are
+    unchanged; otherwise it is rebuilt from the CSVs first.
+    """
+    sources = _as_sources(sources)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(sources[0]), CACHE_DIRNAME)
+    meta = None if rebuild else _cache_meta(cache_dir)
+    if meta is None or meta.get('signature') != source_signature(sources):
+        meta = build_cache(sources, cache_dir, chunk_rows)
+    return read_cache(cache_dir, meta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build (or check) the columnar training-data cache")
+    parser.add_argument("sources", nargs="*", default=[DATASET_FILE], help="CSV files, read in order")
+    parser.add_argument("--cache-dir", default=None, help=f"default: {CACHE_DIRNAME}/ next to the first CSV")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even if the cache is current")
+    args = parser.parse_args()
+
+    frame = load_dataset(args.sources, args.cache_dir, args.rebuild, args.chunk_rows)
+    csv_bytes = sum(os.path.getsize(path) for path in args.sources)
+    print(f"✅ {len(frame)} rows, {frame.shape[1]} columns")
+    print(f"   CSV {csv_bytes / 1e6:.2f} MB -> in memory {frame.memory_usage(deep=True).sum() / 1e6:.2f} MB")
+    sys.exit(0)
@@ -0,0 +1,141 @@
+import io
+import time
+import statistics
+import numpy as np
+import pandas as pd
+import joblib
+
+from sklearn.ensemble import HistGradientBoostingClassifier
+
+from feature_pipeline import FeaturePipeline, ENGINEERED_FEATURES
+from tree_engine import export_estimator, predict_proba
+
+# --- Configuration ---
+# Synthetic rows per training row, drawn around it and labelled by the teacher
+SYNTHETIC_FACTOR = 3
+# Noise std as a fraction of each measured column's std
+JITTER_SCALE = 0.15
+# Columns with at most this many distinct values (flags, one-hots) are copied, not jittered
+MAX_DISCRETE_VALUES = 2
+
+# The student is kept only if it is at most this much worse than the teacher on the test split
+ACCURACY_TOLERANCE = 0.01
+AUC_TOLERANCE = 0.01
+
+LATENCY_ROWS = 200
+BATCH_ROWS = 1000
+DISTILLATION_REPORT_FILE = 'distillation.json'
+
+# ======================================================
+# TRAINING DATA FOR THE STUDENT
+# ======================================================
+
+def synthetic_neighbours(X_raw, n_rows, seed=42, jitter=JITTER_SCALE):
+    """
+    `n_rows` rows drawn around random rows of the unscaled matrix `X_raw`:
+    measured columns get Gaussian noise (whole-number columns stay whole,
+    everything stays inside the observed range), flags and one-hots are
+    copied, and engineered columns are recomputed from the jittered inputs.
+    """
+    rng = np.random.default_rng(seed)
+    base = X_raw.to_numpy(dtype=np.float64)[rng.integers(0, len(X_raw), n_rows)]
+    columns = {}
+    for i, name in enumerate(X_raw.columns):
+        values = base[:, i].copy()
+        observed = X_raw.iloc[:, i].to_numpy(dtype=np.float64)
+        if name not in ENGINEERED_FEATURES and len(np.unique(observed)) > MAX_DISCRETE_VALUES:
+            values += rng.normal(0.0, jitter * observed.std(), n_rows)
+            if np.all(observed == np.round(observed)):
+                values = np.round(values)
+            values = np.clip(values, observed.min(), observed.max())
+        columns[name] = values
+    return pd.DataFrame(FeaturePipeline(X_raw.columns).transform(columns, n_rows=n_rows), columns=X_raw.columns)
+
+def fit_student(X, soft_targets, classes, params, seed=42):
+    """
+    A small histogram booster fitted to the teacher's probabilities: every
+    row appears once per class, weighted by the teacher's probability of
+    that class, so the log-loss it minimises is the cross-entropy to the
+    soft targets.
+    """
+    n_rows, n_classes = soft_targets.shape
+    X_rep = pd.DataFrame(np.repeat(np.asarray(X), n_classes, axis=0), columns=X.columns)
+    y_rep = np.tile(np.asarray(classes), n_rows)
+    weights = soft_targets.ravel()
+    keep = weights > 0
+    student = HistGradientBoostingClassifier(**params, early_stopping=False, random_state=seed)
+    student.fit(X_rep[keep], y_rep[keep], sample_weight=weights[keep])
+    return student
+
+def distill_model(teacher, scaler, X_train_raw, params, factor=SYNTHETIC_FACTOR, seed=42):
+    """Labels the training rows plus `factor` synthetic rows per row with the teacher and fits the student."""
+    synthetic = synthetic_neighbours(X_train_raw, factor * len(X_train_raw), seed)
+    X = pd.concat([X_train_raw, synthetic], ignore_index=True)
+    X = pd.DataFrame(scaler.transform(X), columns=X_train_raw.columns)
+    soft_targets = teacher.predict_proba(X)
+    return fit_student(X, soft_targets, teacher.classes_, params, seed), len(X)
+
+# ======================================================
+# GATE AND COMPARISON
+# ======================================================
+
+def _macro_auc(evaluation):
+    return float(np.mean([curve['auc'] for curve in evaluation['roc'].values()]))
+
+def passes_gate(teacher_eval, student_eval, accuracy_tolerance=ACCURACY_TOLERANCE, auc_tolerance=AUC_TOLERANCE):
+    """(passed, accuracy drop, macro AUC drop) of the student against the teacher."""
+    accuracy_drop = teacher_eval['accuracy'] - student_eval['accuracy']
+    auc_drop = _macro_auc(teacher_eval) - _macro_auc(student_eval)
+    return accuracy_drop <= accuracy_tolerance and auc_drop <= auc_tolerance, accuracy_drop, auc_drop
+
+def measure_serving(model, X_test, repeats=3):
+    """Artifact sizes and compiled-engine latency (single row median, one batch) of a fitted model."""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    spec = export_estimator(model)
+    X = np.asarray(X_test, dtype=np.float64)
+
+    predict_proba(spec, X[:1])
+    single = []
+    for row in X[:LATENCY_ROWS]:
+        started = time.perf_counter()
+        predict_proba(spec, row[np.newaxis, :])
+        single.append((time.perf_counter() - started) * 1000)
+    batch = X[np.arange(BATCH_ROWS) % len(X)]
+    batch_ms = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict_proba(spec, batch)
+        batch_ms.append((time.perf_counter() - started) * 1000)
+    return {
+        'pickle_mb': round(len(buffer.getvalue()) / 1e6, 3),
+        'compiled_mb': round(sum(np.asarray(a).nbytes for a in spec['pool'].values()) / 1e6, 3),
+        'n_trees': int(len(spec['pool']['roots'])),
+        'n_nodes': int(len(spec['pool']['feature'])),
+        'single_row_ms': round(statistics.median(single), 4),
+        f'batch_{BATCH_ROWS}_ms': round(min(batch_ms), 2),
+    }
+
+def distillation_report(teacher, student, teacher_eval, student_eval, X_test, gate, n_student_rows, fit_seconds):
+    passed, accuracy_drop, auc_drop = gate
+    report = {'passed': passed, 'accuracy_drop': round(accuracy_drop, 4), 'macro_auc_drop': round(auc_drop, 4),
+              'student_training_rows': n_student_rows, 'student_fit_seconds': round(fit_seconds, 2)}
+    for name, model, evaluation in (('teacher', teacher, teacher_eval), ('student', student, student_eval)):
+        report[name] = {
+            'accuracy': evaluation['accuracy'],
+            'macro_auc': _macro_auc(evaluation),
+            **measure_serving(model, X_test),
+        }
+    report['speedup_single_row'] = round(report['teacher']['single_row_ms'] / report['student']['single_row_ms'], 1)
+    report['size_ratio'] = round(report['teacher']['pickle_mb'] / report['student']['pickle_mb'], 1)
+    return report
+
+def print_report(report):
+    print(f"\n{'':<9} {'acc':>7} {'AUC':>7} {'trees':>6} {'pickle MB':>10} {'1-row ms':>9} {f'{BATCH_ROWS}-row ms':>10}")
+    for name in ('teacher', 'student'):
+        row = report[name]
+        print(f"{name:<9} {row['accuracy']*100:>6.2f}% {row['macro_auc']:>7.4f} {row['n_trees']:>6} "
+              f"{row['pickle_mb']:>10.2f} {row['single_row_ms']:>9.3f} {row[f'batch_{BATCH_ROWS}_ms']:>10.1f}")
+    verdict = "✅ kept" if report['passed'] else "❌ rejected"
+    print(f"{verdict}: accuracy drop {report['accuracy_drop']*100:.2f} pts, macro AUC drop "
+          f"{report['macro_auc_drop']:.4f}; {report['speedup_single_row']}x faster, {report['size_ratio']}x smaller")
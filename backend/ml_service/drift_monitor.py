@@ -0,0 +1,218 @@
+import os
+import threading
+import numpy as np
+
+# Streaming input-drift and prediction-mix monitor.
+#
+# train_model.py saves a drift reference in the artifact: per model, fixed
+# bin edges for every input feature (interior training quantiles) with the
+# training share of rows in each bin, and the training class mix. Serving
+# keeps one exponentially decayed count per bin, so memory is fixed per
+# feature however many patients arrive, and recent traffic weighs most.
+# PSI and a binned KS distance against the reference are computed from
+# those counts when a snapshot is asked for.
+
+# --- Configuration (environment) ---
+# ML_DRIFT_MONITOR=0 turns the monitor off
+DRIFT_ENV = "ML_DRIFT_MONITOR"
+# Rows after which an observation counts half
+HALF_LIFE_ENV = "ML_DRIFT_HALF_LIFE"
+DEFAULT_HALF_LIFE_ROWS = 5000
+
+REFERENCE_BINS = 10
+# Empty bins count as this share, so PSI stays finite
+MIN_SHARE = 1e-4
+# Usual PSI reading: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 major shift
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+# Scores are reported as 'insufficient_data' below this many (decayed) rows
+MIN_ROWS = 100
+TOP_DRIFTED = 5
+# Rows binned per step, so the comparison matrix stays small for large batches
+CHUNK_ROWS = 4096
+
+# ======================================================
+# REFERENCE (training side)
+# ======================================================
+
+def _bin_shares(values, edges):
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return (counts / max(len(values), 1)).tolist()
+
+def build_reference(X_raw, labels, bins=REFERENCE_BINS):
+    """
+    Drift reference for one model from its unscaled training matrix (in
+    pipeline column order) and the matching class labels (as served).
+    """
+    quantiles = np.linspace(0, 1, bins + 1)[1:-1]
+    edges, expected = [], []
+    for name in X_raw.columns:
+        values = X_raw[name].to_numpy(dtype=np.float64)
+        feature_edges = np.unique(np.quantile(values, quantiles))
+        edges.append(feature_edges.tolist())
+        expected.append(_bin_shares(values, feature_edges))
+    labels = np.asarray(labels)
+    classes, counts = np.unique(labels, return_counts=True)
+    return {
+        'features': list(X_raw.columns),
+        'edges': edges,
+        'expected': expected,
+        'classes': {str(label): float(count / len(labels)) for label, count in zip(classes, counts)},
+    }
+
+# ======================================================
+# STREAMING STATE (serving side)
+# ======================================================
+
+def _psi(actual, expected):
+    actual = np.maximum(actual, MIN_SHARE)
+    expected = np.maximum(expected, MIN_SHARE)
+    return np.sum((actual - expected) * np.log(actual / expected), axis=-1)
+
+def _status(rows, max_psi):
+    if rows < MIN_ROWS:
+        return 'insufficient_data'
+    if max_psi > PSI_ALERT:
+        return 'alert'
+    return 'warn' if max_psi > PSI_WARN else 'ok'
+
+class _ModelSketch:
+    """Decayed bin counts for one model's monitored features plus its prediction mix."""
+
+    def __init__(self, reference, monitored):
+        columns = [i for i, name in enumerate(reference['features']) if name in monitored]
+        self.features = [reference['features'][i] for i in columns]
+        self.columns = np.asarray(columns, dtype=np.intp)
+        n_bins = max((len(reference['edges'][i]) + 1 for i in columns), default=1)
+        # Edges padded with +inf: padded bins never fill, and an empty bin on both sides adds 0 to PSI
+        self.edges = np.full((len(columns), n_bins - 1), np.inf)
+        self.expected = np.zeros((len(columns), n_bins))
+        for row, i in enumerate(columns):
+            self.edges[row, :len(reference['edges'][i])] = reference['edges'][i]
+            self.expected[row, :len(reference['expected'][i])] = reference['expected'][i]
+        self.counts = np.zeros_like(self.expected)
+        self.rows = 0.0
+        self.expected_classes = dict(reference.get('classes', {}))
+        self.classes = {label: 0.0 for label in self.expected_classes}
+        self.predictions = 0.0
+        self.confidence_sum = 0.0
+
+    def observe_features(self, X, keep):
+        X = X[:, self.columns]
+        self.counts *= keep
+        self.rows = self.rows * keep + len(X)
+        offsets = np.arange(len(self.features)) * self.counts.shape[1]
+        for start in range(0, len(X), CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            # searchsorted(side='right') for every feature at once: edges <= value
+            bins = (self.edges[np.newaxis] <= chunk[:, :, np.newaxis]).sum(axis=2)
+            self.counts += np.bincount(
+                (bins + offsets).ravel(), minlength=self.counts.size
+            ).reshape(self.counts.shape)
+
+    def observe_predictions(self, labels, confidences, keep):
+        for label in self.classes:
+            self.classes[label] *= keep
+        for label, count in zip(*np.unique(np.asarray(labels, dtype=str), return_counts=True)):
+            self.classes[str(label)] = self.classes.get(str(label), 0.0) + float(count)
+        self.predictions = self.predictions * keep + len(labels)
+        self.confidence_sum = self.confidence_sum * keep + float(np.sum(confidences))
+
+    def snapshot(self):
+        if self.rows:
+            actual = self.counts / self.rows
+            psi = _psi(actual, self.expected)
+            ks = np.max(np.abs(np.cumsum(actual, axis=1) - np.cumsum(self.expected, axis=1)), axis=1)
+        else:
+            psi = ks = np.zeros(len(self.features))
+        order = np.argsort(-psi, kind='stable')
+        labels = sorted(set(self.classes) | set(self.expected_classes))
+        live = np.array([self.classes.get(label, 0.0) for label in labels])
+        live = live / self.predictions if self.predictions else live
+        training = np.array([self.expected_classes.get(label, 0.0) for label in labels])
+        max_psi = float(psi.max()) if len(psi) else 0.0
+        return {
+            'rows': round(self.rows, 1),
+            'status': _status(self.rows, max_psi),
+            'max_psi': round(max_psi, 4),
+            'top_drifted': [self.features[i] for i in order[:TOP_DRIFTED]],
+            'features': {
+                name: {'psi': round(float(psi[i]), 4), 'ks': round(float(ks[i]), 4)}
+                for i, name in enumerate(self.features)
+            },
+            'class_mix': {
+                label: {'live': round(float(share), 4), 'training': round(float(expected), 4)}
+                for label, share, expected in zip(labels, live, training)
+            },
+            'class_mix_psi': round(float(_psi(live, training)), 4) if self.predictions else 0.0,
+            'mean_confidence': round(self.confidence_sum / self.predictions, 2) if self.predictions else None,
+        }
+
+class DriftMonitor:
+    """
+    Per-model feature sketches and prediction mix, plus how often the
+    clinical rules override the models. Observations are O(features x bins)
+    per batch; snapshot() never touches past rows.
+    """
+
+    def __init__(self, reference, monitored, half_life=DEFAULT_HALF_LIFE_ROWS):
+        self.half_life = half_life
+        self._decay = 0.5 ** (1.0 / half_life)
+        self.models = {key: _ModelSketch(model_reference, monitored) for key, model_reference in reference.items()}
+        self._lock = threading.Lock()
+        self.screened = 0.0
+        self.excluded = 0.0
+        self.scored = 0.0
+        self.adjusted = 0.0
+
+    def _keep(self, n_rows):
+        return self._decay ** n_rows
+
+    def observe_features(self, model_key, X):
+        sketch = self.models.get(model_key)
+        if sketch is None or not len(X):
+            return
+        with self._lock:
+            sketch.observe_features(X, self._keep(len(X)))
+
+    def observe_predictions(self, model_key, labels, confidences):
+        sketch = self.models.get(model_key)
+        if sketch is None or not len(labels):
+            return
+        with self._lock:
+            sketch.observe_predictions(labels, confidences, self._keep(len(labels)))
+
+    def observe_overrides(self, screened, excluded, scored, adjusted):
+        """Rows screened / answered by an exclusion rule, and model rows scored / risk-adjusted."""
+        with self._lock:
+            keep = self._keep(screened)
+            self.screened = self.screened * keep + screened
+            self.excluded = self.excluded * keep + excluded
+            keep = self._keep(scored)
+            self.scored = self.scored * keep + scored
+            self.adjusted = self.adjusted * keep + adjusted
+
+    def snapshot(self):
+        with self._lock:
+            models = {key: sketch.snapshot() for key, sketch in self.models.items()}
+            overrides = {
+                'rule_exclusion_share': round(self.excluded / self.screened, 4) if self.screened else 0.0,
+                'confidence_adjusted_share': round(self.adjusted / self.scored, 4) if self.scored else 0.0,
+            }
+        statuses = [model['status'] for model in models.values()]
+        status = next((level for level in ('alert', 'warn', 'ok') if level in statuses), 'insufficient_data')
+        return {
+            'enabled': True,
+            'status': status,
+            'half_life_rows': self.half_life,
+            'thresholds': {'psi_warn': PSI_WARN, 'psi_alert': PSI_ALERT, 'min_rows': MIN_ROWS},
+            'overrides': overrides,
+            'models': models,
+        }
+
+def monitor_from_env(reference, monitored):
+    """A DriftMonitor for the artifact's reference, or None (no reference, or ML_DRIFT_MONITOR=0)."""
+    if not reference or os.environ.get(DRIFT_ENV, "1") == "0":
+        return None
+    half_life = float(os.environ.get(HALF_LIFE_ENV, DEFAULT_HALF_LIFE_ROWS))
+    return DriftMonitor(reference, monitored, max(half_life, 1.0))
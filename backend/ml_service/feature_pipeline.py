@@ -0,0 +1,120 @@
+import numpy as np
+
+# --- Engineered Features ---
+# Single source of truth for train_model.py and ml_model.py.
+# name -> (inputs, formula). Entries are ordered so every input is defined
+# before it is used. Formulas only use arithmetic and np.minimum, so the same
+# function works on pandas Series (training) and NumPy arrays (serving).
+ENGINEERED_FEATURES = {
+    'pulse_pressure': (
+        ('bp_systolic', 'bp_diastolic'),
+        lambda c: c['bp_systolic'] - c['bp_diastolic']),
+    'bp_ratio': (
+        ('bp_systolic', 'bp_diastolic'),
+        lambda c: c['bp_systolic'] / (c['bp_diastolic'] + 1)),
+    'bmi_bp_ratio': (
+        ('bmi', 'pulse_pressure'),
+        lambda c: c['bmi'] / (c['pulse_pressure'] + 1)),
+    'glucose_weight_ratio': (
+        ('glucose_level', 'weight_kg'),
+        lambda c: c['glucose_level'] / (c['weight_kg'] + 1)),
+    'gestation_risk': (
+        ('gest_age_weeks', 'bmi'),
+        lambda c: (c['gest_age_weeks'] / 40) * c['bmi']),
+    'age_bmi': (
+        ('maternal_age', 'bmi'),
+        lambda c: c['maternal_age'] * c['bmi']),
+    'bishops_delivery_certainty': (
+        ('bishop_score',),
+        lambda c: np.minimum((c['bishop_score'] / 13) * 100, 100)),
+    # Composite risk index
+    'composite_risk': (
+        ('prev_ceaserean', 'prev_assisted', 'prev_vaginal_birth', 'glucose_weight_ratio', 'bp_ratio'),
+        lambda c: (
+            c['prev_ceaserean'] * 0.35 +
+            c['prev_assisted'] * 0.35 +
+            c['prev_vaginal_birth'] * 0.2 +
+            c['glucose_weight_ratio'] * 0.05 +
+            c['bp_ratio'] * 0.05
+        )),
+}
+
+def engineer_features(frame):
+    """Adds every engineered column to `frame` (a DataFrame or dict of arrays) in place."""
+    for name, (_, formula) in ENGINEERED_FEATURES.items():
+        frame[name] = formula(frame)
+    return frame
+
+def _required_engineered(features):
+    """Engineered features needed for `features`, including their inputs, in evaluation order."""
+    needed = set()
+    pending = [name for name in features if name in ENGINEERED_FEATURES]
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        pending.extend(dep for dep in ENGINEERED_FEATURES[name][0] if dep in ENGINEERED_FEATURES)
+    return [name for name in ENGINEERED_FEATURES if name in needed]
+
+class FeaturePipeline:
+    """
+    Feature transform compiled from a saved feature list ('features' or
+    'first_time_features'). transform() writes straight into an (n_rows,
+    n_features) float64 matrix whose column order is fixed by the list:
+    raw columns are copied, engineered columns are computed, and columns the
+    input does not have are left at 0 (the old reindex padding).
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.index = {name: i for i, name in enumerate(self.features)}
+        self._engineered = _required_engineered(self.features)
+        self._engineered_inputs = sorted({
+            dep for name in self._engineered for dep in ENGINEERED_FEATURES[name][0]
+            if dep not in ENGINEERED_FEATURES
+        })
+        self._passthrough = [
+            (i, name) for i, name in enumerate(self.features) if name not in ENGINEERED_FEATURES
+        ]
+        self._engineered_out = [
+            (self.index[name], name) for name in self._engineered if name in self.index
+        ]
+
+    def __len__(self):
+        return len(self.features)
+
+    def transform(self, columns, n_rows=None, out=None):
+        """
+        `columns` maps raw column names to scalars or 1-D arrays (a DataFrame
+        works too). Returns `out`, allocating it when not given.
+        """
+        if n_rows is None:
+            n_rows = next((len(v) for v in _values(columns) if np.ndim(v) == 1), 1)
+        if out is None:
+            out = np.zeros((n_rows, len(self.features)), dtype=np.float64)
+        else:
+            out[:] = 0
+
+        for i, name in self._passthrough:
+            if name in columns:
+                out[:, i] = columns[name]
+
+        if self._engineered:
+            scratch = {
+                name: np.asarray(columns[name], dtype=np.float64) if name in columns else 0.0
+                for name in self._engineered_inputs
+            }
+            # A zero denominator gives inf/nan silently, as the pandas version did
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for name in self._engineered:
+                    scratch[name] = ENGINEERED_FEATURES[name][1](scratch)
+            for i, name in self._engineered_out:
+                out[:, i] = scratch[name]
+
+        return out
+
+def _values(columns):
+    if hasattr(columns, 'columns'):
+        return (columns[name] for name in columns.columns)
+    return columns.values()
@@ -0,0 +1,394 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+import warnings
+
+warnings.filterwarnings("ignore")
+
+from sklearn.isotonic import IsotonicRegression
+from sklearn.model_selection import train_test_split
+
+from train_model import (
+    DATASET_FILE, MODEL_OUTPUT_FILE, COMPILED_MODEL_OUTPUT_DIR,
+    load_training_data, build_model_A_matrix, build_model_B_matrix, drift_references,
+)
+from tree_engine import export_compiled_artifact
+from training_report import score_test_set, evaluate
+import model_registry
+
+# --- Configuration ---
+VERSIONS_DIR = 'model_versions'
+
+# Each update grows every forest/booster by this share of its current size
+ADD_TREE_FRACTION = 0.1
+# Share of the new rows kept out of training for the version comparison
+NEW_TEST_FRACTION = 0.2
+# Rolling holdout: the most recent rows no tree has been trained on. Model
+# A's calibrators are refitted on it once it holds MIN_CALIBRATION_ROWS.
+CALIBRATION_WINDOW = 1000
+MIN_CALIBRATION_ROWS = 200
+
+# ======================================================
+# NEW RECORDS
+# ======================================================
+
+def _normalize(column):
+    return column.strip().lower().replace(" ", "_")
+
+def append_records(records_file, dataset_file=DATASET_FILE):
+    """Appends a CSV of labelled deliveries to the training CSV (same columns, any order)."""
+    header = pd.read_csv(dataset_file, nrows=0).columns
+    records = pd.read_csv(records_file)
+    by_name = {_normalize(c): c for c in records.columns}
+    missing = [c for c in header if _normalize(c) not in by_name]
+    if missing:
+        raise ValueError(f"{records_file} is missing columns: {', '.join(missing)}")
+    records = records[[by_name[_normalize(c)] for c in header]]
+    records.columns = header
+    records.to_csv(dataset_file, mode="a", header=False, index=False)
+    return len(records)
+
+def _legacy_training_state(n_rows, y_all, first_time_df):
+    """
+    Artifacts saved before training_state existed: assumes they were trained
+    on the first `n_rows` dataset rows and repeats train_model.py's splits.
+    """
+    rows_A = np.arange(n_rows)
+    _, test_A = train_test_split(rows_A, test_size=0.2, stratify=y_all.iloc[:n_rows], random_state=42)
+    first_time_rows = first_time_df.index[first_time_df.index < n_rows]
+    _, test_B = train_test_split(
+        np.asarray(first_time_rows), test_size=0.2, random_state=42,
+        stratify=first_time_df.loc[first_time_rows, 'target']
+    )
+    return {
+        'n_rows': int(n_rows),
+        'model_A': {'test_rows': sorted(test_A.tolist()), 'calibration_rows': []},
+        'model_B': {'test_rows': sorted(test_B.tolist()), 'calibration_rows': []},
+    }
+
+# ======================================================
+# SCALER: running statistics + threshold rescaling
+# ======================================================
+
+def _tree_arrays(estimator, seen):
+    """
+    (threshold, feature, is_split, float32_input) for every tree inside a
+    fitted model; writing to `threshold` changes the tree in place.
+    DecisionTree-based models compare a float32 copy of the input.
+    """
+    name = type(estimator).__name__
+    if name == 'VotingClassifier':
+        for member in estimator.estimators_:
+            yield from _tree_arrays(member, seen)
+    elif name == 'CalibratedClassifierCV':
+        for pair in estimator.calibrated_classifiers_:
+            yield from _tree_arrays(pair.estimator, seen)
+    elif name == 'FrozenEstimator':
+        yield from _tree_arrays(estimator.estimator, seen)
+    elif name in ('RandomForestClassifier', 'GradientBoostingClassifier'):
+        for tree in np.ravel(estimator.estimators_):
+            if id(tree) not in seen:
+                seen.add(id(tree))
+                yield tree.tree_.threshold, tree.tree_.feature, tree.tree_.feature >= 0, True
+    elif name == 'HistGradientBoostingClassifier':
+        for predictor in (p for per_iteration in estimator._predictors for p in per_iteration):
+            if id(predictor) not in seen:
+                seen.add(id(predictor))
+                nodes = predictor.nodes
+                yield nodes['num_threshold'], nodes['feature_idx'], ~nodes['is_leaf'].astype(bool), False
+    else:
+        raise ValueError(f"Unsupported estimator for incremental updates: {name}")
+
+def _moved_thresholds(thresholds, features, old_scaler, new_scaler, X_raw, float32_input):
+    old_mean, old_scale = np.asarray(old_scaler.mean_), np.asarray(old_scaler.scale_)
+    new_mean, new_scale = np.asarray(new_scaler.mean_), np.asarray(new_scaler.scale_)
+    moved = (old_mean[features] + thresholds * old_scale[features] - new_mean[features]) / new_scale[features]
+    for f in np.unique(features):
+        at = np.flatnonzero(features == f)
+        raw = np.unique(X_raw[:, f])
+        old = (raw - old_mean[f]) / old_scale[f]
+        new = (raw - new_mean[f]) / new_scale[f]
+        if float32_input:
+            old = old.astype(np.float32).astype(np.float64)
+            new = new.astype(np.float32).astype(np.float64)
+        # Same neighbouring pair of dataset values, midpoint taken in the new space
+        k = np.searchsorted(old, thresholds[at], side='right')
+        inside = (k > 0) & (k < len(old))
+        lo, hi = new[k[inside] - 1], new[k[inside]]
+        mid = (lo + hi) / 2
+        moved[at[inside]] = np.where(mid >= hi, lo, mid)
+    return moved
+
+def rescale_thresholds(model, old_scaler, new_scaler, X_raw):
+    """
+    Moves every split threshold from the old scaler's space to the new one.
+    A threshold that falls between two distinct dataset values (`X_raw`,
+    unscaled) becomes their midpoint in the new space, so every dataset
+    value stays on the side of every split it was on; thresholds outside
+    the data range are mapped with t' = (mean + t * scale - mean') / scale'.
+    """
+    X_raw = np.asarray(X_raw, dtype=np.float64)
+    trees = list(_tree_arrays(model, set()))
+    splits = 0
+    for float32_input in (True, False):
+        group = [(threshold, feature, is_split) for threshold, feature, is_split, f32 in trees if f32 == float32_input]
+        if not group:
+            continue
+        thresholds = np.concatenate([threshold[is_split] for threshold, _, is_split in group])
+        features = np.concatenate([feature[is_split] for _, feature, is_split in group])
+        moved = _moved_thresholds(thresholds, features, old_scaler, new_scaler, X_raw, float32_input)
+        start = 0
+        for threshold, _, is_split in group:
+            end = start + int(is_split.sum())
+            threshold[is_split] = moved[start:end]
+            start = end
+        splits += len(thresholds)
+    return splits
+
+def update_scaler(scaler, X_new):
+    """A copy of `scaler` with its mean/variance updated by the new rows (partial_fit)."""
+    updated = copy.deepcopy(scaler)
+    updated.partial_fit(X_new)
+    return updated
+
+# ======================================================
+# GROWTH + CALIBRATION
+# ======================================================
+
+def _tree_count(estimator):
+    if type(estimator).__name__ == 'GradientBoostingClassifier':
+        return int(estimator.n_estimators_)
+    return len(estimator.estimators_)
+
+def grow(estimator, X, y, fraction=ADD_TREE_FRACTION):
+    """
+    Adds trees with warm_start: forests get new trees, GradientBoosting new
+    stages fitted on (X, y). Returns (before, after) tree counts, or None for
+    HistGradientBoosting, which rebins its input on every fit and so cannot
+    continue on different rows; its trees are kept as they are.
+    """
+    name = type(estimator).__name__
+    if name == 'HistGradientBoostingClassifier':
+        return None
+    if name not in ('RandomForestClassifier', 'GradientBoostingClassifier'):
+        raise ValueError(f"Unsupported estimator for incremental updates: {name}")
+    before = _tree_count(estimator)
+    estimator.set_params(warm_start=True, n_estimators=before + max(1, round(before * fraction)))
+    estimator.fit(X, y)
+    estimator.set_params(warm_start=False)
+    return before, _tree_count(estimator)
+
+def _response(estimator, X):
+    # Same preference order as CalibratedClassifierCV
+    if hasattr(estimator, 'decision_function'):
+        return estimator.decision_function(X)
+    return estimator.predict_proba(X)
+
+def recalibrate(pair, X, y):
+    """Refits one calibrated member's isotonic calibrators (one per class) on (X, y)."""
+    if pair.method != 'isotonic':
+        raise ValueError(f"Only isotonic calibration can be refitted, not {pair.method}")
+    scores = _response(pair.estimator, X)
+    pair.calibrators = [
+        IsotonicRegression(out_of_bounds='clip').fit(scores[:, i], (np.asarray(y) == label).astype(float))
+        for i, label in enumerate(pair.estimator.classes_)
+    ]
+
+def update_ensemble(ensemble, X_grow, y_grow, X_cal=None, y_cal=None, fraction=ADD_TREE_FRACTION):
+    """
+    Model A: grows the model inside every calibrated member, then (when a
+    holdout is given) refits that member's calibrators on it.
+    """
+    summary = {}
+    for name, member in zip(ensemble.named_estimators_, ensemble.estimators_):
+        counts = []
+        for pair in member.calibrated_classifiers_:
+            base = pair.estimator
+            if type(base).__name__ == 'FrozenEstimator':
+                base = base.estimator
+            counts.append(grow(base, X_grow, y_grow, fraction))
+            if X_cal is not None:
+                recalibrate(pair, X_cal, y_cal)
+        summary[name] = counts
+    return summary
+
+# ======================================================
+# UPDATE
+# ======================================================
+
+def _split_new_rows(new_rows, version):
+    rng = np.random.default_rng(version)
+    shuffled = rng.permutation(new_rows)
+    n_test = int(round(len(new_rows) * NEW_TEST_FRACTION))
+    return sorted(shuffled[:n_test].tolist()), sorted(shuffled[n_test:].tolist())
+
+def _frame(scaler, X, rows):
+    return pd.DataFrame(scaler.transform(X.loc[rows]), columns=X.columns, index=rows)
+
+def _compare(previous, updated, prev_scaler, new_scaler, X, y, test_rows, new_test_rows, class_names):
+    """Test-set metrics of both versions; the new rows' share is reported separately."""
+    comparison = {'test_rows': len(test_rows), 'new_test_rows': len(new_test_rows)}
+    for label, model, scaler in (('previous', previous, prev_scaler), ('updated', updated, new_scaler)):
+        result = evaluate(score_test_set(model, _frame(scaler, X, test_rows), y.loc[test_rows]), class_names)
+        comparison[label] = {
+            'accuracy': result['accuracy'],
+            'macro_auc': float(np.mean([curve['auc'] for curve in result['roc'].values()])),
+        }
+        if new_test_rows:
+            scored = score_test_set(model, _frame(scaler, X, new_test_rows), y.loc[new_test_rows])
+            comparison[label]['accuracy_new_rows'] = float(np.mean(scored['pred'] == scored['y_true']))
+    comparison['accuracy_change'] = comparison['updated']['accuracy'] - comparison['previous']['accuracy']
+    return comparison
+
+def run_incremental_update(records_file=None, base_file=MODEL_OUTPUT_FILE, versions_dir=VERSIONS_DIR,
+                           fraction=ADD_TREE_FRACTION, promote=False):
+    """
+    Appends `records_file` (if given) to the training CSV, then updates the
+    model in `base_file` with every dataset row it has not seen: running
+    scaler statistics, warm-started trees on the non-holdout rows and, for
+    Model A, calibration refitted on the rolling holdout. Writes
+    `versions_dir`/delivery_model_v<N>.joblib and a report comparing it with
+    the previous version on the same test rows.
+    """
+    started = time.perf_counter()
+    previous = joblib.load(base_file)
+    version = int(previous.get('version', 1))
+    state = previous.get('training_state')
+
+    n_before_append = len(pd.read_csv(DATASET_FILE, usecols=[0]))
+    if records_file:
+        print(f"📥 Appended {append_records(records_file)} records to '{DATASET_FILE}'")
+
+    df, first_time_df, label_map = load_training_data()
+    X_A, y_A = build_model_A_matrix(df)
+    X_B, y_B = build_model_B_matrix(first_time_df)
+    for key, X in (('features', X_A), ('first_time_features', X_B)):
+        if list(X.columns) != list(previous[key]):
+            raise ValueError(f"The dataset's {key} no longer match the model (new category?); run a full training.")
+
+    if state is None:
+        state = _legacy_training_state(n_before_append, y_A, first_time_df)
+    new_rows = list(range(state['n_rows'], len(df)))
+    if not new_rows:
+        print("Nothing to update: the model has seen every dataset row.")
+        return None
+
+    new_version = version + 1
+    new_test, new_train = _split_new_rows(new_rows, new_version)
+    first_time_rows = set(first_time_df.index)
+    class_names = list(label_map.keys())
+    updated = copy.deepcopy(previous)
+    report = {
+        'version': new_version, 'previous_version': version, 'base': base_file,
+        'new_rows': len(new_rows), 'dataset_rows': len(df),
+    }
+    new_state = {'n_rows': len(df)}
+
+    # --- Model A: scaler, thresholds, trees, rolling-holdout calibration ---
+    scaler_A = update_scaler(previous['scaler'], X_A.loc[new_rows])
+    rescale_thresholds(updated['model'], previous['scaler'], scaler_A, X_A)
+    test_A = sorted(state['model_A']['test_rows'] + new_test)
+    holdout = sorted(state['model_A']['calibration_rows'] + new_train)[-CALIBRATION_WINDOW:]
+    excluded = set(test_A) | set(holdout)
+    grow_rows = [row for row in range(len(df)) if row not in excluded]
+    recalibrated = len(holdout) >= MIN_CALIBRATION_ROWS
+    trees_A = update_ensemble(
+        updated['model'], _frame(scaler_A, X_A, grow_rows), y_A.loc[grow_rows],
+        _frame(scaler_A, X_A, holdout) if recalibrated else None,
+        y_A.loc[holdout] if recalibrated else None, fraction,
+    )
+    updated['scaler'] = scaler_A
+    new_state['model_A'] = {'test_rows': test_A, 'calibration_rows': holdout}
+    report['model_A'] = {
+        'trees': trees_A, 'grow_rows': len(grow_rows), 'holdout_rows': len(holdout),
+        'recalibrated': recalibrated,
+        **_compare(previous['model'], updated['model'], previous['scaler'], scaler_A,
+                   X_A, y_A, test_A, new_test, class_names),
+    }
+
+    # --- Model B: first-time mothers only, no calibration ---
+    new_rows_B = [row for row in new_rows if row in first_time_rows]
+    new_test_B = [row for row in new_test if row in first_time_rows]
+    test_B = sorted(state['model_B']['test_rows'] + new_test_B)
+    excluded_B = set(test_B)
+    grow_rows_B = [row for row in first_time_df.index if row not in excluded_B]
+    if new_rows_B:
+        scaler_B = update_scaler(previous['first_time_scaler'], X_B.loc[new_rows_B])
+        rescale_thresholds(updated['first_time_model'], previous['first_time_scaler'], scaler_B, X_B)
+        trees_B = grow(updated['first_time_model'], _frame(scaler_B, X_B, grow_rows_B),
+                       y_B.loc[grow_rows_B], fraction)
+    else:
+        scaler_B, trees_B = previous['first_time_scaler'], None
+    updated['first_time_scaler'] = scaler_B
+    new_state['model_B'] = {'test_rows': test_B, 'calibration_rows': []}
+    report['model_B'] = {
+        'trees': trees_B, 'new_rows': len(new_rows_B), 'grow_rows': len(grow_rows_B),
+        **_compare(previous['first_time_model'], updated['first_time_model'],
+                   previous['first_time_scaler'], scaler_B, X_B, y_B, test_B, new_test_B, class_names),
+    }
+
+    # --- Versioned artifact + report ---
+    updated['version'] = new_version
+    updated['training_state'] = new_state
+    updated['drift_reference'] = drift_references(
+        X_A.loc[grow_rows], y_A.loc[grow_rows], X_B.loc[grow_rows_B], y_B.loc[grow_rows_B], label_map
+    )
+    os.makedirs(versions_dir, exist_ok=True)
+    artifact_path = os.path.join(versions_dir, f"delivery_model_v{new_version}.joblib")
+    joblib.dump(updated, artifact_path)
+    report['artifact'] = artifact_path
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    if promote and model_registry.current_version() is not None:
+        # The service follows the registry; the fixed files are not read
+        report['promoted'] = model_registry.activate(model_registry.publish(
+            artifact_path, note=f"incremental update v{new_version}"
+        ))
+    elif promote:
+        joblib.dump(updated, MODEL_OUTPUT_FILE)
+        export_compiled_artifact(updated, COMPILED_MODEL_OUTPUT_DIR)
+        report['promoted'] = True
+
+    report_path = os.path.join(versions_dir, f"incremental_report_v{new_version}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    _print_report(report)
+    print(f"\n💾 Version {new_version} saved as '{artifact_path}'")
+    print(f"📄 Report saved as '{report_path}'")
+    if promote and report['promoted'] is not True:
+        print(f"🚀 Published and activated as registry version {report['promoted']}")
+    elif promote:
+        print(f"🚀 Promoted to '{MODEL_OUTPUT_FILE}' and '{COMPILED_MODEL_OUTPUT_DIR}/'")
+    return report
+
+def _print_report(report):
+    print(f"\n{'model':<8} {'test rows':>9} {'prev acc':>9} {'new acc':>9} {'change':>8} {'prev AUC':>9} {'new AUC':>9}")
+    for model in ('model_A', 'model_B'):
+        row = report[model]
+        print(f"{model:<8} {row['test_rows']:>9} {row['previous']['accuracy']*100:>8.2f}% "
+              f"{row['updated']['accuracy']*100:>8.2f}% {row['accuracy_change']*100:>+7.2f}% "
+              f"{row['previous']['macro_auc']:>9.4f} {row['updated']['macro_auc']:>9.4f}")
+    calibration = "refitted" if report['model_A']['recalibrated'] else "kept (holdout too small)"
+    print(f"Model A calibration {calibration} on {report['model_A']['holdout_rows']} holdout rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the trained models with new labelled deliveries")
+    parser.add_argument("--records", help="CSV of new labelled records to append first (run once per file)")
+    parser.add_argument("--base", default=MODEL_OUTPUT_FILE, help="artifact to update (default: the served model)")
+    parser.add_argument("--versions-dir", default=VERSIONS_DIR)
+    parser.add_argument("--add-fraction", type=float, default=ADD_TREE_FRACTION,
+                        help="trees to add, as a share of each forest/booster's current size")
+    parser.add_argument("--promote", action="store_true",
+                        help=f"also serve it: publish and activate it in the model registry when one is "
+                             f"active, else replace '{MODEL_OUTPUT_FILE}' and the compiled model")
+    args = parser.parse_args()
+
+    report = run_incremental_update(args.records, args.base, args.versions_dir, args.add_fraction, args.promote)
+    sys.exit(0)
@@ -0,0 +1,197 @@
+import os
+import time
+import bisect
+import threading
+
+# --- Configuration (environment) ---
+# ML_METRICS=1 turns on per-stage timing of predict_delivery_type_batch.
+# When it is off, every hook is a no-op method call.
+METRICS_ENV = "ML_METRICS"
+
+# Order used in snapshots; 'total' is the whole predict_delivery_type_batch call
+STAGES = (
+    'pre_filter', 'model_load', 'feature_mapping', 'cache', 'feature_engineering',
+    'scaling', 'predict_proba', 'explain', 'drift', 'predict', 'post_processing', 'total',
+)
+
+ROUTES = (
+    'rule_exclusion', 'model_A', 'model_B', 'cache_hit',
+    'clinical_boost', 'clinical_caution', 'clinical_warning',
+)
+
+# Histogram upper bounds in milliseconds (Prometheus style, cumulative on export)
+LATENCY_BUCKETS_MS = (
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+)
+
+class LatencyHistogram:
+    """Fixed-bucket histogram; quantiles are interpolated inside the bucket."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(self.bounds, value_ms)] += 1
+        self.count += 1
+        self.sum += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum, 4),
+            'mean_ms': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.50), 4),
+            'p95_ms': round(self.quantile(0.95), 4),
+            'p99_ms': round(self.quantile(0.99), 4),
+            'max_ms': round(self.max, 4),
+        }
+
+class _Stopwatch:
+    """Accumulates time per stage for one call; finish() records each stage once."""
+
+    __slots__ = ('metrics', 'start', 'last', 'stages')
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self.last)
+        self.last = now
+
+    def skip(self):
+        """Excludes the time since the last lap from every stage."""
+        self.last = time.perf_counter()
+
+    def finish(self):
+        self.stages['total'] = time.perf_counter() - self.start
+        self.metrics.record(self.stages)
+
+class _NullStopwatch:
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+    def finish(self):
+        pass
+
+_NULL_STOPWATCH = _NullStopwatch()
+
+class Metrics:
+    """
+    Process-wide prediction metrics: one latency histogram per stage and a
+    counter per route. stopwatch() and count() are the hot-path hooks.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+            self.routes = {route: 0 for route in ROUTES}
+            self.calls = 0
+            self.rows = 0
+            self.started = time.time()
+
+    def stopwatch(self):
+        return _Stopwatch(self) if self.enabled else _NULL_STOPWATCH
+
+    def count(self, route, n=1):
+        if self.enabled:
+            with self._lock:
+                self.routes[route] = self.routes.get(route, 0) + n
+
+    def count_call(self, rows):
+        if self.enabled:
+            with self._lock:
+                self.calls += 1
+                self.rows += rows
+
+    def record(self, stages):
+        with self._lock:
+            for stage, seconds in stages.items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = LatencyHistogram()
+                histogram.observe(seconds * 1000)
+
+    # --- Export ---
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'since': self.started,
+                'calls': self.calls,
+                'rows': self.rows,
+                'stages': {stage: h.summary() for stage, h in self.histograms.items() if h.count},
+                'routes': dict(self.routes),
+            }
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP birthsense_ml_stage_seconds Time spent per prediction stage per call.",
+            "# TYPE birthsense_ml_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in self.histograms.items():
+                cumulative = 0
+                for bound, bucket_count in zip(h.bounds, h.counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'birthsense_ml_stage_seconds_bucket{{stage="{stage}",le="{bound / 1000:g}"}} {cumulative}'
+                    )
+                lines.append(f'birthsense_ml_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'birthsense_ml_stage_seconds_sum{{stage="{stage}"}} {h.sum / 1000:.9g}')
+                lines.append(f'birthsense_ml_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+            lines += [
+                "# HELP birthsense_ml_route_total Predictions per route.",
+                "# TYPE birthsense_ml_route_total counter",
+            ]
+            for route, value in self.routes.items():
+                lines.append(f'birthsense_ml_route_total{{route="{route}"}} {value}')
+
+            lines += [
+                "# HELP birthsense_ml_calls_total Scoring calls (a single prediction is a batch of one).",
+                "# TYPE birthsense_ml_calls_total counter",
+                f"birthsense_ml_calls_total {self.calls}",
+                "# HELP birthsense_ml_rows_total Records scored.",
+                "# TYPE birthsense_ml_rows_total counter",
+                f"birthsense_ml_rows_total {self.rows}",
+            ]
+        return "\n".join(lines) + "\n"
+
+def _env_enabled():
+    return os.environ.get(METRICS_ENV, "").lower() in ("1", "true", "yes", "on")
+
+metrics = Metrics(enabled=_env_enabled())
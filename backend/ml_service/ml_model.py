@@ -1,16 +1,202 @@
-import pandas as pd
-import numpy as np
-import joblib
 import os
 import sys
 import json
+import time
+import threading
 from typing import Dict, Any
 
+from prediction_cache import cache_from_env, cache_key
+from batch_scheduler import scheduler_from_env
+from metrics import metrics
+from clinical_rules import rules as clinical_rules
+import model_registry
+
+# Only the standard library is imported at module level. Argument parsing and
+# the clinical pre-filter answer rule-excluded patients without ever loading
+# NumPy/pandas/joblib; those are imported the first time a model is needed.
+
 # --- Configuration ---
-MODEL_FILENAME = "delivery_model.joblib"
+# 'teacher' serves the full Model A ensemble, 'student' the distilled one that
+# `train_model.py --distill` saves next to it (Model B is the same in both).
+ML_MODEL_VARIANT = os.environ.get("ML_MODEL_VARIANT", "teacher")
+MODEL_VARIANTS = {
+    'teacher': ("delivery_model.joblib", ""),
+    'student': ("delivery_model_student.joblib", "_student"),
+}
+if ML_MODEL_VARIANT not in MODEL_VARIANTS:
+    raise ValueError(f"Unknown ML_MODEL_VARIANT '{ML_MODEL_VARIANT}' (expected one of: {', '.join(MODEL_VARIANTS)})")
+MODEL_FILENAME, STORE_SUFFIX = MODEL_VARIANTS[ML_MODEL_VARIANT]
+
+# 'compiled' serves from the model store (model_store.py) when it is at least
+# as new as the sklearn artifact; 'sklearn' always unpickles the joblib file.
+ML_ENGINE = os.environ.get("ML_ENGINE", "compiled")
+# The compiled engine walks the trees row by row: it wins on small batches,
+# sklearn's vectorised predict_proba on large ones (crossover measured at
+# 150-400 rows per model on one core). Routes of at least this many rows are
+# scored by the version's sklearn estimators instead; 0 never falls back.
+ML_COMPILED_MAX_ROWS = int(os.environ.get("ML_COMPILED_MAX_ROWS", "256"))
+
+# How often (seconds) the artifact files are stat'ed for changes. In serve
+# mode a background thread (model_registry.HotSwapper) does this instead,
+# every ML_REGISTRY_CHECK_INTERVAL seconds; 0 keeps the check on the request path.
+ARTIFACT_CHECK_INTERVAL = 1.0
+
+# Features listed per explained prediction unless the request sets "top_k"
+EXPLAIN_TOP_K = 5
 
 # --- Global Model Loading (Lazy) ---
 model_components = None
+prediction_cache = None
+batch_scheduler = None  # set in serve mode unless ML_BATCH_WINDOW_MS=0
+model_swapper = None  # set in serve mode unless ML_REGISTRY_CHECK_INTERVAL=0
+_last_artifact_check = 0.0
+
+def _artifact_paths():
+    from model_store import STORE_DIRNAME, store_meta_path
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return [
+        os.path.join(script_dir, MODEL_FILENAME),
+        store_meta_path(os.path.join(script_dir, STORE_DIRNAME + STORE_SUFFIX)),
+    ]
+
+def artifact_version():
+    """Changes whenever delivery_model.joblib or the compiled store (outside the registry) is rewritten."""
+    parts = []
+    for path in _artifact_paths():
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+        except OSError:
+            parts.append("-")
+    return ":".join(parts)
+
+def current_model_version():
+    """The registry's CURRENT version when one is active, else artifact_version()."""
+    return model_registry.current_version() or artifact_version()
+
+def _loaded_version():
+    return model_components['model_version'] if model_components is not None else None
+
+def _served_version():
+    """Version reported in responses; rule-only answers do not load the models for it."""
+    if model_components is not None:
+        return model_components['model_version']
+    return model_registry.current_version()
+
+def _model_source(version):
+    """(joblib path, compiled store dir, from registry) holding `version`."""
+    from model_store import STORE_DIRNAME
+
+    if version in model_registry.list_versions():
+        directory = model_registry.version_dir(version)
+        return os.path.join(directory, model_registry.MODEL_FILENAME), os.path.join(directory, STORE_DIRNAME), True
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, MODEL_FILENAME), os.path.join(script_dir, STORE_DIRNAME + STORE_SUFFIX), False
+
+def _check_variant(version, manifest):
+    """A registry version only serves the ML_MODEL_VARIANT it was published as."""
+    variant = manifest.get('variant', 'teacher')
+    if variant != ML_MODEL_VARIANT:
+        raise ValueError(f"Registry version {version} is a '{variant}' model but ML_MODEL_VARIANT is "
+                         f"'{ML_MODEL_VARIANT}'; publish the {ML_MODEL_VARIANT} artifact to its own "
+                         f"registry (ML_REGISTRY_DIR)")
+
+def _invalidate_if_artifact_changed():
+    """Drops the loaded models (and with them the cache) once the artifact changes."""
+    global model_components, _last_artifact_check
+    if model_components is None:
+        return
+    now = time.monotonic()
+    if now - _last_artifact_check < ARTIFACT_CHECK_INTERVAL:
+        return
+    _last_artifact_check = now
+    if current_model_version() != model_components['model_version']:
+        model_components = None
+
+def get_prediction_cache():
+    global prediction_cache
+    if prediction_cache is None:
+        prediction_cache = cache_from_env()
+    return prediction_cache
+
+def _build_components(model_data, model_A, scaler, ft_model, ft_scaler, compiled):
+    from feature_pipeline import FeaturePipeline
+
+    return {
+        'model_A': model_A,
+        'scaler': scaler,
+        'features': model_data['features'],
+        'label_map': model_data['label_map'],
+        'ft_model': ft_model,
+        'ft_scaler': ft_scaler,
+        'ft_features': model_data['first_time_features'],
+        'pipeline': FeaturePipeline(model_data['features']),
+        'ft_pipeline': FeaturePipeline(model_data['first_time_features']),
+        'reverse_label_map': {v: k.capitalize() for k, v in model_data['label_map'].items()},
+        'compiled': compiled,
+        'drift_reference': model_data.get('drift_reference'),
+    }
+
+def _use_model_store(model_full_path, store_dir):
+    from model_store import store_meta_path
+
+    meta_path = store_meta_path(store_dir)
+    if ML_ENGINE != "compiled" or not os.path.exists(meta_path):
+        return False
+    if not os.path.exists(model_full_path):
+        return True
+    # A retrained sklearn artifact that was never re-exported must win
+    return os.path.getmtime(meta_path) >= os.path.getmtime(model_full_path)
+
+def components_from_artifact(model_data, model_version):
+    """Serving components straight from a training dict (sklearn engine)."""
+    components = _build_components(
+        model_data,
+        model_data['model'], model_data['scaler'],
+        model_data['first_time_model'], model_data['first_time_scaler'],
+        compiled=False,
+    )
+    components['model_version'] = model_version
+    return components
+
+def load_version(model_version):
+    """
+    Loads the components of one version without installing them. Registry
+    versions are checked against their manifest first and keep its
+    self-test outputs under 'self_test'.
+    """
+    import numpy as np
+    from model_store import LazyCompiledModel, load_store_meta
+    from tree_engine import CompiledScaler
+
+    model_full_path, store_dir, from_registry = _model_source(model_version)
+    manifest = model_registry.verify_version(model_version) if from_registry else None
+    if manifest is not None:
+        _check_variant(model_version, manifest)
+
+    if _use_model_store(model_full_path, store_dir):
+        # Only the JSON metadata is read here; each sub-model maps its
+        # arrays the first time a row is routed to it.
+        meta = load_store_meta(store_dir)
+        components = _build_components(
+            meta,
+            LazyCompiledModel(store_dir, 'model', meta['classes']['model_A']),
+            CompiledScaler({k: np.asarray(v) for k, v in meta['scaler'].items()}),
+            LazyCompiledModel(store_dir, 'first_time_model', meta['classes']['model_B']),
+            CompiledScaler({k: np.asarray(v) for k, v in meta['first_time_scaler'].items()}),
+            compiled=True,
+        )
+        components['model_version'] = model_version
+        # Unpickled only when a batch reaches ML_COMPILED_MAX_ROWS
+        components['artifact_path'] = model_full_path
+    else:
+        import joblib
+
+        # print(f"Loading model from {model_full_path}...", file=sys.stderr)
+        components = components_from_artifact(joblib.load(model_full_path), model_version)
+    components['self_test'] = manifest['self_test'] if manifest else None
+    return components
 
 def load_models_lazy():
     global model_components
@@ -18,24 +204,9 @@ def load_models_lazy():
         return model_components
 
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_full_path = os.path.join(script_dir, MODEL_FILENAME)
-        
-        # print(f"Loading model from {model_full_path}...", file=sys.stderr)
-        model_data = joblib.load(model_full_path)
-        
-        components = {
-            'model_A': model_data['model'],
-            'scaler': model_data['scaler'],
-            'features': model_data['features'],
-            'label_map': model_data['label_map'],
-            'ft_model': model_data['first_time_model'],
-            'ft_scaler': model_data['first_time_scaler'],
-            'ft_features': model_data['first_time_features'],
-            'reverse_label_map': {v: k.capitalize() for k, v in model_data['label_map'].items()}
-        }
-        model_components = components
-        return components
+        # Taken before reading so a rewrite during the load is seen next check
+        model_components = load_version(current_model_version())
+        return model_components
 
     except Exception as e:
         print(f"CRITICAL MODEL LOAD ERROR: {e}", file=sys.stderr)
@@ -44,111 +215,20 @@ def load_models_lazy():
 def apply_clinical_pre_filter(input_data: Dict[str, Any]):
     """
     Applies non-negotiable clinical rules to bypass ML model.
+    The rules are the EXCLUSION_RULES table in clinical_rules.py.
     """
-    # Rule 1: Placenta Previa -> Absolute C-Section
-    placenta_location = str(input_data.get("placenta_location", "")).lower()
-    if placenta_location == "previa":
-        return {
-            "prediction_result": "C-Section",
-            "confidence_score": 100.0,
-            "model_used": "Clinical_Rule_Exclusion (Placenta Previa)"
-        }
-
-    # Rule 2: Prior Shoulder Dystocia -> High Recurrence Risk -> C-Section
-    prior_dystocia = str(input_data.get("prior_shoulder_dystocia", "")).lower()
-    if prior_dystocia == "yes":
-        return {
-            "prediction_result": "C-Section",
-            "confidence_score": 100.0,
-            "model_used": "Clinical_Rule_Exclusion (Prior Shoulder Dystocia)"
-        }
-
-    # Rule 3: Fetal Distress (Category III) -> Immediate C-Section
-    fhr_category = str(input_data.get("fetal_heart_rate_category", "")).upper()
-    if fhr_category == "III":
-        return {
-            "prediction_result": "C-Section",
-            "confidence_score": 100.0,
-            "model_used": "Clinical_Rule_Exclusion (Fetal Distress - Cat III)"
-        }
-
-    # Rule 4: Malpresentation (Transverse or Breech) -> C-Section
-    fetal_presentation = str(input_data.get("fetal_presentation", "")).lower()
-    if fetal_presentation in ["transverse", "breech"]:
-        return {
-            "prediction_result": "C-Section",
-            "confidence_score": 100.0,
-            "model_used": f"Clinical_Rule_Exclusion ({fetal_presentation.capitalize()} Lie)"
-        }
-    
-    return None
+    return clinical_rules.pre_filter(input_data)
 
 def calculate_clinical_risk_score(input_data: Dict[str, Any]):
     """
     Calculates a clinical risk score to adjust ML confidence.
-    Returns: 'High', 'Medium', 'Low'
+    Returns: 'High', 'Medium', 'Low' (RISK_RULES / RISK_LEVELS in clinical_rules.py)
     """
-    risk_points = 0
-    
-    # 1. Bishop Score & Labor Progress
-    bishop = input_data.get("bishop_score", 0)
-    dilation = input_data.get("cervical_dilation", 0)
-    station = input_data.get("fetal_station", 0)
-    
-    if bishop < 6: risk_points += 1
-    if dilation < 3: risk_points += 1 # Slow progress/unfavorable cervix
-    if station < -2: risk_points += 1 # High station (head not engaged)
-
-    # 2. Previous History
-    if str(input_data.get("previous_cesarean")).lower() == "yes":
-        risk_points += 2
-        
-    # 3. Fetal Presentation (Breech is handled by pre-filter, but if it slips through, it's high risk)
-    if str(input_data.get("fetal_presentation", "")).lower() == "breech":
-        risk_points += 3
-        
-    # 4. Comorbidities
-    if str(input_data.get("gestational_diabetes")).lower() == "yes":
-        risk_points += 1
-    if str(input_data.get("hypertension")).lower() == "yes":
-        risk_points += 1
-        
-    # 5. Maternal Factors
-    age = input_data.get("age", 0)
-    bmi = input_data.get("bmi", 0)
-    
-    if age > 35: risk_points += 1
-    if bmi > 30: risk_points += 1
-    
-    # Determine Category
-    if risk_points >= 4:
-        return "High"
-    elif risk_points >= 2:
-        return "Medium"
-    else:
-        return "Low"
-
-def predict_delivery_type_merged(input_data: Dict[str, Any]):
-    # --- STEP 1: Clinical Pre-Filtering ---
-    pre_filter_result = apply_clinical_pre_filter(input_data)
-    if pre_filter_result:
-        return pre_filter_result
+    return clinical_rules.risk_level(input_data)
 
-    # Load models only if needed
-    components = load_models_lazy()
-    if components is None:
-        raise RuntimeError("Prediction models failed to load.")
-        
-    model_A = components['model_A']
-    ft_model = components['ft_model']
-    scaler = components['scaler']
-    ft_scaler = components['ft_scaler']
-    features = components['features']
-    ft_features = components['ft_features']
-    reverse_label_map = components['reverse_label_map']
-    
-    # --- Feature Mapping and Encoding ---
-    renamed_input = {
+def map_input_features(input_data: Dict[str, Any]):
+    """Maps the API payload onto the training column names (Feature Mapping and Encoding)."""
+    return {
         "maternal_age": input_data.get("age", 0),
         "weight_kg": input_data.get("weight", 0),
         "height_cm": input_data.get("height", 0),
@@ -184,93 +264,667 @@ def predict_delivery_type_merged(input_data: Dict[str, Any]):
         "bp_diastolic": input_data.get("bp_diastolic", 0),
     }
 
-    df_input = pd.DataFrame([renamed_input])
-
-    # --- Feature Engineering ---
-    df_input['pulse_pressure'] = df_input['bp_systolic'] - df_input['bp_diastolic']
-    df_input['bp_ratio'] = df_input['bp_systolic'] / (df_input['bp_diastolic'] + 1)
-    df_input['bmi_bp_ratio'] = df_input['bmi'] / (df_input['pulse_pressure'] + 1)
-    df_input['glucose_weight_ratio'] = df_input['glucose_level'] / (df_input['weight_kg'] + 1)
-    df_input['gestation_risk'] = (df_input['gest_age_weeks'] / 40) * df_input['bmi']
-    df_input['age_bmi'] = df_input['maternal_age'] * df_input['bmi'] 
-    df_input['bishops_delivery_certainty'] = (df_input['bishop_score'] / 13) * 100 
-    df_input['bishops_delivery_certainty'] = df_input['bishops_delivery_certainty'].clip(upper=100) 
-
-    # Composite risk index 
-    df_input['composite_risk'] = (
-        df_input['prev_ceaserean'] * 0.35 +
-        df_input['prev_assisted'] * 0.35 +
-        df_input['prev_vaginal_birth'] * 0.2 +
-        df_input['glucose_weight_ratio'] * 0.05 +
-        df_input['bp_ratio'] * 0.05
-    )
+def apply_clinical_adjustment(predicted_label: str, confidence_pct, model_name: str, input_data: Dict[str, Any],
+                              clinical_risk=None):
+    """STEP 2: Post-Processing (Confidence Adjustment) from the clinical risk score."""
+    if clinical_risk is None:
+        clinical_risk = calculate_clinical_risk_score(input_data)
+    confidence_pct, model_name, route = clinical_rules.adjust(predicted_label, confidence_pct, model_name, clinical_risk)
+    if route is not None:
+        metrics.count(route)
+    return confidence_pct, model_name
+
+# Route counter per base model name
+_ROUTE_METRICS = {
+    "Model_B_95_Percent_Accurate": 'model_B',
+    "Model_A_History": 'model_A',
+}
+
+def _explainer(components, key, model):
+    """The compiled model attributions walk: the served one, or the sklearn model exported once."""
+    explainers = components.setdefault('explainers', {})
+    if key not in explainers:
+        if components['compiled']:
+            explainers[key] = model.load()
+        else:
+            from tree_engine import CompiledModel, export_estimator
+            explainers[key] = CompiledModel(export_estimator(model))
+    return explainers[key]
+
+_drift_lock = threading.Lock()
+
+def get_drift_monitor(components):
+    """
+    The drift monitor of the served version (drift_monitor.py), created on
+    first use; None for artifacts without a reference or with ML_DRIFT_MONITOR=0.
+    A swapped-in version starts from empty counts against its own reference.
+    """
+    with _drift_lock:
+        if 'drift_monitor' not in components:
+            from drift_monitor import monitor_from_env
+            from feature_pipeline import ENGINEERED_FEATURES
+
+            # Columns serving actually fills; the rest are zero-padded and would always look drifted
+            monitored = set(map_input_features({})) | set(ENGINEERED_FEATURES)
+            components['drift_monitor'] = monitor_from_env(components.get('drift_reference'), monitored)
+    return components['drift_monitor']
+
+def drift_snapshot():
+    """
+    The served version's drift snapshot; never loads the models. The counts
+    are this process's: in pool mode each child only sees its own requests,
+    so "pid" says which child answered.
+    """
+    components = model_components
+    monitor = get_drift_monitor(components) if components is not None else None
+    if monitor is None:
+        reason = "models not loaded" if components is None else "no drift reference or ML_DRIFT_MONITOR=0"
+        return {"enabled": False, "reason": reason, "model_version": _served_version(), "pid": os.getpid()}
+    return dict(monitor.snapshot(), model_version=components['model_version'], pid=os.getpid())
+
+def _observe_overrides(components, screened, excluded, scored=0, adjusted=0):
+    monitor = get_drift_monitor(components) if components is not None else None
+    if monitor is not None:
+        monitor.observe_overrides(screened, excluded, scored, adjusted)
+
+# Serving key -> key of the same estimator in the sklearn artifact
+_ARTIFACT_KEYS = {'model_A': 'model', 'ft_model': 'first_time_model'}
+_artifact_lock = threading.Lock()
+
+def _large_batch_model(components, key, X):
+    """
+    The sklearn estimator for a compiled route of at least ML_COMPILED_MAX_ROWS
+    rows, from the version's own joblib file (loaded once); None stays compiled.
+    """
+    import numpy as np
+
+    if not components['compiled'] or not ML_COMPILED_MAX_ROWS or len(X) < ML_COMPILED_MAX_ROWS:
+        return None
+    # sklearn rejects inf/nan features (e.g. bmi_bp_ratio at a zero pulse
+    # pressure + 1) that the compiled trees route like any other value
+    if not np.isfinite(X).all():
+        return None
+    path = components.get('artifact_path')
+    if not path or not os.path.exists(path):
+        return None
+    with _artifact_lock:
+        if 'artifact' not in components:
+            import joblib
+
+            try:
+                model_data = joblib.load(path)
+                # Only the estimators stay resident; the scalers and features are already served
+                components['artifact'] = {name: model_data[name] for name in _ARTIFACT_KEYS.values()}
+            except Exception as e:
+                print(f"⚠️ Large batches stay on the compiled engine: {e}", file=sys.stderr)
+                components['artifact'] = None
+    artifact = components['artifact']
+    return artifact[_ARTIFACT_KEYS[key]] if artifact is not None else None
+
+def _top_features(features, values, contributions, top_k):
+    """The top_k features by absolute contribution (percentage points of the predicted class)."""
+    import numpy as np
+
+    order = np.argsort(-np.abs(contributions), kind='stable')[:top_k]
+    return [
+        {
+            "feature": features[j],
+            "value": round(float(values[j]), 4),
+            "contribution": round(float(contributions[j]) * 100, 2),
+        }
+        for j in order
+    ]
+
+def _scored_routes(components, columns, n_rows, watch, top_k=0):
+    """
+    Routes mapped input columns to Model B (first-time mothers) or Model A
+    and scores each group with one predict_proba call. Yields (positions,
+    model, model_name, pipeline, probas, values, contributions) per
+    non-empty route; values and contributions are None unless top_k > 0.
+    """
+    import numpy as np
+
+    monitor = get_drift_monitor(components)
 
     # --- Model Selection ---
     is_first_time = (
-        renamed_input['prev_ceaserean'] == 0 and
-        renamed_input['prev_vaginal_birth'] == 0 and
-        renamed_input['prev_assisted'] == 0
+        (columns['prev_ceaserean'] == 0) &
+        (columns['prev_vaginal_birth'] == 0) &
+        (columns['prev_assisted'] == 0)
     )
 
-    if is_first_time:
-        active_model = ft_model
-        active_scaler = ft_scaler
-        active_features = ft_features 
-        model_name = "Model_B_95_Percent_Accurate"
-        # print("Using Model B (First-Time Mother, 95% Confidence)", file=sys.stderr)
-    else:
-        active_model = model_A
-        active_scaler = scaler
-        active_features = features
-        model_name = "Model_A_History"
-        # print("Using Model A (Previous History, 91% Confidence)", file=sys.stderr)
+    routes = [
+        # Model B (First-Time Mother, 95% Confidence)
+        (is_first_time, 'ft_model', components['ft_scaler'],
+         components['ft_pipeline'], "Model_B_95_Percent_Accurate"),
+        # Model A (Previous History, 91% Confidence)
+        (~is_first_time, 'model_A', components['scaler'],
+         components['pipeline'], "Model_A_History"),
+    ]
+    watch.lap('feature_mapping')
 
     # --- Prediction ---
-    df_to_scale = df_input.copy()
-    for col in active_features:
-        if col not in df_to_scale.columns:
-            df_to_scale[col] = 0
+    for mask, model_key, active_scaler, pipeline, model_name in routes:
+        positions = np.flatnonzero(mask)
+        if len(positions) == 0:
+            continue
+        active_model = components[model_key]
+
+        # Feature Engineering straight into the model's column order; columns the
+        # API never sends (e.g. gravida/parity) stay zero-padded.
+        route_columns = columns if len(positions) == n_rows else {
+            name: values[positions] for name, values in columns.items()
+        }
+        X = pipeline.transform(route_columns, n_rows=len(positions))
+        values = X.copy() if top_k else None
+        watch.lap('feature_engineering')
 
-    df_to_scale = df_to_scale[active_features]
-    df_scaled_array = active_scaler.transform(df_to_scale)
-    
-    # Convert scaled array back to DataFrame with feature names to avoid sklearn warning
-    df_scaled = pd.DataFrame(df_scaled_array, columns=active_features)
+        if monitor is not None:
+            # Unscaled values, as the training reference was binned
+            monitor.observe_features(_ROUTE_METRICS[model_name], X)
+            watch.lap('drift')
 
-    pred = active_model.predict(df_scaled)[0]
-    proba = active_model.predict_proba(df_scaled)[0]
+        # Same arithmetic as StandardScaler.transform, without the DataFrame round trip
+        X -= active_scaler.mean_
+        X /= active_scaler.scale_
+        watch.lap('scaling')
 
-    predicted_label = reverse_label_map.get(pred, "Unknown")
-    confidence_pct = round(np.max(proba) * 100, 2)
+        contributions = None
+        if top_k:
+            # Path attributions from the compiled trees; their probabilities
+            # are exactly the compiled engine's predict_proba output
+            explained, _, contributions = _explainer(components, model_key, active_model).explain(X)
+            watch.lap('explain')
+        large_batch_model = None if top_k else _large_batch_model(components, model_key, X)
+        if top_k and components['compiled']:
+            probas = explained
+        elif components['compiled'] and large_batch_model is None:
+            probas = active_model.predict_proba(X)
+        else:
+            import pandas as pd
 
-    # --- STEP 2: Post-Processing (Confidence Adjustment) ---
-    clinical_risk = calculate_clinical_risk_score(input_data)
-    
-    # Logic: If ML says C-Section and Clinical Risk is High -> Boost Confidence
-    if predicted_label == "C-Section":
-        if clinical_risk == "High":
-            confidence_pct = min(confidence_pct + 15.0, 99.9)
-            model_name += " + Clinical Boost (High Risk)"
-        elif clinical_risk == "Low":
-            confidence_pct = max(confidence_pct - 10.0, 50.1)
-            model_name += " + Clinical Caution (Low Risk)"
-            
-    # Logic: If ML says Vaginal and Clinical Risk is High -> Lower Confidence (Flag it)
-    elif predicted_label == "Vaginal":
-        if clinical_risk == "High":
-            confidence_pct = max(confidence_pct - 15.0, 50.1)
-            model_name += " + Clinical Warning (High Risk)"
+            if large_batch_model is not None:
+                active_model = large_batch_model
 
-    return {
-        "prediction_result": predicted_label,
-        "confidence_score": confidence_pct,
-        "model_used": model_name
+            # Keep feature names so sklearn does not warn about unnamed input
+            probas = active_model.predict_proba(pd.DataFrame(X, columns=pipeline.features, copy=False))
+        watch.lap('predict_proba')
+
+        if monitor is not None:
+            class_labels = np.array(
+                [components['reverse_label_map'].get(c, "Unknown") for c in active_model.classes_], dtype=object
+            )
+            monitor.observe_predictions(
+                _ROUTE_METRICS[model_name], class_labels[np.argmax(probas, axis=1)], probas.max(axis=1) * 100
+            )
+            watch.lap('drift')
+        yield positions, active_model, model_name, pipeline, probas, values, contributions
+
+def _score_model_rows(components, renamed_inputs, watch, top_k=0):
+    """
+    Scores mapped inputs (see _scored_routes).
+    Returns [predicted_label, confidence_pct, model_name] per input, plus
+    the top_k feature attributions when top_k > 0.
+    """
+    import numpy as np
+
+    reverse_label_map = components['reverse_label_map']
+    outputs = [None] * len(renamed_inputs)
+
+    columns = {
+        name: np.array([renamed[name] for renamed in renamed_inputs], dtype=np.float64)
+        for name in renamed_inputs[0]
     }
 
+    for positions, active_model, model_name, pipeline, probas, values, contributions in _scored_routes(
+            components, columns, len(renamed_inputs), watch, top_k):
+        preds = active_model.classes_[np.argmax(probas, axis=1)]
+
+        for i, (position, pred, proba) in enumerate(zip(positions, preds, probas)):
+            predicted_label = reverse_label_map.get(pred, "Unknown")
+            confidence_pct = round(np.max(proba) * 100, 2)
+            outputs[position] = [predicted_label, confidence_pct, model_name]
+            if top_k:
+                outputs[position].append(_top_features(
+                    pipeline.features, values[i], contributions[i, :, np.argmax(proba)], top_k
+                ))
+        watch.lap('predict')
+
+    return outputs
+
+def self_test_outputs(components):
+    """[label, confidence, model name] per model_registry.SELF_TEST_RECORDS, scored with `components`."""
+    renamed = [map_input_features(record) for record in model_registry.SELF_TEST_RECORDS]
+    # Synthetic records stay out of the drift counts
+    unmonitored = dict(components, drift_monitor=None)
+    return [
+        [label, float(confidence), model_name]
+        for label, confidence, model_name in _score_model_rows(unmonitored, renamed, metrics.stopwatch())
+    ]
+
+def self_test(components):
+    """
+    Scores the self-test batch (which also maps/warms both models) and
+    raises ValueError if the outputs are unusable or differ from the ones
+    recorded when the version was published.
+    """
+    outputs = self_test_outputs(components)
+    labels = set(components['reverse_label_map'].values())
+    for label, confidence, _ in outputs:
+        if label not in labels or not 0.0 <= confidence <= 100.0:
+            raise ValueError(f"Self-test produced an invalid prediction: {label} at {confidence}%")
+    expected = components.get('self_test')
+    if expected is None:
+        return outputs
+    for got, want in zip(outputs, expected):
+        if got[0] != want[0] or got[2] != want[2] or abs(got[1] - want[1]) > model_registry.SELF_TEST_TOLERANCE:
+            raise ValueError(f"Self-test mismatch: expected {want}, got {got}")
+    return outputs
+
+def _install_components(components):
+    """The swap itself: requests read `model_components` once, so in-flight ones keep the old models."""
+    global model_components
+    model_components = components
+
+def predict_delivery_type_batch(records, top_k=0):
+    """
+    Scores many patients at once. `records` is a list of input dicts (or a
+    DataFrame with the same keys as columns). Rule-excluded rows are answered
+    by the pre-filter; the rest are split into first-time (Model B) and
+    history (Model A) groups and each group is scored with one predict_proba
+    call. Results come back in input order and carry the "model_version"
+    that served them. With top_k > 0 model-scored results also carry
+    "top_features": the features that moved the model's probability of the
+    predicted class most, in percentage points.
+    """
+    if hasattr(records, "to_dict"):  # pandas DataFrame
+        records = records.to_dict(orient="records")
+
+    watch = metrics.stopwatch()
+    metrics.count_call(len(records))
+
+    # --- STEP 1: Clinical Pre-Filtering ---
+    results = clinical_rules.pre_filter_batch(records)
+    model_rows = [i for i, result in enumerate(results) if not result]
+    metrics.count('rule_exclusion', len(records) - len(model_rows))
+    watch.lap('pre_filter')
+    if not model_rows:
+        model_version = _served_version()
+        for result in results:
+            result["model_version"] = model_version
+        _observe_overrides(model_components, len(records), len(records))
+        watch.finish()
+        return results
+
+    # Load models only if needed
+    if model_swapper is None:
+        _invalidate_if_artifact_changed()
+    components = load_models_lazy()
+    if components is None:
+        raise RuntimeError("Prediction models failed to load.")
+    watch.lap('model_load')
+
+    renamed_inputs = [map_input_features(records[i]) for i in model_rows]
+    watch.lap('feature_mapping')
+
+    # --- Result Cache ---
+    # Keyed on the mapped model input plus the artifact version; the clinical
+    # adjustment below still runs per request because it reads other fields.
+    cache = get_prediction_cache()
+    cache.set_version(components['model_version'])
+    keys = None
+    model_outputs = [None] * len(model_rows)
+    if cache.enabled:
+        keys = [cache_key(renamed, components['model_version']) for renamed in renamed_inputs]
+        # Cached outputs carry no attributions
+        model_outputs = [None if top_k else cache.get(key) for key in keys]
+
+    pending = [j for j, output in enumerate(model_outputs) if output is None]
+    metrics.count('cache_hit', len(model_rows) - len(pending))
+    watch.lap('cache')
+    if pending:
+        scored = _score_model_rows(components, [renamed_inputs[j] for j in pending], watch, top_k)
+        for j, output in zip(pending, scored):
+            model_outputs[j] = output
+            if keys is not None:
+                cache.put(keys[j], output[:3])
+        watch.lap('cache')
+
+    # --- STEP 2: Post-Processing (Confidence Adjustment) ---
+    risk_levels = clinical_rules.risk_levels_batch([records[row] for row in model_rows])
+    adjusted = 0
+    for row, output, clinical_risk in zip(model_rows, model_outputs, risk_levels):
+        predicted_label, confidence_pct, model_name = output[:3]
+        metrics.count(_ROUTE_METRICS.get(model_name, model_name))
+        confidence_pct, row_model_name = apply_clinical_adjustment(
+            predicted_label, confidence_pct, model_name, records[row], clinical_risk
+        )
+        adjusted += row_model_name != model_name
+        results[row] = {
+            "prediction_result": predicted_label,
+            "confidence_score": confidence_pct,
+            "model_used": row_model_name
+        }
+        if top_k:
+            results[row]["top_features"] = output[3]
+    for result in results:
+        result["model_version"] = components['model_version']
+    _observe_overrides(components, len(records), len(records) - len(model_rows), len(model_rows), adjusted)
+    watch.lap('post_processing')
+    watch.finish()
+
+    return results
+
+def predict_delivery_type_merged(input_data: Dict[str, Any], top_k=0):
+    """Scores a single patient; a one-row call of predict_delivery_type_batch."""
+    return predict_delivery_type_batch([input_data], top_k)[0]
+
+def predict_delivery_type_columnar(table):
+    """
+    predict_delivery_type_batch for a columnar batch (columnar.py). Returns
+    (results, info): a columnar.RESULT_DTYPE array in input order, and
+    {"labels", "models", "model_version"}, the lists its "prediction" and
+    "model_used" codes index. Rows skip the prediction cache and carry no
+    attributions.
+    """
+    import numpy as np
+    import columnar
+
+    columnar.validate(table)
+    n_rows = len(table)
+    watch = metrics.stopwatch()
+    metrics.count_call(n_rows)
+
+    labels, models = [], []
+
+    def code(names, name):
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    # --- STEP 1: Clinical Pre-Filtering ---
+    outcomes = clinical_rules.pre_filter_columns(columnar.rule_columns(table), n_rows)
+    excluded = outcomes >= 0
+    model_rows = np.flatnonzero(~excluded)
+    metrics.count('rule_exclusion', n_rows - len(model_rows))
+
+    results = np.zeros(n_rows, dtype=columnar.RESULT_DTYPE)
+    templates = clinical_rules.exclusion_results
+    for field, key, names in (('prediction', 'prediction_result', labels), ('model_used', 'model_used', models)):
+        lookup = np.array([code(names, template[key]) for template in templates], dtype=np.uint8)
+        results[field][excluded] = lookup[outcomes[excluded]]
+    confidences = np.array([template['confidence_score'] for template in templates], dtype=np.float64)
+    results['confidence_score'][excluded] = confidences[outcomes[excluded]]
+    watch.lap('pre_filter')
+    if not len(model_rows):
+        _observe_overrides(model_components, n_rows, n_rows)
+        watch.finish()
+        return results, {"labels": labels, "models": models, "model_version": _served_version()}
+
+    # Load models only if needed
+    if model_swapper is None:
+        _invalidate_if_artifact_changed()
+    components = load_models_lazy()
+    if components is None:
+        raise RuntimeError("Prediction models failed to load.")
+    watch.lap('model_load')
+
+    model_table = table if len(model_rows) == n_rows else table[model_rows]
+    n_model = len(model_rows)
+    prediction = np.zeros(n_model, dtype=np.uint8)
+    predicted_label = np.empty(n_model, dtype=object)
+    confidence_pct = np.zeros(n_model, dtype=np.float64)
+    route = np.zeros(n_model, dtype=np.intp)
+    route_names = []
+    for positions, active_model, model_name, _, probas, _, _ in _scored_routes(
+            components, columnar.feature_columns(model_table), n_model, watch):
+        best = np.argmax(probas, axis=1)
+        class_labels = [components['reverse_label_map'].get(c, "Unknown") for c in active_model.classes_]
+        prediction[positions] = np.array([code(labels, label) for label in class_labels], dtype=np.uint8)[best]
+        predicted_label[positions] = np.array(class_labels, dtype=object)[best]
+        confidence_pct[positions] = np.round(probas[np.arange(len(best)), best] * 100, 2)
+        route[positions] = len(route_names)
+        route_names.append(model_name)
+        metrics.count(_ROUTE_METRICS.get(model_name, model_name), len(positions))
+        watch.lap('predict')
+
+    # --- STEP 2: Post-Processing (Confidence Adjustment) ---
+    levels = clinical_rules.risk_levels_columns(columnar.rule_columns(model_table), n_model)
+    confidence_pct, applied = clinical_rules.adjust_columns(predicted_label, confidence_pct, levels)
+    adjustments = list(clinical_rules.adjustments.values())
+    for index, (_, _, _, route_metric) in enumerate(adjustments):
+        metrics.count(route_metric, int(np.count_nonzero(applied == index)))
+
+    # model_used is the route's model name plus the adjustment's suffix
+    suffixes = [""] + [suffix for _, _, suffix, _ in adjustments]
+    combined = route * len(suffixes) + applied + 1
+    used = np.zeros(len(route_names) * len(suffixes), dtype=np.uint8)
+    for key in np.unique(combined):
+        used[key] = code(models, route_names[key // len(suffixes)] + suffixes[key % len(suffixes)])
+
+    results['prediction'][model_rows] = prediction
+    results['confidence_score'][model_rows] = confidence_pct
+    results['model_used'][model_rows] = used[combined]
+    _observe_overrides(components, n_rows, n_rows - n_model, n_model, int(np.count_nonzero(applied >= 0)))
+    watch.lap('post_processing')
+    watch.finish()
+
+    return results, {"labels": labels, "models": models, "model_version": components['model_version']}
+
+def predict_columnar_file(input_path, output_path):
+    """Scores the .npy batch at `input_path` into a .npy of results at `output_path`."""
+    import columnar
+
+    results, info = predict_delivery_type_columnar(columnar.load(input_path))
+    columnar.save(output_path, results)
+    return dict(info, rows=len(results), output_path=output_path)
+
+def handle_request(request: Dict[str, Any]):
+    """
+    Answers one worker request. Requests look like
+    {"id": 1, "op": "predict", "input": {...}}; "op" defaults to "predict".
+    {"op": "predict_batch", "inputs": [...]} answers with "results" in input order.
+    Either adds "top_features" to model-scored results with "explain": true
+    (and optionally "top_k", default EXPLAIN_TOP_K).
+    {"op": "predict_columnar", "input_path": ..., "output_path": ...} scores a
+    columnar .npy batch into a .npy of result codes (see columnar.py) and
+    answers with the label/model lists those codes index.
+    {"op": "cache_stats"} reports the prediction cache counters.
+    {"op": "batch_stats"} reports the micro-batching scheduler counters.
+    {"op": "rule_stats"} reports how often each clinical rule matched.
+    {"op": "model_info"} reports the served and current model versions and
+    the hot-swap counters.
+    {"op": "metrics"} returns the stage/route metrics snapshot (with the
+    clinical rule hit counters under "rules"); add "format": "prometheus"
+    for the text exposition format.
+    {"op": "drift"} reports how far recent inputs and predictions have moved
+    from the training data (see drift_monitor.py), for this process only.
+    """
+    request_id = request.get("id")
+    op = request.get("op", "predict")
+
+    if op == "ping":
+        return {"id": request_id, "ok": True}
+
+    if op == "cache_stats":
+        return {"id": request_id, "result": get_prediction_cache().stats()}
+
+    if op == "metrics":
+        if request.get("format") == "prometheus":
+            return {"id": request_id, "result": metrics.prometheus() + clinical_rules.prometheus()}
+        return {"id": request_id, "result": dict(metrics.snapshot(), rules=clinical_rules.stats())}
+
+    if op == "drift":
+        return {"id": request_id, "result": drift_snapshot()}
+
+    if op == "rule_stats":
+        return {"id": request_id, "result": clinical_rules.stats()}
+
+    if op == "model_info":
+        if model_swapper is not None:
+            return {"id": request_id, "result": model_swapper.stats()}
+        return {"id": request_id, "result": {"served": _served_version(), "current": model_registry.current_version()}}
+
+    if op == "batch_stats":
+        stats = batch_scheduler.stats() if batch_scheduler is not None else {"enabled": False}
+        return {"id": request_id, "result": stats}
+
+    if op == "predict_columnar":
+        try:
+            return {"id": request_id,
+                    "result": predict_columnar_file(request["input_path"], request["output_path"])}
+        except Exception as e:
+            return {"id": request_id, "error": f"Prediction execution failed: {repr(e)}"}
+
+    if op not in ("predict", "predict_batch"):
+        return {"id": request_id, "error": f"Unknown op: {op}"}
+
+    try:
+        top_k = max(int(request.get("top_k", EXPLAIN_TOP_K)), 1) if request.get("explain") else 0
+        if op == "predict_batch":
+            return {"id": request_id, "results": predict_delivery_type_batch(request.get("inputs") or [], top_k)}
+        result = predict_delivery_type_merged(request.get("input") or {}, top_k)
+        return {"id": request_id, "result": result}
+    except Exception as e:
+        return {"id": request_id, "error": f"Prediction execution failed: {repr(e)}"}
+
+def _submit_to_scheduler(scheduler, request, respond):
+    """
+    Queues a predict/predict_batch request on the micro-batching scheduler and
+    responds from its thread once every input has been scored.
+    """
+    request_id = request.get("id")
+
+    def failure(e):
+        return {"id": request_id, "error": f"Prediction execution failed: {repr(e)}"}
+
+    if request.get("op", "predict") == "predict":
+        def on_done(future):
+            error = future.exception()
+            respond(failure(error) if error else {"id": request_id, "result": future.result()})
+
+        scheduler.submit(request.get("input") or {}).add_done_callback(on_done)
+        return
+
+    inputs = request.get("inputs") or []
+    if not inputs:
+        respond({"id": request_id, "results": []})
+        return
+
+    # Inputs of one batch request may be flushed together with other requests
+    futures = [scheduler.submit(input_data) for input_data in inputs]
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_batch_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            respond(failure(errors[0]))
+        else:
+            respond({"id": request_id, "results": [f.result() for f in futures]})
+
+    for future in futures:
+        future.add_done_callback(on_batch_done)
+
+def serve_forever(stream_in=None, stream_out=None):
+    """
+    Long-running worker mode (`python ml_model.py --serve`).
+    Models are loaded once, then every stdin line is a JSON request and every
+    stdout line is the matching JSON response, tagged with the request "id".
+    Predictions that arrive within ML_BATCH_WINDOW_MS of each other are scored
+    as one batch, so responses may come back out of order. A new model
+    version is loaded and self-tested in the background, then swapped in.
+    """
+    global batch_scheduler, model_swapper
+    stream_in = stream_in or sys.stdin
+    stream_out = stream_out or sys.stdout
+
+    # Serving another variant than the registry's current version would silently
+    # ignore ML_MODEL_VARIANT, so that refuses to start.
+    version = model_registry.current_version()
+    if version is not None:
+        try:
+            _check_variant(version, model_registry.load_manifest(version))
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+
+    # Warm the models up front so the first clinician does not pay for joblib.load.
+    # A failed load is not fatal: rule-excluded inputs can still be answered.
+    load_models_lazy()
+
+    write_lock = threading.Lock()
+
+    def respond(message):
+        with write_lock:
+            stream_out.write(json.dumps(message) + "\n")
+            stream_out.flush()
+
+    batch_scheduler = scheduler_from_env(predict_delivery_type_batch)
+    if batch_scheduler is not None:
+        batch_scheduler.start()
+
+    if model_registry.CHECK_INTERVAL > 0:
+        model_swapper = model_registry.HotSwapper(
+            current_model_version, _loaded_version, load_version, self_test, _install_components
+        ).start()
+
+    respond({"event": "ready", "models_loaded": model_components is not None})
+
+    try:
+        for line in stream_in:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except Exception as e:
+                respond({"id": None, "error": f"Invalid JSON input: {e}"})
+                continue
+            if not isinstance(request, dict):
+                respond({"id": None, "error": "Request must be a JSON object"})
+                continue
+            # Explained predictions skip micro-batching: merged batches carry no attributions
+            if (batch_scheduler is not None and request.get("op", "predict") in ("predict", "predict_batch")
+                    and not request.get("explain")):
+                _submit_to_scheduler(batch_scheduler, request, respond)
+                continue
+            respond(handle_request(request))
+    finally:
+        if model_swapper is not None:
+            model_swapper.stop()
+        # Answer everything already queued before the worker exits
+        if batch_scheduler is not None:
+            batch_scheduler.stop()
+
 def run_prediction():
     # Note: We don't pre-check models here anymore to allow pre-filter to work fast.
     # Models will be checked inside predict_delivery_type_merged if needed.
 
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        from worker_pool import pool_size_from_env, serve_pool
+
+        pool_workers = pool_size_from_env()
+        if pool_workers > 1:
+            serve_pool(pool_workers, serve_forever, load_models_lazy)
+        else:
+            serve_forever()
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--columnar":
+        if len(sys.argv) != 4:
+            print(json.dumps({"error": "Usage: ml_model.py --columnar <input.npy> <output.npy>"}))
+            sys.exit(1)
+        try:
+            print(json.dumps(predict_columnar_file(sys.argv[2], sys.argv[3])))
+        except Exception as e:
+            print(json.dumps({"error": f"Prediction execution failed: {repr(e)}"}))
+            sys.exit(1)
+        return
+
     if len(sys.argv) > 1:
         try:
             input_json = sys.argv[1]
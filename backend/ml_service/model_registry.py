@@ -0,0 +1,355 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+
+# Local model registry. Every published version is an immutable directory
+# with a manifest of checksums; CURRENT names the version the inference
+# process serves, and history.json the versions activated before it.
+#
+#   model_registry/
+#     CURRENT                      "v3"
+#     history.json                 activation stack (rollback pops it)
+#     versions/v3/
+#       manifest.json              checksums, feature lists, self-test outputs
+#       delivery_model.joblib
+#       delivery_model_compiled/   (model_store.py)
+#
+#   python model_registry.py publish delivery_model.joblib --activate
+#   python model_registry.py rollback
+#
+# Only the standard library is imported at module level (ml_model.py reads
+# CURRENT on the request path); publishing imports the ML stack lazily.
+
+# --- Configuration ---
+REGISTRY_DIR = os.environ.get(
+    "ML_REGISTRY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry")
+)
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+HISTORY_FILENAME = "history.json"
+MANIFEST_FILENAME = "manifest.json"
+MODEL_FILENAME = "delivery_model.joblib"
+MANIFEST_FORMAT_VERSION = 1
+
+# How often (seconds) the serving process looks for a new CURRENT
+CHECK_INTERVAL = float(os.environ.get("ML_REGISTRY_CHECK_INTERVAL", "1.0"))
+
+# Self-test batch: scored at publish time with the sklearn models and again
+# by the serving engine before a version is swapped in. Covers both routes.
+SELF_TEST_RECORDS = [
+    {"age": 26, "weight": 90, "height": 165, "bmi": 23.88, "bp_systolic": 110, "bp_diastolic": 70,
+     "glucoseLevel": 100, "gestational_age": 39, "amniotic_fluid_index": 10, "estimated_fetal_weight": 3400,
+     "previous_cesarean": "No", "previous_vaginal_birth": "No", "previous_assisted": "No",
+     "bishop_score": 8, "fetal_presentation": "Cephalic"},
+    {"age": 34, "weight": 78, "height": 158, "bmi": 31.2, "bp_systolic": 135, "bp_diastolic": 88,
+     "glucoseLevel": 140, "gestational_age": 40, "amniotic_fluid_index": 7, "estimated_fetal_weight": 3900,
+     "previous_cesarean": "No", "previous_vaginal_birth": "No", "previous_assisted": "No",
+     "gestational_diabetes": "Yes", "bishop_score": 3, "fetal_presentation": "Cephalic"},
+    {"age": 31, "weight": 70, "height": 162, "bmi": 26.7, "bp_systolic": 120, "bp_diastolic": 80,
+     "glucoseLevel": 95, "gestational_age": 39, "amniotic_fluid_index": 12, "estimated_fetal_weight": 3300,
+     "previous_cesarean": "Yes", "previous_vaginal_birth": "No", "previous_assisted": "No",
+     "bishop_score": 5, "fetal_presentation": "Cephalic"},
+    {"age": 29, "weight": 64, "height": 168, "bmi": 22.7, "bp_systolic": 112, "bp_diastolic": 72,
+     "glucoseLevel": 88, "gestational_age": 40, "amniotic_fluid_index": 14, "estimated_fetal_weight": 3200,
+     "previous_cesarean": "No", "previous_vaginal_birth": "Yes", "previous_assisted": "No",
+     "bishop_score": 9, "fetal_presentation": "Cephalic", "induction_of_labor": "Yes"},
+    {"age": 38, "weight": 85, "height": 160, "bmi": 33.2, "bp_systolic": 145, "bp_diastolic": 95,
+     "glucoseLevel": 160, "gestational_age": 37, "amniotic_fluid_index": 5, "estimated_fetal_weight": 4100,
+     "previous_cesarean": "No", "previous_vaginal_birth": "Yes", "previous_assisted": "Yes",
+     "hypertension": "Yes", "bishop_score": 4, "fetal_presentation": "Cephalic", "oxytocin_augmentation": "Yes"},
+]
+# Max |confidence difference| accepted by the self-test: one step of the
+# 2-decimal rounding, since the compiled engine may differ from sklearn by 1e-15
+SELF_TEST_TOLERANCE = 0.01 + 1e-9
+
+# ======================================================
+# LAYOUT
+# ======================================================
+
+def version_dir(version, registry_dir=REGISTRY_DIR):
+    return os.path.join(registry_dir, VERSIONS_DIRNAME, version)
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Published versions, oldest first."""
+    try:
+        names = os.listdir(os.path.join(registry_dir, VERSIONS_DIRNAME))
+    except OSError:
+        return []
+    return sorted((name for name in names if name[1:].isdigit() and name.startswith("v")),
+                  key=lambda name: int(name[1:]))
+
+def current_version(registry_dir=REGISTRY_DIR):
+    """The version CURRENT points at, or None when nothing was activated."""
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILENAME)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def load_manifest(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(version_dir(version, registry_dir), MANIFEST_FILENAME)) as f:
+        return json.load(f)
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _history(registry_dir):
+    try:
+        with open(os.path.join(registry_dir, HISTORY_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+# ======================================================
+# CHECKSUMS
+# ======================================================
+
+def _sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _file_digests(directory):
+    """{relative path: {'sha256', 'bytes'}} for every file except the manifest."""
+    digests = {}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            if relative != MANIFEST_FILENAME:
+                digests[relative] = {'sha256': _sha256(path), 'bytes': os.path.getsize(path)}
+    return digests
+
+def verify_version(version, registry_dir=REGISTRY_DIR):
+    """Raises ValueError if any file of the version is missing, extra or altered."""
+    manifest = load_manifest(version, registry_dir)
+    actual = _file_digests(version_dir(version, registry_dir))
+    expected = manifest['files']
+    bad = sorted(name for name in set(expected) | set(actual) if expected.get(name) != actual.get(name))
+    if bad:
+        raise ValueError(f"Model version {version} failed its checksum: {', '.join(bad[:5])}")
+    return manifest
+
+# ======================================================
+# PUBLISH / ACTIVATE / ROLLBACK
+# ======================================================
+
+def publish(model_file, registry_dir=REGISTRY_DIR, note=None, variant=None):
+    """
+    Copies a training artifact into a new version directory, compiles its
+    model store, records the sklearn outputs for SELF_TEST_RECORDS and the
+    checksum of every file. `variant` (ml_model.MODEL_VARIANTS) defaults to
+    the one whose file name matches. Returns the new version name.
+    """
+    import joblib
+    import ml_model
+    from model_store import STORE_DIRNAME
+    from tree_engine import export_compiled_artifact, _check_rows
+
+    if variant is None:
+        variant = next((name for name, (filename, _) in ml_model.MODEL_VARIANTS.items()
+                        if filename == os.path.basename(model_file)), 'teacher')
+    if variant not in ml_model.MODEL_VARIANTS:
+        raise ValueError(f"Unknown variant '{variant}'")
+
+    model_data = joblib.load(model_file)
+    versions = list_versions(registry_dir)
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1}"
+    final_dir = version_dir(version, registry_dir)
+    staging = os.path.join(registry_dir, VERSIONS_DIRNAME, f".{version}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    shutil.copyfile(model_file, os.path.join(staging, MODEL_FILENAME))
+    compile_errors = export_compiled_artifact(
+        model_data, os.path.join(staging, STORE_DIRNAME), _check_rows(model_data)
+    )
+    components = ml_model.components_from_artifact(model_data, version)
+    manifest = {
+        'format_version': MANIFEST_FORMAT_VERSION,
+        'version': version,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'source': os.path.abspath(model_file),
+        'training_version': model_data.get('version'),
+        'variant': variant,
+        'note': note,
+        'features': list(model_data['features']),
+        'first_time_features': list(model_data['first_time_features']),
+        'label_map': {k: int(v) for k, v in model_data['label_map'].items()},
+        'compiled_max_error': compile_errors,
+        'self_test': ml_model.self_test_outputs(components),
+        'files': _file_digests(staging),
+    }
+    with open(os.path.join(staging, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, final_dir)
+    return version
+
+def activate(version, registry_dir=REGISTRY_DIR):
+    """Points CURRENT at a verified version; running services swap to it."""
+    verify_version(version, registry_dir)
+    history = _history(registry_dir)
+    if not history or history[-1] != version:
+        history.append(version)
+        _write_atomic(os.path.join(registry_dir, HISTORY_FILENAME), json.dumps(history, indent=2))
+    _write_atomic(os.path.join(registry_dir, CURRENT_FILENAME), version + "\n")
+    return version
+
+def rollback(registry_dir=REGISTRY_DIR):
+    """Re-activates the version that was current before the latest activation."""
+    history = _history(registry_dir)
+    if len(history) < 2:
+        raise ValueError("Nothing to roll back to: fewer than two versions were ever activated.")
+    retired = history.pop()
+    previous = history[-1]
+    verify_version(previous, registry_dir)
+    _write_atomic(os.path.join(registry_dir, HISTORY_FILENAME), json.dumps(history, indent=2))
+    _write_atomic(os.path.join(registry_dir, CURRENT_FILENAME), previous + "\n")
+    return retired, previous
+
+# ======================================================
+# HOT SWAP (inference process)
+# ======================================================
+
+class HotSwapper:
+    """
+    Background thread that follows CURRENT. When it names a version other
+    than the served one, the version is loaded, warmed and self-tested off
+    the request path, then handed to `install`; requests already running
+    finish on the components they started with. A version that fails is
+    not retried until CURRENT changes again.
+    """
+
+    def __init__(self, current, served, load, self_test, install, interval=CHECK_INTERVAL):
+        self._current = current
+        self._served = served
+        self._load = load
+        self._self_test = self_test
+        self._install = install
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.swaps = 0
+        self.failed_version = None
+        self.last_error = None
+        self.last_swap = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-hot-swap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """One poll; returns the version swapped in, or None."""
+        with self._lock:
+            target = self._current()
+            if target is None or target == self._served() or target == self.failed_version:
+                return None
+            started = time.perf_counter()
+            try:
+                components = self._load(target)
+                self._self_test(components)
+            except Exception as e:
+                self.failed_version, self.last_error = target, repr(e)
+                print(f"⚠️  Model version {target} was not swapped in: {e!r}", file=sys.stderr)
+                return None
+            previous = self._served()
+            self._install(components)
+            self.swaps += 1
+            self.failed_version = None
+            self.last_swap = {
+                'from': previous, 'to': target, 'at': time.time(),
+                'load_seconds': round(time.perf_counter() - started, 3),
+            }
+            return target
+
+    def stats(self):
+        return {
+            'served': self._served(),
+            'current': self._current(),
+            'swaps': self.swaps,
+            'last_swap': self.last_swap,
+            'failed_version': self.failed_version,
+            'last_error': self.last_error,
+        }
+
+# ======================================================
+# CLI
+# ======================================================
+
+def _print_versions(registry_dir):
+    current = current_version(registry_dir)
+    for version in list_versions(registry_dir):
+        manifest = load_manifest(version, registry_dir)
+        size = sum(entry['bytes'] for entry in manifest['files'].values())
+        marker = "*" if version == current else " "
+        print(f"{marker} {version:<6} {manifest['created']}  {size / 1e6:8.1f} MB  "
+              f"{manifest.get('variant', 'teacher'):<8} training v{manifest.get('training_version')}  "
+              f"{manifest.get('note') or ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish, activate and roll back served model versions")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_parser = commands.add_parser("publish", help="add a trained artifact as a new version")
+    publish_parser.add_argument("model_file", help="a delivery_model.joblib from train_model.py / incremental_update.py")
+    publish_parser.add_argument("--activate", action="store_true", help="serve it as soon as it is published")
+    publish_parser.add_argument("--note", help="free text kept in the manifest")
+    publish_parser.add_argument("--variant", choices=("teacher", "student"),
+                                help="ML_MODEL_VARIANT that may serve it (default: from the file name)")
+    activate_parser = commands.add_parser("activate", help="serve a published version")
+    activate_parser.add_argument("version")
+    commands.add_parser("rollback", help="serve the previously active version again")
+    commands.add_parser("list", help="published versions (* = current)")
+    verify_parser = commands.add_parser("verify", help="check a version's files against its manifest")
+    verify_parser.add_argument("version", nargs="?")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "publish":
+            version = publish(args.model_file, args.registry, args.note, args.variant)
+            print(f"💾 Published '{args.model_file}' as {version}")
+            if args.activate:
+                activate(version, args.registry)
+                print(f"🚀 {version} is now current")
+        elif args.command == "activate":
+            activate(args.version, args.registry)
+            print(f"🚀 {args.version} is now current")
+        elif args.command == "rollback":
+            retired, previous = rollback(args.registry)
+            print(f"↩️  Rolled back from {retired} to {previous}")
+        elif args.command == "list":
+            _print_versions(args.registry)
+        elif args.command == "verify":
+            version = args.version or current_version(args.registry)
+            if version is None:
+                raise ValueError("No version given and nothing is current.")
+            verify_version(version, args.registry)
+            print(f"✅ {version} matches its manifest")
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
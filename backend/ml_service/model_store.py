@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+# --- Configuration ---
+STORE_DIRNAME = "delivery_model_compiled"
+META_FILENAME = "meta.json"
+STORE_FORMAT_VERSION = 1
+
+# Sub-model directory per artifact key, so each can be loaded on its own
+SUB_MODELS = {
+    'model': 'model_A',
+    'first_time_model': 'model_B',
+}
+
+# Arrays at least this large go to their own .npy file (memory-mapped on load);
+# smaller ones are inlined in the JSON skeleton.
+MIN_MAPPED_ARRAY_SIZE = 256
+
+# ======================================================
+# SAVE
+# ======================================================
+
+def _to_skeleton(value, directory, path, counter):
+    """Replaces large arrays with .npy references; everything else becomes JSON."""
+    if isinstance(value, dict):
+        return {k: _to_skeleton(v, directory, f"{path}.{k}", counter) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_skeleton(v, directory, f"{path}.{i}", counter) for i, v in enumerate(value)]
+    if isinstance(value, np.ndarray):
+        if value.size >= MIN_MAPPED_ARRAY_SIZE:
+            filename = f"{counter[0]:04d}{path}.npy"
+            counter[0] += 1
+            np.save(os.path.join(directory, filename), np.ascontiguousarray(value))
+            return {'__npy__': filename}
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _scaler_to_json(scaler):
+    return {'mean_': np.asarray(scaler['mean_']).tolist(), 'scale_': np.asarray(scaler['scale_']).tolist()}
+
+def save_model_store(artifact, directory):
+    """
+    Writes a compiled artifact (tree_engine.compile_model_artifact) as a
+    directory: meta.json holds features, label map, scaler statistics and
+    the drift reference, and model_A/ and model_B/ each hold a spec.json
+    skeleton plus .npy arrays. The directory is built next to `directory`
+    and swapped in.
+    """
+    directory = os.path.abspath(directory)
+    staging = directory + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    for key, name in SUB_MODELS.items():
+        sub_dir = os.path.join(staging, name)
+        os.makedirs(sub_dir)
+        skeleton = _to_skeleton(artifact[key], sub_dir, "", [0])
+        with open(os.path.join(sub_dir, "spec.json"), "w") as f:
+            json.dump(skeleton, f)
+
+    meta = {
+        'format_version': STORE_FORMAT_VERSION,
+        'features': list(artifact['features']),
+        'first_time_features': list(artifact['first_time_features']),
+        'label_map': {k: int(v) for k, v in artifact['label_map'].items()},
+        'top_features_A': {k: float(v) for k, v in artifact.get('top_features_A', {}).items()},
+        'scaler': _scaler_to_json(artifact['scaler']),
+        'first_time_scaler': _scaler_to_json(artifact['first_time_scaler']),
+        'classes': {
+            name: np.asarray(artifact[key]['classes']).tolist() for key, name in SUB_MODELS.items()
+        },
+    }
+    if artifact.get('drift_reference'):
+        meta['drift_reference'] = artifact['drift_reference']
+    # meta.json is written last: its mtime marks the store as complete
+    with open(os.path.join(staging, META_FILENAME), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.exists(directory):
+        retired = directory + ".old"
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(directory, retired)
+        os.replace(staging, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, directory)
+    return directory
+
+# ======================================================
+# LOAD
+# ======================================================
+
+def _from_skeleton(value, directory, mmap):
+    if isinstance(value, dict):
+        if '__npy__' in value:
+            # mmap_mode='r': pages come from the OS page cache and are shared by
+            # every process that maps the same file
+            return np.load(os.path.join(directory, value['__npy__']), mmap_mode='r' if mmap else None)
+        if '__ndarray__' in value:
+            return np.array(value['__ndarray__'], dtype=np.dtype(value['dtype']))
+        return {k: _from_skeleton(v, directory, mmap) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_skeleton(v, directory, mmap) for v in value]
+    return value
+
+def store_meta_path(directory):
+    return os.path.join(directory, META_FILENAME)
+
+def load_store_meta(directory):
+    """Small JSON part of the store; enough to route and scale without any model."""
+    with open(store_meta_path(directory)) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model store format: {meta.get('format_version')}")
+    return meta
+
+def load_sub_model(directory, key, mmap=True):
+    """Loads one sub-model spec ('model' or 'first_time_model')."""
+    sub_dir = os.path.join(directory, SUB_MODELS[key])
+    with open(os.path.join(sub_dir, "spec.json")) as f:
+        skeleton = json.load(f)
+    return _from_skeleton(skeleton, sub_dir, mmap)
+
+class LazyCompiledModel:
+    """
+    CompiledModel that maps its arrays on the first predict_proba call, so a
+    process that only ever routes to Model B never touches Model A.
+    """
+
+    def __init__(self, directory, key, classes, mmap=True):
+        self.directory = directory
+        self.key = key
+        self.mmap = mmap
+        self.classes_ = np.asarray(classes)
+        self._model = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            from tree_engine import CompiledModel
+            self._model = CompiledModel(load_sub_model(self.directory, self.key, self.mmap))
+        return self._model
+
+    def predict_proba(self, X):
+        return self.load().predict_proba(X)
+
+    def predict(self, X):
+        return self.load().predict(X)
+
+# ======================================================
+# MEASUREMENT: cold start and memory per artifact layout
+# ======================================================
+
+_MEASURE_SNIPPET = r"""
+import json, os, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {script_dir!r})
+os.environ['ML_ENGINE'] = {engine!r}
+import ml_model
+record = {record!r}
+result = ml_model.predict_delivery_type_merged(record)
+elapsed = time.perf_counter() - start
+# Anonymous memory is the private copy; file-backed mmap pages are shared
+anon_kb = None
+try:
+    with open('/proc/self/smaps_rollup') as f:
+        anon_kb = sum(int(line.split()[1]) for line in f if line.startswith('Anonymous:'))
+except OSError:
+    pass
+print(json.dumps({{
+    'seconds': round(elapsed, 3),
+    'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'anon_mb': None if anon_kb is None else round(anon_kb / 1024, 1),
+    'model_used': result['model_used'],
+}}))
+"""
+
+MEASURE_RECORDS = {
+    'rule_only': {"placenta_location": "Previa"},
+    'model_B': {
+        "age": 26, "weight": 60, "height": 165, "bmi": 22.0, "bp_systolic": 110, "bp_diastolic": 70,
+        "glucoseLevel": 100, "gestational_age": 39, "amniotic_fluid_index": 10,
+        "estimated_fetal_weight": 3200, "previous_cesarean": "No", "previous_vaginal_birth": "No",
+        "previous_assisted": "No", "fetal_presentation": "Cephalic", "bishop_score": 8,
+    },
+    'model_A': {
+        "age": 31, "weight": 72, "height": 162, "bmi": 27.4, "bp_systolic": 124, "bp_diastolic": 80,
+        "glucoseLevel": 120, "gestational_age": 39, "amniotic_fluid_index": 12,
+        "estimated_fetal_weight": 3300, "previous_cesarean": "Yes", "previous_vaginal_birth": "No",
+        "previous_assisted": "No", "fetal_presentation": "Cephalic", "bishop_score": 5,
+    },
+}
+
+def measure_cold_start(script_dir):
+    """Fresh-process time to first answer and memory, sklearn artifact vs the store."""
+    import subprocess
+
+    layouts = {
+        'sklearn (delivery_model.joblib)': 'sklearn',
+        f'store ({STORE_DIRNAME}/, mmap)': 'compiled',
+    }
+    report = {}
+    for layout, engine in layouts.items():
+        report[layout] = {}
+        for route, record in MEASURE_RECORDS.items():
+            code = _MEASURE_SNIPPET.format(script_dir=script_dir, engine=engine, record=record)
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            report[layout][route] = json.loads(output.stdout.strip().splitlines()[-1])
+    return report
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        print(json.dumps(measure_cold_start(script_dir), indent=2))
+    else:
+        print("Usage: python model_store.py --measure")
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Configuration (environment) ---
+# ML_CACHE_SIZE   max in-memory entries, 0 disables the cache (default 1024)
+# ML_CACHE_TTL    seconds an entry stays valid, 0 = no expiry (default 3600)
+# ML_CACHE_PATH   optional SQLite file so entries survive worker restarts
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 3600.0
+
+def _normalize(value):
+    """Same value the model sees: numbers (and numeric strings) as floats."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+def cache_key(renamed_input, model_version):
+    """Hash of the canonical model input vector plus the artifact version."""
+    canonical = json.dumps(
+        [model_version, sorted((k, _normalize(v)) for k, v in renamed_input.items())],
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+class _SQLiteBackend:
+    """On-disk second level; keys already include the model version."""
+
+    def __init__(self, path, ttl):
+        import sqlite3
+
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, version TEXT, value TEXT, created REAL)"
+        )
+        if ttl:
+            self.conn.execute("DELETE FROM predictions WHERE created < ?", (time.time() - ttl,))
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT value, created FROM predictions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl and time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, version, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO predictions (key, version, value, created) VALUES (?, ?, ?, ?)",
+            (key, version, json.dumps(value), time.time()),
+        )
+
+    def retain_version(self, version):
+        self.conn.execute("DELETE FROM predictions WHERE version != ?", (version,))
+
+class PredictionCache:
+    """
+    Bounded LRU cache of model outputs with a TTL. Values are whatever the
+    caller stores (ml_model.py keeps the label/confidence/model name before
+    the clinical adjustment, which still runs per request). Thread-safe.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _SQLiteBackend(path, ttl) if path and max_size > 0 else None
+        self.stats_counters = {
+            'hits': 0, 'disk_hits': 0, 'misses': 0,
+            'evictions': 0, 'expirations': 0, 'invalidations': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def set_version(self, version):
+        """Drops everything when the model artifact version changes."""
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self._entries.clear()
+                self.stats_counters['invalidations'] += 1
+            self.version = version
+            if self._disk is not None:
+                self._disk.retain_version(version)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl and time.monotonic() - created > self.ttl:
+                    del self._entries[key]
+                    self.stats_counters['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats_counters['hits'] += 1
+                    return value
+
+            if self._disk is not None:
+                value = self._disk.get(key)
+                if value is not None:
+                    self._store(key, value)
+                    self.stats_counters['disk_hits'] += 1
+                    return value
+
+            self.stats_counters['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store(key, value)
+            if self._disk is not None:
+                self._disk.put(key, self.version, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats_counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats.update({
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'disk': self._disk is not None,
+                'model_version': self.version,
+            })
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+def cache_from_env():
+    return PredictionCache(
+        max_size=int(os.environ.get("ML_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        ttl=float(os.environ.get("ML_CACHE_TTL", DEFAULT_CACHE_TTL)),
+        path=os.environ.get("ML_CACHE_PATH") or None,
+    )
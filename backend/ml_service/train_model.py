@@ -1,109 +1,270 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
 import pandas as pd
 import numpy as np
 import joblib
 import warnings
-import matplotlib.pyplot as plt
-import seaborn as sns
-from itertools import cycle 
 warnings.filterwarnings("ignore")
 
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, label_binarize
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, VotingClassifier
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_curve, auc, ConfusionMatrixDisplay
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import (
+    RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier, VotingClassifier
+)
 from sklearn.calibration import CalibratedClassifierCV
+from sklearn.frozen import FrozenEstimator
+
+from feature_pipeline import FeaturePipeline, engineer_features
+from dataset_ingest import LABEL_MAP, load_dataset
+from tree_engine import export_compiled_artifact
+from model_store import STORE_DIRNAME
+from training_report import (
+    REPORT_DIR, score_test_set, evaluate, artifact_stats, write_metrics, figure_specs, render_figures, render_figure
+)
+import distill
+from drift_monitor import build_reference
 
 # --- Configuration ---
 DATASET_FILE = 'maternal_dataset.csv'
 MODEL_OUTPUT_FILE = 'delivery_model.joblib' 
-
-def create_ensemble_model(rf, gb):
+COMPILED_MODEL_OUTPUT_DIR = STORE_DIRNAME
+# Distilled Model A (--distill); ML_MODEL_VARIANT=student serves these
+STUDENT_MODEL_OUTPUT_FILE = 'delivery_model_student.joblib'
+STUDENT_COMPILED_OUTPUT_DIR = STORE_DIRNAME + '_student'
+
+# --- Training Profiles ---
+# 'full': the original recipe. Model A calibrates the forest and the booster
+#         with cv=3, i.e. three fits of each.
+# 'fast': one forest fit and one HistGradientBoosting fit (early stopping),
+#         both calibrated on a held-out slice of the training split.
+TRAINING_PROFILES = ('full', 'fast')
+DEFAULT_PROFILE = 'full'
+CALIBRATION_HOLDOUT = 0.2
+PROFILE_COMPARISON_FILE = 'profile_comparison.json'
+
+# --- Model A Calibration (full profile) ---
+# 'cv':      CalibratedClassifierCV(cv=3); the artifact holds three fitted
+#            copies of the forest and three of the booster.
+# 'holdout': one forest and one booster fitted on the training split minus
+#            CALIBRATION_HOLDOUT, isotonic calibration fitted on the rest.
+# The fast profile always calibrates on the holdout.
+CALIBRATION_MODES = ('cv', 'holdout')
+DEFAULT_CALIBRATION = 'cv'
+CALIBRATION_COMPARISON_FILE = 'calibration_comparison.json'
+
+# --- Hyperparameters ---
+# tune_model.py searches these; `--params tuned_params.json` overrides them.
+MODEL_A_RF_PARAMS = {
+    'n_estimators': 1300, 'max_depth': 28, 'min_samples_split': 2,
+    'min_samples_leaf': 1, 'max_features': 'sqrt',
+}
+MODEL_A_GB_PARAMS = {'n_estimators': 500, 'learning_rate': 0.04, 'max_depth': 6, 'subsample': 0.9}
+MODEL_A_HGB_PARAMS = {'max_iter': 500, 'learning_rate': 0.04, 'max_depth': 6}
+MODEL_A_VOTE_WEIGHTS = [0.65, 0.35]
+MODEL_B_RF_PARAMS = {'n_estimators': 1000, 'max_depth': 15, 'min_samples_split': 2, 'min_samples_leaf': 1}
+MODEL_A_STUDENT_PARAMS = {'max_iter': 60, 'learning_rate': 0.15, 'max_depth': 4, 'max_leaf_nodes': 15}
+
+HYPERPARAMETERS = {
+    'model_A_rf': MODEL_A_RF_PARAMS,
+    'model_A_gb': MODEL_A_GB_PARAMS,
+    'model_A_hgb': MODEL_A_HGB_PARAMS,
+    'model_A_vote_weights': MODEL_A_VOTE_WEIGHTS,
+    'model_B_rf': MODEL_B_RF_PARAMS,
+    'model_A_student': MODEL_A_STUDENT_PARAMS,
+}
+
+def load_hyperparameters(path=None):
+    """The defaults above, with any keys from a tuned_params.json file replaced."""
+    params = {key: (dict(value) if isinstance(value, dict) else list(value))
+              for key, value in HYPERPARAMETERS.items()}
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if key not in params:
+                raise ValueError(f"Unknown hyperparameter group: {key}")
+            if isinstance(params[key], dict):
+                params[key].update(value)
+            else:
+                params[key] = list(value)
+    return params
+
+def create_ensemble_model(rf, gb, weights=MODEL_A_VOTE_WEIGHTS, n_jobs=-1):
     """Creates the Hybrid Ensemble (Your Model A structure)."""
     rf_cal = CalibratedClassifierCV(rf, method='isotonic', cv=3)
-    gb_cal = CalibratedClassifierCV(gb, metho
-                                    
+    gb_cal = CalibratedClassifierCV(gb, method='isotonic', cv=3)
+
     ensemble = VotingClassifier(
         estimators=[('rf', rf_cal), ('gb', gb_cal)],
         voting='soft',
-        weights=[0.65, 0.35],
-        n_jobs=-1
+        weights=list(weights),
+        n_jobs=n_jobs
     )
     return ensemble
 
-def run_model_training():
-    df = pd.read_csv(DATASET_FILE)
-    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-    df = df.fillna(0)
-
-    # ============================
-    # LABEL CORRECTION
-    # ============================
-    df['del_type'] = df['del_type'].str.lower().replace({
-        'svd': 'normal', 
-        'normal_vaginal': 'normal', 
-        'c_section': 'caesarean', 
-        'assisted': 'assisted'
-    })
-
-    df.loc[df['prev_ceaserean'] == 1, 'del_type'] = 'caesarean'
-    df.loc[(df['prev_vaginal_birth'] == 1) & (df['prev_assisted'] == 0), 'del_type'] = 'normal'
-    df.loc[(df['prev_assisted'] == 1) & (df['prev_ceaserean'] == 0), 'del_type'] = 'forceps'
-
-    label_map = {'normal': 0, 'caesarean': 1, 'forceps': 2}
-    df['target'] = df['del_type'].map(label_map)
-
-    # ============================
-    # FIRST TIME PREGNANCY LOGIC
-    # ============================
-    first_time_mask = (
-        (df['prev_ceaserean'] == 0) &
-        (df['prev_vaginal_birth'] == 0) &
-        (df['prev_assisted'] == 0)
+def calibration_split(X_train, y_train):
+    """(X_fit, X_cal, y_fit, y_cal): the fixed split holdout calibration uses."""
+    return train_test_split(
+        X_train, y_train, test_size=CALIBRATION_HOLDOUT, stratify=y_train, random_state=42
     )
-    
-    first_time_df = df[first_time_mask].copy()
 
-    first_time_df.loc[first_time_df['bishop_score'] >= 7, 'del_type'] = 'normal'
-    first_time_df.loc[first_time_df['bishop_score'] <= 5, 'del_type'] = 'caesarean'
+def create_holdout_ensemble_model(rf, booster, X_train, y_train, weights=MODEL_A_VOTE_WEIGHTS):
+    """
+    Model A with one fit of each base model: the forest and the booster are
+    fitted on 80% of the training split; isotonic calibration is fitted on
+    the other 20% (FrozenEstimator keeps the fitted models as they are).
+    """
+    X_fit, X_cal, y_fit, y_cal = calibration_split(X_train, y_train)
+    rf.fit(X_fit, y_fit)
+    booster.fit(X_fit, y_fit)
 
-    first_time_df.loc[
-        (first_time_df['bishop_score'] == 6) &
-        (first_time_df['bmi'] >= 30),
-        'del_type'
-    ] = 'forceps'
-
-    first_time_df['target'] = first_time_df['del_type'].map(label_map)
+    ensemble = VotingClassifier(
+        estimators=[
+            ('rf', CalibratedClassifierCV(FrozenEstimator(rf), method='isotonic')),
+            ('gb', CalibratedClassifierCV(FrozenEstimator(booster), method='isotonic')),
+        ],
+        voting='soft',
+        weights=list(weights)
+    )
+    ensemble.fit(X_cal, y_cal)
+    return ensemble
 
-    # ============================
-    # FEATURE ENGINEERING
-    # ============================
-    df['pulse_pressure'] = df['bp_systolic'] - df['bp_diastolic']
-    df['bp_ratio'] = df['bp_systolic'] / (df['bp_diastolic'] + 1)
-    df['bmi_bp_ratio'] = df['bmi'] / (df['pulse_pressure'] + 1)
-    df['glucose_weight_ratio'] = df['glucose_level'] / (df['weight_kg'] + 1)
-    df['gestation_risk'] = (df['gest_age_weeks'] / 40) * df['bmi']
-    df['age_bmi'] = df['maternal_age'] * df['bmi']
-    df['bishops_delivery_certainty'] = (df['bishop_score'] / 13) * 100
-    df['bishops_delivery_certainty'] = df['bishops_delivery_certainty'].clip(upper=100)
-
-    df['composite_risk'] = (
-        df['prev_ceaserean'] * 0.35 +
-        df['prev_assisted'] * 0.35 +
-        df['prev_vaginal_birth'] * 0.2 +
-        df['glucose_weight_ratio'] * 0.05 +
-        df['bp_ratio'] * 0.05
+def create_fast_ensemble_model(rf, X_train, y_train, hgb_params=MODEL_A_HGB_PARAMS,
+                               weights=MODEL_A_VOTE_WEIGHTS, verbose=True):
+    """Fast-profile Model A: holdout calibration with a histogram booster (early stopping)."""
+    hgb = HistGradientBoostingClassifier(
+        **hgb_params,
+        early_stopping=True, validation_fraction=0.1, n_iter_no_change=20,
+        random_state=42
     )
+    ensemble = create_holdout_ensemble_model(rf, hgb, X_train, y_train, weights)
+    if verbose:
+        print(f"⏱️  HistGradientBoosting stopped after {hgb.n_iter_} of {hgb.max_iter} iterations")
+    return ensemble
 
-    # ============================
-    # TRAIN MODEL A
-    # ============================
+def remove_student_artifacts():
+    """Deletes the saved student joblib and compiled store; returns the paths removed."""
+    removed = []
+    if os.path.exists(STUDENT_MODEL_OUTPUT_FILE):
+        os.remove(STUDENT_MODEL_OUTPUT_FILE)
+        removed.append(f"'{STUDENT_MODEL_OUTPUT_FILE}'")
+    if os.path.isdir(STUDENT_COMPILED_OUTPUT_DIR):
+        shutil.rmtree(STUDENT_COMPILED_OUTPUT_DIR)
+        removed.append(f"'{STUDENT_COMPILED_OUTPUT_DIR}/'")
+    return removed
+
+def load_training_data(dataset_file=DATASET_FILE):
+    """
+    The cleaned dataset from dataset_ingest.py (one CSV or a list, cached
+    as columns). Returns the full frame (with engineered features), the
+    first-time-mother frame (relabelled from the Bishop score, no engineered
+    features) and the label map.
+    """
+    df = load_dataset(dataset_file)
+    first_time = df.pop('first_time').to_numpy(dtype=bool)
+    first_time_del_type = df.pop('first_time_del_type')
+    df['target'] = df['del_type'].cat.codes.astype(np.int64)
+
+    first_time_df = df[first_time].copy()
+    first_time_df['del_type'] = first_time_del_type[first_time]
+    first_time_df['target'] = first_time_df['del_type'].cat.codes.astype(np.int64)
+
+    # Shared with ml_model.py so training and serving cannot drift apart
+    engineer_features(df)
+
+    return df, first_time_df, dict(LABEL_MAP)
+
+def build_model_A_matrix(df):
+    """Unscaled Model A feature matrix (one-hot, pipeline column order) and target."""
     X_all = df.drop(columns=['del_type', 'target'], errors='ignore')
     y_all = df['target']
 
-    cat_cols = X_all.select_dtypes(include=['object']).columns
+    cat_cols = X_all.select_dtypes(include=['object', 'category']).columns
     if len(cat_cols) > 0:
         X_all = pd.get_dummies(X_all, columns=cat_cols, drop_first=True)
 
+    # Build the matrix with the same compiled pipeline ml_model.py serves with
+    X_all = pd.DataFrame(
+        FeaturePipeline(X_all.columns).transform(X_all),
+        columns=X_all.columns, index=X_all.index
+    )
+
+    return X_all, y_all
+
+def build_model_B_matrix(first_time_df):
+    """Unscaled Model B feature matrix (no history columns) and target."""
+    MODEL_B_EXCLUDE_COLS = [
+        'del_type', 'target',
+        'prev_ceaserean', 'prev_vaginal_birth', 'prev_assisted',
+        'composite_risk'
+    ]
+
+    X_B_base = first_time_df.drop(columns=MODEL_B_EXCLUDE_COLS, errors='ignore')
+    y_B = first_time_df['target']
+
+    cat_cols_B = X_B_base.select_dtypes(include=['object', 'category']).columns
+    if len(cat_cols_B) > 0:
+        X_B_base = pd.get_dummies(X_B_base, columns=cat_cols_B, drop_first=True)
+
+    features = X_B_base.columns.tolist()
+    X_B_base = pd.DataFrame(
+        FeaturePipeline(features).transform(X_B_base),
+        columns=features, index=X_B_base.index
+    )
+
+    return X_B_base, y_B
+
+def drift_references(X_A, y_A, X_B, y_B, label_map):
+    """
+    What the serving drift monitor compares live traffic against (see
+    drift_monitor.py), from the unscaled training rows of each model.
+    """
+    names = {v: k.capitalize() for k, v in label_map.items()}
+    # Model A is trained on every mother, but serving sends first-time mothers to Model B
+    history = (X_A[['prev_ceaserean', 'prev_vaginal_birth', 'prev_assisted']] != 0).any(axis=1).to_numpy()
+    references = {}
+    for key, X, y in (('model_A', X_A[history], y_A[history]), ('model_B', X_B, y_B)):
+        # Breech and transverse patients are answered by the clinical rules, never the models
+        if 'fetal_presentation_cephalic' in X.columns:
+            cephalic = (X['fetal_presentation_cephalic'] == 1).to_numpy()
+            X, y = X[cephalic], y[cephalic]
+        references[key] = build_reference(X, y.map(names))
+    return references
+
+def run_model_training(plots=True, report_dir=REPORT_DIR, profile=DEFAULT_PROFILE, save=True, params=None,
+                       data_files=DATASET_FILE, calibration=DEFAULT_CALIBRATION, distill_student=False,
+                       accuracy_tolerance=distill.ACCURACY_TOLERANCE, auc_tolerance=distill.AUC_TOLERANCE):
+    """
+    Trains and (unless save=False) saves both models with the given
+    profile. Evaluation scores each test set once; metrics and fit times go
+    to `report_dir`/metrics.json and, unless plots=False, the charts are
+    rendered there as PNG files (no display needed).
+
+    `calibration` picks how the full profile calibrates Model A (see
+    CALIBRATION_MODES); Model A's artifact size, load time and latency go
+    to metrics.json next to its Brier score and reliability curve.
+
+    With distill_student=True a compact Model A is also fitted to the
+    ensemble's probabilities and saved as the student artifact, but only if
+    it is within the tolerances of the ensemble on the test split.
+    """
+    if profile not in TRAINING_PROFILES:
+        raise ValueError(f"Unknown training profile: {profile}")
+    if calibration not in CALIBRATION_MODES:
+        raise ValueError(f"Unknown calibration mode: {calibration}")
+    if profile == 'fast':
+        calibration = 'holdout'
+    params = params or load_hyperparameters()
+    timings = {}
+    started = time.perf_counter()
+
+    df, first_time_df, label_map = load_training_data(data_files)
+    X_all, y_all = build_model_A_matrix(df)
+
     scaler = StandardScaler()
     X_scaled_all = pd.DataFrame(scaler.fit_transform(X_all), columns=X_all.columns)
 
@@ -112,22 +273,40 @@ def run_model_training():
     )
 
     rf_A = RandomForestClassifier(
-        n_estimators=1300, max_depth=28, min_samples_split=2, 
-        min_samples_leaf=1, max_features='sqrt',
+        **params['model_A_rf'],
         class_weight='balanced', random_state=42, n_jobs=-1
     )
 
-    gb_A = GradientBoostingClassifier(
-        n_estimators=500, learning_rate=0.04, max_depth=6, 
-        subsample=0.9, random_state=42
+    gb_A = GradientBoostingClassifier(**params['model_A_gb'], random_state=42)
+
+    fit_started = time.perf_counter()
+    if profile == 'fast':
+        ensemble_A = create_fast_ensemble_model(
+            rf_A, X_train_A, y_train_A, params['model_A_hgb'], params['model_A_vote_weights']
+        )
+    elif calibration == 'holdout':
+        ensemble_A = create_holdout_ensemble_model(
+            rf_A, gb_A, X_train_A, y_train_A, params['model_A_vote_weights']
+        )
+    else:
+        ensemble_A = create_ensemble_model(rf_A, gb_A, params['model_A_vote_weights'])
+        ensemble_A.fit(X_train_A, y_train_A)
+    timings['fit_model_A_seconds'] = round(time.perf_counter() - fit_started, 2)
+    # Rows only the calibrators saw: incremental updates keep them out of new trees
+    calibration_rows_A = (
+        sorted(calibration_split(X_train_A, y_train_A)[1].index.tolist()) if calibration == 'holdout' else []
     )
 
-    ensemble_A = create_ensemble_model(rf_A, gb_A)
-    ensemble_A.fit(X_train_A, y_train_A)
-
-    acc_A = accuracy_score(y_test_A, ensemble_A.predict(X_test_A))
+    class_names = list(label_map.keys())
+    eval_A = evaluate(score_test_set(ensemble_A, X_test_A, y_test_A), class_names)
+    acc_A = eval_A['accuracy']
     print(f"\n🎯 Hybrid Ensemble (Model A) Overall Accuracy: {acc_A*100:.2f}%")
-    print(classification_report(y_test_A, ensemble_A.predict(X_test_A), target_names=list(label_map.keys()), digits=2))
+    print(eval_A['report_text'])
+
+    artifact_A = artifact_stats(ensemble_A, X_test_A)
+    print(f"📦 Model A ({calibration} calibration): {artifact_A['pickle_mb']} MB, "
+          f"loads in {artifact_A['load_seconds']} s, {artifact_A['single_row_ms']} ms per row; "
+          f"Brier {eval_A['brier']:.4f}, ECE {eval_A['reliability']['ece']:.4f}")
 
     # -----------------------------
     # FEATURE IMPORTANCE MODEL A
@@ -135,7 +314,7 @@ def run_model_training():
     rf_cal_model = ensemble_A.named_estimators_['rf']
     fitted_rf = rf_A
 
-    if hasattr(rf_cal_model, "calibrated_classifiers_"):
+    if calibration == 'cv' and hasattr(rf_cal_model, "calibrated_classifiers_"):
         fitted_rf = rf_cal_model.calibrated_classifiers_[0].estimator
 
     importances = pd.Series(fitted_rf.feature_importances_, index=X_all.columns)
@@ -146,19 +325,7 @@ def run_model_training():
     # ============================
     # TRAIN MODEL B (FIRST-TIME)
     # ============================
-    MODEL_B_EXCLUDE_COLS = [
-        'del_type', 'target',
-        'prev_ceaserean', 'prev_vaginal_birth', 'prev_assisted',
-        'composite_risk'
-    ]
-
-    X_B_base = first_time_df.drop(columns=MODEL_B_EXCLUDE_COLS, errors='ignore')
-    y_B = first_time_df['target']
-
-    cat_cols_B = X_B_base.select_dtypes(include=['object']).columns
-    if len(cat_cols_B) > 0:
-        X_B_base = pd.get_dummies(X_B_base, columns=cat_cols_B, drop_first=True)
-
+    X_B_base, y_B = build_model_B_matrix(first_time_df)
     MODEL_B_TRAINING_FEATURES = X_B_base.columns.tolist()
 
     scaler_B = StandardScaler()
@@ -169,19 +336,21 @@ def run_model_training():
     )
 
     model_B = RandomForestClassifier(
-        n_estimators=1000,
-        max_depth=15,
-        min_samples_split=2,
-        min_samples_leaf=1,
+        **params['model_B_rf'],
         class_weight='balanced',
-        random_state=42
+        random_state=42,
+        # The fast profile builds the trees on every core
+        n_jobs=-1 if profile == 'fast' else None
     )
 
+    fit_started = time.perf_counter()
     model_B.fit(X_B_train, y_B_train)
+    timings['fit_model_B_seconds'] = round(time.perf_counter() - fit_started, 2)
 
-    acc_B = accuracy_score(y_B_test, model_B.predict(X_B_test))
+    eval_B = evaluate(score_test_set(model_B, X_B_test, y_B_test), class_names)
+    acc_B = eval_B['accuracy']
     print(f"\n🎯 First-time mother model (Model B) Test Accuracy: {acc_B*100:.2f}%")
-    print(classification_report(y_B_test, model_B.predict(X_B_test), target_names=list(label_map.keys()), digits=2))
+    print(eval_B['report_text'])
 
     importances_B = pd.Series(model_B.feature_importances_, index=X_B_base.columns)
     top10_B = importances_B.sort_values(ascending=False).head(10)
@@ -192,7 +361,7 @@ def run_model_training():
     # ============================
     # SAVE MODEL
     # ============================
-    joblib.dump({
+    model_data = {
         'model': ensemble_A,
         'scaler': scaler,
         'features': X_all.columns.tolist(),
@@ -201,103 +370,247 @@ def run_model_training():
         'first_time_model': model_B,
         'first_time_scaler': scaler_B,
         'first_time_features': MODEL_B_TRAINING_FEATURES,
-    }, MODEL_OUTPUT_FILE)
-
-    print(f"\n💾 DUAL Model saved as '{MODEL_OUTPUT_FILE}'")
+        # Read by incremental_update.py: dataset rows seen and the held-out rows
+        'version': 1,
+        'training_state': {
+            'n_rows': len(df),
+            'model_A': {'test_rows': X_test_A.index.tolist(), 'calibration_rows': calibration_rows_A},
+            'model_B': {'test_rows': first_time_df.index[X_B_test.index].tolist(), 'calibration_rows': []},
+        },
+        'drift_reference': drift_references(
+            X_all.iloc[X_train_A.index], y_all.iloc[X_train_A.index],
+            X_B_base.iloc[X_B_train.index], y_B.iloc[X_B_train.index], label_map,
+        ),
+    }
+    if save:
+        joblib.dump(model_data, MODEL_OUTPUT_FILE)
+
+        print(f"\n💾 DUAL Model saved as '{MODEL_OUTPUT_FILE}'")
+
+        # Flattened tree arrays that ml_model.py serves from
+        export_compiled_artifact(model_data, COMPILED_MODEL_OUTPUT_DIR)
+        print(f"💾 Compiled model saved as '{COMPILED_MODEL_OUTPUT_DIR}/'")
 
     # ======================================================
-    # 📊📊📊 GRAPHICAL & CHART REPRESENTATION SECTION
+    # DISTILLED MODEL A (student)
     # ======================================================
+    if distill_student:
+        print("\n🧪 Distilling Model A into a compact student...")
+        fit_started = time.perf_counter()
+        student, n_student_rows = distill.distill_model(
+            ensemble_A, scaler, X_all.iloc[X_train_A.index], params['model_A_student']
+        )
+        fit_seconds = time.perf_counter() - fit_started
+        timings['fit_student_seconds'] = round(fit_seconds, 2)
+
+        eval_student = evaluate(score_test_set(student, X_test_A, y_test_A), class_names)
+        gate = distill.passes_gate(eval_A, eval_student, accuracy_tolerance, auc_tolerance)
+        distillation = distill.distillation_report(
+            ensemble_A, student, eval_A, eval_student, X_test_A, gate, n_student_rows, fit_seconds
+        )
+        distillation['tolerances'] = {'accuracy': accuracy_tolerance, 'macro_auc': auc_tolerance}
+        distill.print_report(distillation)
+
+        os.makedirs(report_dir, exist_ok=True)
+        distillation_path = os.path.join(report_dir, distill.DISTILLATION_REPORT_FILE)
+        with open(distillation_path, "w") as f:
+            json.dump(distillation, f, indent=2)
+        print(f"📄 Distillation report saved as '{distillation_path}'")
+
+        if save and distillation['passed']:
+            # Same artifact layout as the teacher; Model B is shared unchanged
+            student_data = dict(model_data, model=student)
+            joblib.dump(student_data, STUDENT_MODEL_OUTPUT_FILE)
+            export_compiled_artifact(student_data, STUDENT_COMPILED_OUTPUT_DIR)
+            print(f"💾 Student model saved as '{STUDENT_MODEL_OUTPUT_FILE}' and '{STUDENT_COMPILED_OUTPUT_DIR}/'")
+        elif save:
+            # A student of an earlier teacher must not keep serving next to the new one
+            removed = remove_student_artifacts()
+            print("⚠️  Student not saved" + (f"; removed the previous {' and '.join(removed)}" if removed else ""))
 
-    # 1. DELIVERY TYPE DISTRIBUTION
-    plt.figure(figsize=(6,5))
-    df['del_type'].value_counts().plot(kind='bar')
-    plt.title("Distribution of Delivery Types")
-    plt.xlabel("Delivery Type")
-    plt.ylabel("Count")
-    plt.tight_layout()
-    plt.show()
-
-    # 2. CONFUSION MATRIX (MODEL A)
-    plt.figure(figsize=(6,5))
-    ConfusionMatrixDisplay.from_predictions(
-        y_test_A, ensemble_A.predict(X_test_A),
-        display_labels=list(label_map.keys())
-    )
-    plt.title("Confusion Matrix – Model A")
-    plt.tight_layout()
-    plt.show()
-
-    # 3. ROC CURVE
-    y_test_bin = label_binarize(y_test_A, classes=[0,1,2])
-    y_score = ensemble_A.predict_proba(X_test_A)
-
-    plt.figure(figsize=(8,6))
-    colors = cycle(['black','gray','silver'])
-    class_names = list(label_map.keys())
-
-    for i, color in zip(range(3), colors):
-        fpr, tpr, _ = roc_curve(y_test_bin[:, i], y_score[:, i])
-        roc_auc = auc(fpr, tpr)
-        plt.plot(fpr, tpr, label=f"{class_names[i]} (AUC={roc_auc:.2f})")
-
-    plt.plot([0,1], [0,1], linestyle="--")
-    plt.xlabel("False Positive Rate")
-    plt.ylabel("True Positive Rate")
-    plt.title("ROC Curve – Model A")
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-    # 4. FEATURE IMPORTANCE MODEL A
-    plt.figure(figsize=(8,5))
-    plt.barh(top10.index, top10.values)
-    plt.title("Top 10 Important Features – Model A")
-    plt.xlabel("Importance Score")
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    plt.show()
-
-    # 5. FEATURE IMPORTANCE MODEL B
-    plt.figure(figsize=(8,5))
-    plt.barh(top10_B.index, top10_B.values)
-    plt.title("Top 10 Important Features – Model B")
-    plt.xlabel("Importance Score")
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    plt.show()
-
-    # 6. ACCURACY COMPARISON
-    plt.figure(figsize=(6,5))
-    models = ['Model A', 'Model B']
-    accuracies = [acc_A*100, acc_B*100]
-    plt.bar(models, accuracies)
-    plt.ylabel("Accuracy (%)")
-    plt.title("Model Accuracy Comparison")
-    plt.tight_layout()
-    plt.show()
-
-    # 7. BISHOP SCORE VS DELIVERY TYPE
-    plt.figure(figsize=(7,5))
-    plt.scatter(df['bishop_score'], df['target'])
-    plt.title("Bishop Score vs Delivery Outcome")
-    plt.xlabel("Bishop Score")
-    plt.ylabel("Delivery Type (0=Normal,1=Cesarean,2=Forceps)")
-    plt.tight_layout()
-    plt.show()
-
-    # 8. BMI VS DELIVERY TYPE
-    plt.figure(figsize=(7,5))
-    plt.scatter(df['bmi'], df['target'])
-    plt.title("BMI vs Delivery Outcome")
-    plt.xlabel("BMI")
-    plt.ylabel("Delivery Type (0=Normal,1=Cesarean,2=Forceps)")
-    plt.tight_layout()
-    plt.show()
+    # ======================================================
+    # 📊📊📊 REPORT: METRICS & CHARTS
+    # ======================================================
+    evaluations = {'model_A': eval_A, 'model_B': eval_B}
+    timings['total_seconds'] = round(time.perf_counter() - started, 2)
+    run_info = {'profile': profile, 'calibration': calibration, 'hyperparameters': params, 'timings': timings,
+                'artifact_A': artifact_A, 'n_train_A': len(X_train_A), 'n_train_B': len(X_B_train)}
+    print(f"📄 Metrics saved as '{write_metrics(evaluations, report_dir, run_info)}'")
+
+    if plots:
+        specs = figure_specs(
+            report_dir, df['del_type'].value_counts(), evaluations,
+            {'model_A': top10, 'model_B': top10_B}, class_names,
+            df['bishop_score'], df['bmi'], df['target'],
+        )
+        render_figures(specs)
+        print(f"📊 {len(specs)} charts saved in '{report_dir}/'")
 
     return acc_A 
 
+# ======================================================
+# PROFILE COMPARISON
+# ======================================================
+
+def _process_tree_rss_kb(pid):
+    """Resident memory of `pid` and all its descendants (joblib/loky workers included)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+def _train_isolated(name, args, run_dir):
+    """
+    Runs this script with `args` in its own process (nothing is saved).
+    Returns (wall seconds, peak KB of the process tree, its metrics.json).
+    """
+    import subprocess
+
+    command = [sys.executable, os.path.abspath(__file__), *args,
+               "--no-plots", "--no-save", "--report-dir", run_dir]
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    peak_kb = 0
+    while proc.poll() is None:
+        peak_kb = max(peak_kb, _process_tree_rss_kb(proc.pid))
+        time.sleep(0.2)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"Training run '{name}' failed with exit code {proc.returncode}")
+
+    with open(os.path.join(run_dir, 'metrics.json')) as f:
+        return wall, peak_kb, json.load(f)
+
+def _input_args(params_file=None, data_files=None):
+    """--params/--data for a _train_isolated run, so comparisons train what a normal run would."""
+    args = ["--params", params_file] if params_file else []
+    return args + (["--data", *data_files] if data_files else [])
+
+def compare_profiles(report_dir=REPORT_DIR, profiles=TRAINING_PROFILES, params_file=None, data_files=None):
+    """
+    Trains every profile in its own process (nothing is saved) and reports
+    wall time, peak memory of the process tree and test accuracy/AUC side by side.
+    """
+    comparison = {}
+    for profile in profiles:
+        wall, peak_kb, metrics = _train_isolated(
+            profile, ["--profile", profile] + _input_args(params_file, data_files),
+            os.path.join(report_dir, f"profile_{profile}")
+        )
+        comparison[profile] = {
+            'wall_seconds': round(wall, 1),
+            'peak_rss_mb': round(peak_kb / 1024, 1),
+            'timings': metrics['run']['timings'],
+            'model_A_accuracy': metrics['model_A']['accuracy'],
+            'model_A_auc': metrics['model_A']['auc'],
+            'model_A_macro_auc': float(np.mean(list(metrics['model_A']['auc'].values()))),
+            'model_B_accuracy': metrics['model_B']['accuracy'],
+            'model_B_macro_auc': float(np.mean(list(metrics['model_B']['auc'].values()))),
+        }
+
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, PROFILE_COMPARISON_FILE)
+    with open(path, "w") as f:
+        json.dump(comparison, f, indent=2)
+
+    print(f"\n{'profile':<8} {'wall s':>8} {'fit A s':>8} {'peak MB':>8} {'acc A':>7} {'AUC A':>7} {'acc B':>7} {'AUC B':>7}")
+    for profile, row in comparison.items():
+        print(f"{profile:<8} {row['wall_seconds']:>8.1f} {row['timings']['fit_model_A_seconds']:>8.1f} "
+              f"{row['peak_rss_mb']:>8.1f} {row['model_A_accuracy']*100:>6.2f}% {row['model_A_macro_auc']:>7.4f} "
+              f"{row['model_B_accuracy']*100:>6.2f}% {row['model_B_macro_auc']:>7.4f}")
+    print(f"\n📄 Comparison saved as '{path}'")
+    return comparison
+
+def compare_calibration(report_dir=REPORT_DIR, modes=CALIBRATION_MODES, params_file=None, plots=True,
+                        data_files=None):
+    """
+    Trains the full profile once per calibration mode in its own process and
+    reports Model A's artifact size, load time and predict latency next to
+    its accuracy, Brier score and reliability (ECE) on the test split.
+    """
+    comparison = {}
+    for mode in modes:
+        args = ["--profile", "full", "--calibration", mode] + _input_args(params_file, data_files)
+        wall, peak_kb, metrics = _train_isolated(mode, args, os.path.join(report_dir, f"calibration_{mode}"))
+        comparison[mode] = {
+            'wall_seconds': round(wall, 1),
+            'peak_rss_mb': round(peak_kb / 1024, 1),
+            'fit_model_A_seconds': metrics['run']['timings']['fit_model_A_seconds'],
+            **metrics['run']['artifact_A'],
+            'model_A_accuracy': metrics['model_A']['accuracy'],
+            'model_A_macro_auc': float(np.mean(list(metrics['model_A']['auc'].values()))),
+            'model_A_brier': metrics['model_A']['brier'],
+            'model_A_reliability': metrics['model_A']['reliability'],
+        }
+
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, CALIBRATION_COMPARISON_FILE)
+    with open(path, "w") as f:
+        json.dump(comparison, f, indent=2)
+
+    print(f"\n{'mode':<8} {'fit A s':>8} {'MB':>7} {'load s':>7} {'1-row ms':>9} {'test ms':>8} "
+          f"{'acc A':>7} {'AUC A':>7} {'Brier':>7} {'ECE':>7}")
+    for mode, row in comparison.items():
+        print(f"{mode:<8} {row['fit_model_A_seconds']:>8.1f} {row['pickle_mb']:>7.1f} {row['load_seconds']:>7.2f} "
+              f"{row['single_row_ms']:>9.1f} {row['test_set_ms']:>8.0f} {row['model_A_accuracy']*100:>6.2f}% "
+              f"{row['model_A_macro_auc']:>7.4f} {row['model_A_brier']:>7.4f} {row['model_A_reliability']['ece']:>7.4f}")
+    print(f"\n📄 Comparison saved as '{path}'")
+
+    if plots:
+        chart = render_figure({
+            'path': os.path.join(report_dir, 'calibration_comparison.png'),
+            'title': 'Reliability – Model A by calibration mode',
+            'kind': 'reliability',
+            'data': {'curves': {mode: row['model_A_reliability'] for mode, row in comparison.items()}},
+        })
+        print(f"📊 Reliability chart saved as '{chart}'")
+    return comparison
+
 
 if __name__ == "__main__":
-    acc = run_model_training()
+    parser = argparse.ArgumentParser(description="Train Model A and Model B")
+    parser.add_argument("--profile", choices=TRAINING_PROFILES, default=DEFAULT_PROFILE,
+                        help="'fast' uses histogram boosting with early stopping and holdout calibration")
+    parser.add_argument("--compare-profiles", action="store_true",
+                        help="train every profile without saving and compare time, memory and accuracy")
+    parser.add_argument("--calibration", choices=CALIBRATION_MODES, default=DEFAULT_CALIBRATION,
+                        help="full profile: 'holdout' fits each Model A base model once instead of cv=3")
+    parser.add_argument("--compare-calibration", action="store_true",
+                        help="train the full profile with every calibration mode and compare size, speed and calibration")
+    parser.add_argument("--no-save", action="store_true", help="train and evaluate only")
+    parser.add_argument("--data", nargs="+", default=[DATASET_FILE], help="training CSV file(s), read in order")
+    parser.add_argument("--params", help="JSON file of hyperparameter overrides (e.g. from tune_model.py)")
+    parser.add_argument("--no-plots", action="store_true", help="skip the charts (and the matplotlib import)")
+    parser.add_argument("--report-dir", default=REPORT_DIR, help="where metrics.json and the charts go")
+    parser.add_argument("--distill", action="store_true",
+                        help="also fit a compact Model A on the ensemble's probabilities (saved if within tolerance)")
+    parser.add_argument("--distill-accuracy-tolerance", type=float, default=distill.ACCURACY_TOLERANCE,
+                        help="max accuracy drop of the student vs the ensemble (fraction, default 0.01)")
+    parser.add_argument("--distill-auc-tolerance", type=float, default=distill.AUC_TOLERANCE,
+                        help="max macro AUC drop of the student vs the ensemble")
+    args = parser.parse_args()
+
+    if args.compare_profiles:
+        compare_profiles(args.report_dir, params_file=args.params, data_files=args.data)
+        sys.exit(0)
+    if args.compare_calibration:
+        compare_calibration(args.report_dir, params_file=args.params, plots=not args.no_plots,
+                            data_files=args.data)
+        sys.exit(0)
+
+    acc = run_model_training(plots=not args.no_plots, report_dir=args.report_dir,
+                             profile=args.profile, save=not args.no_save,
+                             params=load_hyperparameters(args.params), data_files=args.data,
+                             calibration=args.calibration,
+                             distill_student=args.distill,
+                             accuracy_tolerance=args.distill_accuracy_tolerance,
+                             auc_tolerance=args.distill_auc_tolerance)
     print(f"\n✅ Training complete! Hybrid (Model A) accuracy: {acc*100:.2f}%")
@@ -0,0 +1,255 @@
+import os
+import io
+import json
+import time
+import statistics
+import numpy as np
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_curve, auc
+from sklearn.preprocessing import label_binarize
+
+# --- Configuration ---
+REPORT_DIR = 'training_report'
+METRICS_FILENAME = 'metrics.json'
+FIGURE_DPI = 120
+# Equal-width confidence bins of the reliability curve
+RELIABILITY_BINS = 10
+# Single-row predict_proba calls timed for the artifact stats
+LATENCY_ROWS = 20
+
+# ======================================================
+# SCORING (each test set is scored exactly once)
+# ======================================================
+
+def score_test_set(model, X_test, y_test):
+    """
+    One predict_proba call; predictions are its argmax, which is what
+    predict() returns for the soft-voting ensemble and the forest.
+    """
+    proba = model.predict_proba(X_test)
+    classes = np.asarray(model.classes_)
+    return {
+        'y_true': np.asarray(y_test),
+        'proba': proba,
+        'pred': classes[np.argmax(proba, axis=1)],
+        'classes': classes,
+    }
+
+def reliability_curve(scored, n_bins=RELIABILITY_BINS):
+    """
+    Top-label reliability: rows binned by the predicted class's probability,
+    with the mean confidence and the accuracy per non-empty bin. 'ece' is
+    the row-weighted mean gap between the two.
+    """
+    confidence = scored['proba'].max(axis=1)
+    correct = scored['pred'] == scored['y_true']
+    bins = np.minimum((confidence * n_bins).astype(int), n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    filled = counts > 0
+    mean_confidence = np.bincount(bins, weights=confidence, minlength=n_bins)[filled] / counts[filled]
+    accuracy = np.bincount(bins, weights=correct, minlength=n_bins)[filled] / counts[filled]
+    return {
+        'confidence': mean_confidence,
+        'accuracy': accuracy,
+        'count': counts[filled],
+        'ece': float(np.sum(counts[filled] * np.abs(accuracy - mean_confidence)) / len(confidence)),
+    }
+
+def evaluate(scored, class_names):
+    """
+    Accuracy, classification report, confusion matrix, one-vs-rest ROC and
+    calibration (multi-class Brier score, reliability curve) from the cache.
+    """
+    y_true, pred, proba, classes = scored['y_true'], scored['pred'], scored['proba'], scored['classes']
+    y_bin = label_binarize(y_true, classes=classes)
+    if y_bin.shape[1] == 1:
+        y_bin = np.hstack([1 - y_bin, y_bin])
+    roc = {}
+    for i, name in enumerate(class_names):
+        fpr, tpr, _ = roc_curve(y_bin[:, i], proba[:, i])
+        roc[name] = {'fpr': fpr, 'tpr': tpr, 'auc': float(auc(fpr, tpr))}
+    return {
+        'accuracy': float(accuracy_score(y_true, pred)),
+        'report_text': classification_report(y_true, pred, target_names=class_names, digits=2),
+        'report': classification_report(y_true, pred, target_names=class_names, digits=2, output_dict=True),
+        'confusion_matrix': confusion_matrix(y_true, pred, labels=classes),
+        'roc': roc,
+        'brier': float(np.mean(np.sum((proba - y_bin) ** 2, axis=1))),
+        'reliability': reliability_curve(scored),
+    }
+
+def artifact_stats(model, X_test):
+    """
+    Serving cost of a fitted model: pickled size, unpickle time and
+    predict_proba latency for one row (median) and for the whole test set.
+    """
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    size = buffer.tell()
+
+    buffer.seek(0)
+    started = time.perf_counter()
+    joblib.load(buffer)
+    load_seconds = time.perf_counter() - started
+
+    single = []
+    for i in range(min(LATENCY_ROWS, len(X_test))):
+        started = time.perf_counter()
+        model.predict_proba(X_test.iloc[i:i + 1])
+        single.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    model.predict_proba(X_test)
+    batch_seconds = time.perf_counter() - started
+    return {
+        'pickle_mb': round(size / 1e6, 1),
+        'load_seconds': round(load_seconds, 2),
+        'single_row_ms': round(statistics.median(single) * 1000, 1),
+        'test_set_ms': round(batch_seconds * 1000, 1),
+        'test_rows': len(X_test),
+    }
+
+def metrics_summary(evaluations):
+    """JSON-ready view of evaluate() results keyed by model name."""
+    return {
+        name: {
+            'accuracy': result['accuracy'],
+            'auc': {label: curve['auc'] for label, curve in result['roc'].items()},
+            'classification_report': result['report'],
+            'confusion_matrix': result['confusion_matrix'].tolist(),
+            'brier': result['brier'],
+            'reliability': {key: np.asarray(value).tolist() if key != 'ece' else value
+                            for key, value in result['reliability'].items()},
+        }
+        for name, result in evaluations.items()
+    }
+
+def write_metrics(evaluations, report_dir=REPORT_DIR, run_info=None):
+    """Writes metrics.json; `run_info` (profile, fit times, ...) goes under 'run'."""
+    os.makedirs(report_dir, exist_ok=True)
+    summary = metrics_summary(evaluations)
+    if run_info is not None:
+        summary['run'] = run_info
+    path = os.path.join(report_dir, METRICS_FILENAME)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+# ======================================================
+# FIGURES (headless, one process per figure)
+# ======================================================
+
+def _bar(plt, data):
+    plt.figure(figsize=data.get('figsize', (6, 5)))
+    plt.bar(data['labels'], data['values'])
+    plt.xlabel(data.get('xlabel', ''))
+    plt.ylabel(data['ylabel'])
+
+def _barh(plt, data):
+    plt.figure(figsize=(8, 5))
+    plt.barh(data['labels'], data['values'])
+    plt.xlabel("Importance Score")
+    plt.gca().invert_yaxis()
+
+def _confusion(plt, data):
+    from sklearn.metrics import ConfusionMatrixDisplay
+
+    display = ConfusionMatrixDisplay(data['matrix'], display_labels=data['labels'])
+    display.plot()
+
+def _roc(plt, data):
+    plt.figure(figsize=(8, 6))
+    for label, curve in data['curves'].items():
+        plt.plot(curve['fpr'], curve['tpr'], label=f"{label} (AUC={curve['auc']:.2f})")
+    plt.plot([0, 1], [0, 1], linestyle="--")
+    plt.xlabel("False Positive Rate")
+    plt.ylabel("True Positive Rate")
+    plt.legend()
+
+def _reliability(plt, data):
+    plt.figure(figsize=(6, 6))
+    for label, curve in data['curves'].items():
+        plt.plot(curve['confidence'], curve['accuracy'], marker="o", label=f"{label} (ECE={curve['ece']:.3f})")
+    plt.plot([0, 1], [0, 1], linestyle="--", color="gray")
+    plt.xlabel("Predicted probability of the chosen class")
+    plt.ylabel("Observed accuracy")
+    plt.legend()
+
+def _scatter(plt, data):
+    plt.figure(figsize=(7, 5))
+    plt.scatter(data['x'], data['y'])
+    plt.xlabel(data['xlabel'])
+    plt.ylabel("Delivery Type (0=Normal,1=Cesarean,2=Forceps)")
+
+_DRAW = {
+    'bar': _bar,
+    'barh': _barh,
+    'confusion': _confusion,
+    'roc': _roc,
+    'reliability': _reliability,
+    'scatter': _scatter,
+}
+
+def render_figure(spec):
+    """Draws one figure spec to its PNG file. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    _DRAW[spec['kind']](plt, spec['data'])
+    plt.title(spec['title'])
+    plt.tight_layout()
+    plt.savefig(spec['path'], dpi=FIGURE_DPI)
+    plt.close('all')
+    return spec['path']
+
+def figure_specs(report_dir, delivery_types, evaluations, top_features, class_names, bishop, bmi, target):
+    """The nine training charts as picklable specs (plain arrays only)."""
+    eval_A = evaluations['model_A']
+    specs = [
+        ('delivery_type_distribution.png', 'Distribution of Delivery Types', 'bar', {
+            'labels': list(delivery_types.index.astype(str)), 'values': delivery_types.values,
+            'xlabel': "Delivery Type", 'ylabel': "Count",
+        }),
+        ('confusion_matrix_model_A.png', 'Confusion Matrix – Model A', 'confusion', {
+            'matrix': eval_A['confusion_matrix'], 'labels': class_names,
+        }),
+        ('roc_curve_model_A.png', 'ROC Curve – Model A', 'roc', {'curves': eval_A['roc']}),
+        ('reliability_model_A.png', 'Reliability – Model A', 'reliability', {
+            'curves': {'Model A': eval_A['reliability']},
+        }),
+        ('feature_importance_model_A.png', 'Top 10 Important Features – Model A', 'barh', {
+            'labels': list(top_features['model_A'].index), 'values': top_features['model_A'].values,
+        }),
+        ('feature_importance_model_B.png', 'Top 10 Important Features – Model B', 'barh', {
+            'labels': list(top_features['model_B'].index), 'values': top_features['model_B'].values,
+        }),
+        ('accuracy_comparison.png', 'Model Accuracy Comparison', 'bar', {
+            'labels': ['Model A', 'Model B'],
+            'values': [evaluations['model_A']['accuracy'] * 100, evaluations['model_B']['accuracy'] * 100],
+            'ylabel': "Accuracy (%)",
+        }),
+        ('bishop_score_vs_delivery.png', 'Bishop Score vs Delivery Outcome', 'scatter', {
+            'x': np.asarray(bishop), 'y': np.asarray(target), 'xlabel': "Bishop Score",
+        }),
+        ('bmi_vs_delivery.png', 'BMI vs Delivery Outcome', 'scatter', {
+            'x': np.asarray(bmi), 'y': np.asarray(target), 'xlabel': "BMI",
+        }),
+    ]
+    return [
+        {'path': os.path.join(report_dir, filename), 'title': title, 'kind': kind, 'data': data}
+        for filename, title, kind, data in specs
+    ]
+
+def render_figures(specs, max_workers=None):
+    """Renders every spec to file in parallel; matplotlib state is per process."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not specs:
+        return []
+    os.makedirs(os.path.dirname(specs[0]['path']) or ".", exist_ok=True)
+    workers = max_workers or min(len(specs), os.cpu_count() or 1)
+    if workers <= 1:
+        return [render_figure(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_figure, specs))
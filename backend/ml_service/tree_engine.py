@@ -0,0 +1,664 @@
+import os
+import sys
+from math import factorial
+import numpy as np
+from typing import Dict, Any
+
+# --- Configuration ---
+# Bound the (rows x trees) cell arrays used during traversal
+MAX_TRAVERSAL_CELLS = 2_000_000
+
+# ======================================================
+# EXPORT: sklearn estimators -> plain NumPy arrays
+# ======================================================
+
+class _HistTree:
+    """
+    A HistGradientBoosting TreePredictor seen through the sklearn `Tree`
+    attributes _TreePool.pack reads. Its features are shifted by
+    `exact_offset`: these trees compare the float64 input, not the float32
+    copy DecisionTree-based models see.
+    """
+
+    def __init__(self, predictor, exact_offset):
+        nodes = predictor.nodes
+        if nodes['is_categorical'].any():
+            raise ValueError("Categorical HistGradientBoosting splits cannot be compiled.")
+        is_leaf = nodes['is_leaf'].astype(bool)
+        self.node_count = len(nodes)
+        self.children_left = np.where(is_leaf, -1, nodes['left'].astype(np.int64))
+        self.children_right = np.where(is_leaf, -1, nodes['right'].astype(np.int64))
+        self.feature = nodes['feature_idx'] + exact_offset
+        self.threshold = nodes['num_threshold']
+        # Only leaf values carry the learning rate (and the root has none),
+        # so inner nodes get the sample-weighted mean of their children, as
+        # in sklearn trees; predictions only ever read the leaves.
+        value = np.where(is_leaf, nodes['value'], 0.0)
+        count = nodes['count'].astype(np.float64)
+        for node in np.flatnonzero(~is_leaf)[::-1]:
+            left, right = self.children_left[node], self.children_right[node]
+            value[node] = (count[left] * value[left] + count[right] * value[right]) / (count[left] + count[right])
+        self.value = value.reshape(-1, 1, 1)
+
+class _TreePool:
+    """Collects every tree of one top-level model so they share one node pool."""
+
+    def __init__(self):
+        self.trees = []
+        self.normalize = []
+        self.exact_offset = 0
+
+    def add(self, trees, normalize):
+        start = len(self.trees)
+        self.trees.extend(trees)
+        self.normalize.extend([normalize] * len(trees))
+        return np.array([start, len(self.trees)], dtype=np.int64)
+
+    def pack(self):
+        """
+        Packs the collected sklearn `Tree` objects into contiguous node
+        arrays. Node ids are global. `children[2 * i]` is the right child of
+        node i and `children[2 * i + 1]` the left one, so a step is
+        children[2 * node + (x <= threshold)]. Leaves have feature -1.
+        `value` is kept for every node (not only leaves) so per-prediction
+        attributions can walk the same arrays.
+        """
+        trees = self.trees
+        offsets = np.cumsum([0] + [t.node_count for t in trees])
+        n_nodes = int(offsets[-1])
+        n_outputs = max(t.value.shape[-1] for t in trees)
+
+        feature = np.empty(n_nodes, dtype=np.int32)
+        threshold = np.empty(n_nodes, dtype=np.float64)
+        children = np.empty(2 * n_nodes, dtype=np.int32)
+        value = np.zeros((n_nodes, n_outputs), dtype=np.float64)
+
+        for tree, normalize, start in zip(trees, self.normalize, offsets[:-1]):
+            end = start + tree.node_count
+            node_ids = np.arange(start, end, dtype=np.int32)
+            is_leaf = tree.children_left == -1
+
+            feature[start:end] = np.where(is_leaf, -1, tree.feature)
+            threshold[start:end] = np.where(is_leaf, np.inf, tree.threshold)
+            children[2 * start:2 * end:2] = np.where(is_leaf, node_ids, tree.children_right + start)
+            children[2 * start + 1:2 * end:2] = np.where(is_leaf, node_ids, tree.children_left + start)
+
+            tree_value = tree.value[:, 0, :].astype(np.float64)
+            if normalize:
+                # Class fractions, as DecisionTreeClassifier.predict_proba reports them
+                normalizer = tree_value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                tree_value = tree_value / normalizer
+            value[start:end, :tree_value.shape[1]] = tree_value
+
+        return {
+            'roots': offsets[:-1].astype(np.int32),
+            'feature': feature,
+            'threshold': threshold,
+            'children': children,
+            'value': value,
+            # > 0 when some trees read the exact float64 columns (see tree_leaves)
+            'exact_offset': np.int64(self.exact_offset),
+        }
+
+def _export_forest(forest, pool):
+    return {
+        'kind': 'forest',
+        'classes': np.asarray(forest.classes_),
+        'trees': pool.add([est.tree_ for est in forest.estimators_], normalize=True),
+    }
+
+def _export_gradient_boosting(gb, pool):
+    n_stages, n_per_stage = gb.estimators_.shape
+    # The init estimator (class prior) contributes the same raw score to every row
+    init = gb._raw_predict_init(np.zeros((1, gb.n_features_in_), dtype=np.float32))[0]
+    return {
+        'kind': 'gradient_boosting',
+        'classes': np.asarray(gb.classes_),
+        'init': np.asarray(init, dtype=np.float64),
+        'learning_rate': float(gb.learning_rate),
+        'n_per_stage': int(n_per_stage),
+        # Stage-major order: tree (stage * n_per_stage + k) feeds raw score k
+        'trees': pool.add([est.tree_ for est in gb.estimators_.ravel()], normalize=False),
+    }
+
+def _export_hist_gradient_boosting(hgb, pool):
+    # Missing values never reach serving (inputs default to 0), so only the
+    # numeric threshold is kept
+    pool.exact_offset = int(hgb.n_features_in_)
+    trees = [_HistTree(predictor, pool.exact_offset) for stage in hgb._predictors for predictor in stage]
+    return {
+        'kind': 'hist_gradient_boosting',
+        'classes': np.asarray(hgb.classes_),
+        'init': np.asarray(hgb._baseline_prediction, dtype=np.float64).ravel(),
+        # Leaf values already include the learning rate
+        'learning_rate': 1.0,
+        'n_per_stage': int(hgb.n_trees_per_iteration_),
+        'trees': pool.add(trees, normalize=False),
+    }
+
+def _export_calibrator(calibrator):
+    if hasattr(calibrator, 'X_thresholds_'):
+        return {
+            'kind': 'isotonic',
+            'x': np.asarray(calibrator.X_thresholds_, dtype=np.float64),
+            'y': np.asarray(calibrator.y_thresholds_, dtype=np.float64),
+        }
+    if hasattr(calibrator, 'a_'):
+        return {'kind': 'sigmoid', 'a': float(calibrator.a_), 'b': float(calibrator.b_)}
+    raise ValueError(f"Unsupported calibrator: {type(calibrator).__name__}")
+
+def _export_calibrated(calibrated, pool):
+    members = []
+    for member in calibrated.calibrated_classifiers_:
+        estimator = member.estimator
+        members.append({
+            'base': _export(estimator, pool),
+            'class_index': np.searchsorted(member.classes, estimator.classes_),
+            'calibrators': [_export_calibrator(c) for c in member.calibrators],
+        })
+    return {
+        'kind': 'calibrated',
+        'classes': np.asarray(calibrated.classes_),
+        'members': members,
+    }
+
+def _export_voting(voting, pool):
+    if voting.voting != 'soft':
+        raise ValueError("Only soft voting can be compiled.")
+    weights = voting.weights
+    if weights is None:
+        weights = [1.0] * len(voting.estimators_)
+    return {
+        'kind': 'voting',
+        'classes': np.asarray(voting.classes_),
+        'weights': np.asarray(weights, dtype=np.float64),
+        'members': [_export(est, pool) for est in voting.estimators_],
+    }
+
+_EXPORTERS = {
+    'VotingClassifier': _export_voting,
+    'CalibratedClassifierCV': _export_calibrated,
+    'RandomForestClassifier': _export_forest,
+    'ExtraTreesClassifier': _export_forest,
+    'GradientBoostingClassifier': _export_gradient_boosting,
+    'HistGradientBoostingClassifier': _export_hist_gradient_boosting,
+    # Holdout calibration wraps the already fitted model
+    'FrozenEstimator': lambda frozen, pool: _export(frozen.estimator, pool),
+}
+
+def _export(estimator, pool):
+    name = type(estimator).__name__
+    if name not in _EXPORTERS:
+        raise ValueError(f"Unsupported estimator for the compiled engine: {name}")
+    return _EXPORTERS[name](estimator, pool)
+
+def export_estimator(estimator):
+    """
+    Flattens a fitted estimator into a nested dict of NumPy arrays. All of
+    its trees (e.g. Model A's three forests and three boosters) live in one
+    node pool under 'pool', so a prediction is a single traversal.
+    """
+    pool = _TreePool()
+    spec = _export(estimator, pool)
+    spec['pool'] = pool.pack()
+    return spec
+
+def _export_scaler(scaler):
+    return {
+        'mean_': np.asarray(scaler.mean_, dtype=np.float64),
+        'scale_': np.asarray(scaler.scale_, dtype=np.float64),
+    }
+
+def compile_model_artifact(model_data: Dict[str, Any]):
+    """Builds the compiled artifact from the dict saved by train_model.py."""
+    return {
+        'model': export_estimator(model_data['model']),
+        'scaler': _export_scaler(model_data['scaler']),
+        'features': list(model_data['features']),
+        'label_map': dict(model_data['label_map']),
+        'top_features_A': dict(model_data.get('top_features_A', {})),
+        'first_time_model': export_estimator(model_data['first_time_model']),
+        'first_time_scaler': _export_scaler(model_data['first_time_scaler']),
+        'first_time_features': list(model_data['first_time_features']),
+        'drift_reference': model_data.get('drift_reference'),
+    }
+
+# ======================================================
+# RUNTIME: evaluate the arrays
+# ======================================================
+
+def tree_leaves(pool, X):
+    """
+    Leaf node id reached by every row in every tree, shape (n_rows, n_trees).
+    Works on the flat (row, tree) cells still inside a tree; finished cells
+    are dropped once they are a quarter of the active set, so deep and
+    shallow trees mostly cost their own path length.
+    """
+    # sklearn trees compare float32 features against float64 thresholds;
+    # HistGradientBoosting trees read the float64 copy appended after them
+    X_exact = np.asarray(X, dtype=np.float64)
+    X = X_exact.astype(np.float32).astype(np.float64)
+    if int(pool.get('exact_offset', 0)):
+        X = np.hstack([X, X_exact])
+    n_rows, n_features = X.shape
+    roots = pool['roots']
+    feature, threshold, children = pool['feature'], pool['threshold'], pool['children']
+    n_trees = len(roots)
+
+    X_flat = X.ravel()
+    leaves = np.empty(n_rows * n_trees, dtype=np.int32)
+    cell = np.arange(n_rows * n_trees)
+    node = np.tile(roots, n_rows)
+    offset = np.repeat(np.arange(n_rows) * n_features, n_trees)
+
+    while cell.size:
+        split = np.take(feature, node)
+        done = split < 0
+        n_done = np.count_nonzero(done)
+        if n_done == cell.size:
+            leaves[cell] = node
+            break
+        if n_done * 4 > cell.size:
+            leaves[cell[done]] = node[done]
+            active = ~done
+            cell, node, offset, split = cell[active], node[active], offset[active], split[active]
+        elif n_done:
+            # Leaves loop onto themselves (threshold +inf), so they can ride along
+            split = np.maximum(split, 0)
+        go_left = np.take(X_flat, offset + split) <= np.take(threshold, node)
+        node = np.take(children, 2 * node + go_left)
+
+    return leaves.reshape(n_rows, n_trees)
+
+def iter_tree_leaves(pool, X):
+    """Yields (row_slice, leaves) in row chunks so the cell arrays stay bounded."""
+    chunk = max(1, MAX_TRAVERSAL_CELLS // max(1, len(pool['roots'])))
+    for start in range(0, X.shape[0], chunk):
+        rows = slice(start, min(start + chunk, X.shape[0]))
+        yield rows, tree_leaves(pool, X[rows])
+
+def _tree_slice(spec):
+    start, stop = spec['trees']
+    return slice(int(start), int(stop))
+
+def _forest_proba(spec, pool, leaves):
+    n_classes = len(spec['classes'])
+    return pool['value'][leaves[:, _tree_slice(spec)], :n_classes].mean(axis=1)
+
+def _gradient_boosting_raw(spec, pool, leaves):
+    n_per_stage = spec['n_per_stage']
+    per_tree = pool['value'][leaves[:, _tree_slice(spec)], 0]
+    per_stage = per_tree.reshape(per_tree.shape[0], -1, n_per_stage)
+    return spec['init'] + spec['learning_rate'] * per_stage.sum(axis=1)
+
+def _softmax(raw):
+    raw = raw - raw.max(axis=1, keepdims=True)
+    np.exp(raw, out=raw)
+    raw /= raw.sum(axis=1, keepdims=True)
+    return raw
+
+def _gradient_boosting_proba(spec, pool, leaves):
+    return _raw_to_proba(_gradient_boosting_raw(spec, pool, leaves))
+
+def _raw_to_proba(raw):
+    if raw.shape[1] == 1:
+        positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+        return np.column_stack([1.0 - positive, positive])
+    return _softmax(raw)
+
+def _decision_values(spec, pool, leaves):
+    """The response CalibratedClassifierCV calibrates: decision_function if the model has one."""
+    if spec['kind'] in ('gradient_boosting', 'hist_gradient_boosting'):
+        return _gradient_boosting_raw(spec, pool, leaves)
+    return _PROBA[spec['kind']](spec, pool, leaves)
+
+def _apply_calibrator(calibrator, values):
+    if calibrator['kind'] == 'isotonic':
+        x = calibrator['x']
+        return np.interp(np.clip(values, x[0], x[-1]), x, calibrator['y'])
+    return 1.0 / (1.0 + np.exp(calibrator['a'] * values + calibrator['b']))
+
+def _calibrated_proba(spec, pool, leaves):
+    n_rows = leaves.shape[0]
+    n_classes = len(spec['classes'])
+    total = np.zeros((n_rows, n_classes))
+
+    for member in spec['members']:
+        total += _calibrate(member, _decision_values(member['base'], pool, leaves), n_classes)
+
+    return total / len(spec['members'])
+
+def _calibrate(member, predictions, n_classes):
+    """One calibrated member's probabilities from its base model's decision values."""
+    proba = np.zeros((predictions.shape[0], n_classes))
+    for class_idx, this_pred, calibrator in zip(
+        member['class_index'], predictions.T, member['calibrators']
+    ):
+        if n_classes == 2:
+            class_idx += 1
+        proba[:, class_idx] = _apply_calibrator(calibrator, this_pred)
+
+    # Same normalisation as sklearn's _CalibratedClassifier.predict_proba
+    if n_classes == 2:
+        proba[:, 0] = 1.0 - proba[:, 1]
+    else:
+        denominator = proba.sum(axis=1)[:, np.newaxis]
+        uniform_proba = np.full_like(proba, 1 / n_classes)
+        proba = np.divide(proba, denominator, out=uniform_proba, where=denominator != 0)
+    proba[(1.0 < proba) & (proba <= 1.0 + 1e-5)] = 1.0
+    return proba
+
+def _voting_proba(spec, pool, leaves):
+    probas = [_PROBA[member['kind']](member, pool, leaves) for member in spec['members']]
+    return np.average(probas, axis=0, weights=spec['weights'])
+
+_PROBA = {
+    'forest': _forest_proba,
+    'gradient_boosting': _gradient_boosting_proba,
+    'hist_gradient_boosting': _gradient_boosting_proba,
+    'calibrated': _calibrated_proba,
+    'voting': _voting_proba,
+}
+
+def predict_proba(spec, X):
+    """Class probabilities for a compiled top-level model, one row or a batch."""
+    X = np.asarray(X)
+    pool = spec['pool']
+    proba = np.empty((X.shape[0], len(spec['classes'])))
+    for rows, leaves in iter_tree_leaves(pool, X):
+        proba[rows] = _PROBA[spec['kind']](spec, pool, leaves)
+    return proba
+
+# ======================================================
+# ATTRIBUTIONS: per-prediction path contributions
+# ======================================================
+# Every tree output telescopes along its decision path: value[root] plus,
+# for each split on the way down, value[child] - value[parent] credited to
+# the split's feature. Summed per base model this is exact in the model's
+# own output space (class fractions for forests, raw scores for boosters).
+# Where a link follows (softmax, calibrators), the probability change is
+# shared out along those exact contributions (see _link_attribution), so the
+# baseline plus the contributions always equals the predicted probability.
+
+def _collect_bases(spec, bases):
+    if spec['kind'] in ('forest', 'gradient_boosting', 'hist_gradient_boosting'):
+        bases.append(spec)
+    else:
+        for member in spec['members']:
+            _collect_bases(member['base'] if spec['kind'] == 'calibrated' else member, bases)
+    return bases
+
+def attribution_layout(spec):
+    """
+    Per-model arrays the attribution walk needs, built once: every node's
+    parent (roots are their own parent), and per base model its tree
+    range, tree weight, raw score columns and baseline output.
+    """
+    pool = spec['pool']
+    children = np.asarray(pool['children'])
+    parent = np.arange(len(pool['feature']), dtype=np.int32)
+    nodes = np.flatnonzero(np.asarray(pool['feature']) >= 0).astype(np.int32)
+    parent[children[2 * nodes]] = nodes
+    parent[children[2 * nodes + 1]] = nodes
+
+    value = pool['value']
+    base_specs = _collect_bases(spec, [])
+    # A pool of boosters alone has one value column but n_per_stage raw scores
+    n_outputs = max([value.shape[1]] + [base['n_per_stage'] for base in base_specs if 'n_per_stage' in base])
+    groups, bases, bias = {}, [], []
+    for group, base in enumerate(base_specs):
+        trees = _tree_slice(base)
+        roots = np.asarray(pool['roots'][trees])
+        groups[id(base)] = group
+        base_bias = np.zeros(n_outputs)
+        if base['kind'] == 'forest':
+            bases.append((trees, 1.0 / len(roots), None))
+            base_bias[:value.shape[1]] = value[roots].mean(axis=0)
+            bias.append(base_bias)
+        else:
+            n_per_stage = base['n_per_stage']
+            # Stage-major order: tree t feeds raw score t % n_per_stage
+            bases.append((trees, base['learning_rate'], n_per_stage))
+            base_bias[:n_per_stage] = base['init'] + base['learning_rate'] * (
+                value[roots, 0].reshape(-1, n_per_stage).sum(axis=0)
+            )
+            bias.append(base_bias)
+    return {
+        'parent': parent, 'groups': groups, 'bases': bases, 'bias': np.array(bias),
+        # Booster trees only use the first value column
+        'raw_value': np.ascontiguousarray(value[:, 0]),
+    }
+
+def path_contributions(pool, layout, leaves, n_features):
+    """
+    Walks every (row, tree) path from its leaf back to the root and sums
+    the weighted value changes per base model, row, feature and output:
+    shape (n_groups, n_rows, n_features, n_outputs).
+    """
+    n_rows = leaves.shape[0]
+    n_groups, n_outputs = layout['bias'].shape
+    parent, feature, value = layout['parent'], pool['feature'], pool['value']
+    exact_offset = int(pool.get('exact_offset', 0))
+    contributions = np.zeros((n_groups, n_rows * n_features * n_outputs))
+
+    for group, (trees, weight, n_per_stage) in enumerate(layout['bases']):
+        node = leaves[:, trees].ravel()
+        n_trees = node.size // max(n_rows, 1)
+        cell_base = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        if n_per_stage is None:
+            outputs = np.arange(value.shape[1])
+            node_value = value
+        else:
+            # Booster trees feed a single raw score column
+            column = np.tile(np.arange(n_trees) % n_per_stage, n_rows)
+            node_value = layout['raw_value']
+        acc = contributions[group]
+
+        while node.size:
+            up = np.take(parent, node)
+            done = up == node
+            n_done = np.count_nonzero(done)
+            if n_done == node.size:
+                break
+            if n_done * 4 > node.size:
+                active = ~done
+                node, up, cell_base = node[active], up[active], cell_base[active]
+                if n_per_stage is not None:
+                    column = column[active]
+            # Finished paths ride along at their root with a zero change
+            split = np.maximum(np.take(feature, up), 0)
+            if exact_offset:
+                split = np.where(split >= exact_offset, split - exact_offset, split)
+            delta = np.take(node_value, node, axis=0) - np.take(node_value, up, axis=0)
+            index = (cell_base + split) * n_outputs
+            if n_per_stage is None:
+                acc += np.bincount((index[:, np.newaxis] + outputs).ravel(),
+                                   weights=delta.ravel(), minlength=acc.size)
+            else:
+                acc += np.bincount(index + column, weights=delta, minlength=acc.size)
+            node = up
+        acc *= weight
+    return contributions.reshape(n_groups, n_rows, n_features, n_outputs)
+
+def _link_attribution(link, values, bias, contributions):
+    """
+    Shares link(values) - link(bias) across features. The change is first
+    split across the decision columns by their Shapley values (2^k link
+    calls for k columns, k <= 3 here), then each column's part across the
+    features in proportion to their contributions to that column. A
+    feature's share is its own contribution times the link's average slope,
+    so features whose contributions cancel never get inflated shares.
+    """
+    n_rows, n_columns = values.shape
+    bias = np.broadcast_to(bias, values.shape)
+    masks = (np.arange(2 ** n_columns)[:, np.newaxis] >> np.arange(n_columns)) & 1
+    outputs = [link(np.where(mask.astype(bool), values, bias)) for mask in masks]
+    weights = [factorial(n) * factorial(n_columns - n - 1) / factorial(n_columns) for n in range(n_columns)]
+
+    change = np.zeros((n_rows, n_columns, outputs[0].shape[1]))
+    for m, mask in enumerate(masks):
+        for column in np.flatnonzero(mask == 0):
+            change[:, column] += weights[mask.sum()] * (outputs[m | (1 << column)] - outputs[m])
+
+    total = contributions.sum(axis=1, keepdims=True)
+    magnitude = np.abs(contributions)
+    degenerate = np.abs(total) <= 1e-12
+    shares = np.where(degenerate, magnitude, contributions)
+    total = np.where(degenerate, magnitude.sum(axis=1, keepdims=True), total)
+    shares = np.divide(shares, total, out=np.zeros_like(shares), where=total != 0.0)
+    return np.einsum('rfc,rck->rfk', shares, change)
+
+def _decision_attribution(spec, pool, leaves, layout, raw):
+    """(values, baseline values, contributions) in the base model's decision space."""
+    group = layout['groups'][id(spec)]
+    if spec['kind'] == 'forest':
+        n_classes = len(spec['classes'])
+        contributions = raw[group][:, :, :n_classes]
+        return _forest_proba(spec, pool, leaves), layout['bias'][group][:n_classes], contributions
+    n_per_stage = spec['n_per_stage']
+    return (_gradient_boosting_raw(spec, pool, leaves), layout['bias'][group][:n_per_stage],
+            raw[group][:, :, :n_per_stage])
+
+def _explain_forest(spec, pool, leaves, layout, raw):
+    proba, bias, contributions = _decision_attribution(spec, pool, leaves, layout, raw)
+    return proba, np.broadcast_to(bias, proba.shape), contributions
+
+def _explain_gradient_boosting(spec, pool, leaves, layout, raw):
+    values, bias, contributions = _decision_attribution(spec, pool, leaves, layout, raw)
+    proba = _raw_to_proba(values)
+    bias_proba = np.broadcast_to(_raw_to_proba(bias[np.newaxis, :]), proba.shape)
+    return proba, bias_proba, _link_attribution(_raw_to_proba, values, bias, contributions)
+
+def _explain_calibrated(spec, pool, leaves, layout, raw):
+    n_classes = len(spec['classes'])
+    explained = []
+    for member in spec['members']:
+        values, bias, contributions = _decision_attribution(member['base'], pool, leaves, layout, raw)
+        def link(decision_values, member=member):
+            return _calibrate(member, decision_values, n_classes)
+        proba = link(values)
+        bias_proba = np.broadcast_to(link(bias[np.newaxis, :]), proba.shape)
+        explained.append((proba, bias_proba, _link_attribution(link, values, bias, contributions)))
+    return tuple(sum(parts) / len(explained) for parts in zip(*explained))
+
+def _explain_voting(spec, pool, leaves, layout, raw):
+    explained = [_EXPLAIN[member['kind']](member, pool, leaves, layout, raw) for member in spec['members']]
+    return tuple(np.average(parts, axis=0, weights=spec['weights']) for parts in zip(*explained))
+
+_EXPLAIN = {
+    'forest': _explain_forest,
+    'gradient_boosting': _explain_gradient_boosting,
+    'hist_gradient_boosting': _explain_gradient_boosting,
+    'calibrated': _explain_calibrated,
+    'voting': _explain_voting,
+}
+
+def explain(spec, X, layout=None):
+    """
+    (proba, baseline, contributions) for a compiled top-level model.
+    contributions has shape (n_rows, n_features, n_classes) and
+    baseline + contributions.sum(axis=1) == proba for every row; proba is
+    exactly what predict_proba returns. Costs a small multiple of it.
+    """
+    X = np.asarray(X)
+    pool = spec['pool']
+    layout = layout or attribution_layout(spec)
+    n_classes = len(spec['classes'])
+    proba = np.empty((X.shape[0], n_classes))
+    baseline = np.empty((X.shape[0], n_classes))
+    contributions = np.empty((X.shape[0], X.shape[1], n_classes))
+    for rows, leaves in iter_tree_leaves(pool, X):
+        raw = path_contributions(pool, layout, leaves, X.shape[1])
+        proba[rows], baseline[rows], contributions[rows] = _EXPLAIN[spec['kind']](spec, pool, leaves, layout, raw)
+    return proba, baseline, contributions
+
+class CompiledModel:
+    """Drop-in for the sklearn classifier: `classes_` and `predict_proba` on arrays."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.classes_ = np.asarray(spec['classes'])
+        self._layout = None
+
+    def predict_proba(self, X):
+        return predict_proba(self.spec, X)
+
+    def explain(self, X):
+        """(proba, baseline, per-feature contributions); see explain()."""
+        if self._layout is None:
+            self._layout = attribution_layout(self.spec)
+        return explain(self.spec, X, self._layout)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+class CompiledScaler:
+    """Holds the StandardScaler statistics that serving needs."""
+
+    def __init__(self, spec):
+        self.mean_ = spec['mean_']
+        self.scale_ = spec['scale_']
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+# ======================================================
+# CLI: export + equivalence check
+# ======================================================
+
+def export_compiled_artifact(model_data, output_dir, check_rows=None):
+    """
+    Compiles the training dict into a model store directory (model_store.py).
+    When `check_rows` (a scaled feature matrix per model) is given, the
+    compiled probabilities are compared against sklearn's predict_proba and
+    the max abs error returned.
+    """
+    from model_store import save_model_store
+
+    artifact = compile_model_artifact(model_data)
+    save_model_store(artifact, output_dir)
+
+    errors = {}
+    for key, X in (check_rows or {}).items():
+        expected = model_data[key].predict_proba(X)
+        got = predict_proba(artifact[key], np.asarray(X))
+        errors[key] = float(np.max(np.abs(expected - got)))
+    return errors
+
+def _check_rows(model_data, n_rows=500, seed=42):
+    """Scaled rows drawn from maternal_dataset.csv for the equivalence check."""
+    import pandas as pd
+    from feature_pipeline import FeaturePipeline, engineer_features
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    df = pd.read_csv(os.path.join(script_dir, 'maternal_dataset.csv'))
+    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    df = df.fillna(0).sample(n=min(n_rows, len(df)), random_state=seed)
+    engineer_features(df)
+    df = pd.get_dummies(df, columns=['fetal_presentation'])
+
+    rows = {}
+    for key, scaler_key, features_key in (
+        ('model', 'scaler', 'features'),
+        ('first_time_model', 'first_time_scaler', 'first_time_features'),
+    ):
+        features = model_data[features_key]
+        X = FeaturePipeline(features).transform(df)
+        X = model_data[scaler_key].transform(pd.DataFrame(X, columns=features))
+        rows[key] = pd.DataFrame(X, columns=features)
+    return rows
+
+if __name__ == "__main__":
+    import joblib
+    from model_store import STORE_DIRNAME
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    model_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "delivery_model.joblib")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(script_dir, STORE_DIRNAME)
+
+    model_data = joblib.load(model_path)
+    errors = export_compiled_artifact(model_data, output_path, _check_rows(model_data))
+    print(f"💾 Compiled model saved as '{output_path}'")
+    for key, error in errors.items():
+        print(f"   {key}: max |predict_proba - compiled| = {error:.2e}")
@@ -0,0 +1,504 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import statistics
+import numpy as np
+import warnings
+
+warnings.filterwarnings("ignore")
+
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+
+from train_model import (
+    DATASET_FILE, TRAINING_PROFILES, DEFAULT_PROFILE, HYPERPARAMETERS,
+    load_training_data, build_model_A_matrix, build_model_B_matrix,
+    create_ensemble_model, create_fast_ensemble_model,
+)
+from tree_engine import export_estimator, predict_proba
+
+# --- Configuration ---
+TUNING_DIR = 'tuning'
+STATE_FILE = 'state.json'
+CHECKPOINT_FILE = 'results.jsonl'
+REPORT_FILE = 'report.json'
+TUNED_PARAMS_FILE = 'tuned_params.json'
+
+DEFAULT_CANDIDATES = 27
+DEFAULT_FOLDS = 3
+DEFAULT_RUNGS = 3
+# Successive halving keeps 1/ETA of the candidates per rung and gives them ETA x the rows
+ETA = 3
+DEFAULT_SEED = 42
+
+# Model A's forest weight in the soft vote; the booster gets the rest.
+# Weights are scored from the members' cached probabilities, not refitted.
+VOTE_WEIGHT_GRID = (0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85)
+
+# Single-row compiled predictions timed per candidate (fold 0 only)
+LATENCY_ROWS = 50
+LATENCY_REPEATS = 3
+
+# --quick caps every tree count so a smoke run finishes in minutes
+QUICK_TREE_CAP = 40
+
+# Values sampled per hyperparameter group; the current defaults are always candidate c000
+SEARCH_SPACES = {
+    'model_A': {
+        'model_A_rf': {
+            'n_estimators': [300, 600, 1000, 1300],
+            'max_depth': [16, 22, 28, None],
+            'min_samples_leaf': [1, 2, 4],
+            'max_features': ['sqrt', 0.3],
+        },
+        'model_A_gb': {
+            'n_estimators': [200, 350, 500],
+            'learning_rate': [0.04, 0.08, 0.12],
+            'max_depth': [3, 4, 6],
+            'subsample': [0.8, 0.9, 1.0],
+        },
+        'model_A_hgb': {
+            'max_iter': [200, 500, 800],
+            'learning_rate': [0.04, 0.08, 0.12],
+            'max_depth': [4, 6, 8, None],
+        },
+    },
+    'model_B': {
+        'model_B_rf': {
+            'n_estimators': [300, 600, 1000, 1500],
+            'max_depth': [8, 12, 15, 20, None],
+            'min_samples_leaf': [1, 2, 4],
+            'max_features': ['sqrt', 0.5],
+        },
+    },
+}
+
+# Hyperparameter groups each (model, profile) pair fits
+_GROUPS = {
+    ('model_A', 'full'): ('model_A_rf', 'model_A_gb'),
+    ('model_A', 'fast'): ('model_A_rf', 'model_A_hgb'),
+    ('model_B', 'full'): ('model_B_rf',),
+    ('model_B', 'fast'): ('model_B_rf',),
+}
+
+_TREE_COUNT_KEYS = ('n_estimators', 'max_iter')
+
+# ======================================================
+# FOLDS (scaled once, shared with workers as .npy memory maps)
+# ======================================================
+
+def _dataset_signature(dataset_file):
+    stat = os.stat(dataset_file)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def prepare_folds(model, work_dir, n_folds, seed):
+    """
+    Builds the unscaled matrix for `model` once, then for every fold fits a
+    StandardScaler on the fold's training rows (as train_model.py does on its
+    split) and writes X_train/y_train/X_val/y_val as .npy files. Workers open
+    them with mmap_mode='r', so the arrays are never pickled to a worker.
+    """
+    df, first_time_df, _ = load_training_data()
+    if model == 'model_A':
+        X, y = build_model_A_matrix(df)
+    else:
+        X, y = build_model_B_matrix(first_time_df)
+    X = X.to_numpy(dtype=np.float64)
+    y = y.to_numpy()
+
+    folds = []
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    for k, (train_idx, val_idx) in enumerate(splitter.split(X, y)):
+        scaler = StandardScaler().fit(X[train_idx])
+        paths = {}
+        for part, array in (
+            ('X_train', scaler.transform(X[train_idx])), ('y_train', y[train_idx]),
+            ('X_val', scaler.transform(X[val_idx])), ('y_val', y[val_idx]),
+        ):
+            paths[part] = os.path.join(work_dir, f"fold{k}_{part}.npy")
+            np.save(paths[part], np.ascontiguousarray(array))
+        folds.append(paths)
+    return {'folds': folds, 'n_rows': int(len(y)), 'n_features': int(X.shape[1])}
+
+def _load_fold(paths):
+    return {part: np.load(path, mmap_mode='r') for part, path in paths.items()}
+
+# ======================================================
+# CANDIDATES
+# ======================================================
+
+def _cap_trees(params, cap):
+    return {key: (min(value, cap) if key in _TREE_COUNT_KEYS and cap else value)
+            for key, value in params.items()}
+
+def sample_candidates(model, profile, n_candidates, seed, tree_cap=None):
+    """Current defaults first, then distinct random draws from SEARCH_SPACES."""
+    groups = _GROUPS[(model, profile)]
+    space = SEARCH_SPACES[model]
+    rng = random.Random(seed)
+
+    def defaults():
+        return {group: _cap_trees(HYPERPARAMETERS[group], tree_cap) for group in groups}
+
+    candidates, seen = [], set()
+    draws = [defaults()]
+    attempts = 0
+    while len(draws) < n_candidates and attempts < n_candidates * 50:
+        attempts += 1
+        draw = defaults()
+        for group in groups:
+            for key, values in space[group].items():
+                draw[group][key] = values[rng.randrange(len(values))]
+            draw[group] = _cap_trees(draw[group], tree_cap)
+        draws.append(draw)
+
+    for draw in draws:
+        key = json.dumps(draw, sort_keys=True)
+        if key in seen:
+            continue
+        seen.add(key)
+        candidates.append({'id': f"c{len(candidates):03d}", 'params': draw})
+        if len(candidates) >= n_candidates:
+            break
+    return candidates
+
+# ======================================================
+# WORKER: fit one candidate on one fold at one rung
+# ======================================================
+
+def _limit_worker_threads():
+    # One process per core: keep OpenMP/BLAS inside each worker single-threaded
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=1)
+
+def _fit_model(model, profile, params, X_train, y_train):
+    """Returns (fitted estimator, [members whose probabilities are voted]) with n_jobs=1."""
+    if model == 'model_B':
+        forest = RandomForestClassifier(
+            **params['model_B_rf'], class_weight='balanced', random_state=42, n_jobs=1
+        )
+        forest.fit(X_train, y_train)
+        return forest, None
+
+    rf = RandomForestClassifier(**params['model_A_rf'], class_weight='balanced', random_state=42, n_jobs=1)
+    if profile == 'fast':
+        ensemble = create_fast_ensemble_model(rf, X_train, y_train, params['model_A_hgb'], verbose=False)
+    else:
+        gb = GradientBoostingClassifier(**params['model_A_gb'], random_state=42)
+        ensemble = create_ensemble_model(rf, gb, n_jobs=1)
+        ensemble.fit(X_train, y_train)
+    return ensemble, [ensemble.named_estimators_['rf'], ensemble.named_estimators_['gb']]
+
+def _single_row_latency_ms(estimator, X_val):
+    """Median time of one compiled predict_proba call on a single row."""
+    spec = export_estimator(estimator)
+    rows = np.asarray(X_val[:LATENCY_ROWS])
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        for i in range(len(rows)):
+            started = time.perf_counter()
+            predict_proba(spec, rows[i:i + 1])
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def evaluate_task(task):
+    """
+    Scores one (candidate, rung, fold). Runs in a pool worker; the fold
+    arrays come from memory-mapped .npy files. Model A reports accuracy for
+    every vote weight in VOTE_WEIGHT_GRID from one fit.
+    """
+    fold = _load_fold(task['fold_paths'])
+    X_train, y_train = fold['X_train'], np.asarray(fold['y_train'])
+    if task['fraction'] < 1.0:
+        keep, _ = train_test_split(
+            np.arange(len(y_train)), train_size=task['fraction'],
+            stratify=y_train, random_state=task['seed']
+        )
+        X_train, y_train = X_train[np.sort(keep)], y_train[np.sort(keep)]
+    else:
+        X_train = np.asarray(X_train)
+    X_val, y_val = np.asarray(fold['X_val']), np.asarray(fold['y_val'])
+
+    started = time.perf_counter()
+    estimator, members = _fit_model(task['model'], task['profile'], task['params'], X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    result = {
+        'candidate': task['candidate'], 'rung': task['rung'], 'fold': task['fold'],
+        'n_train': int(len(y_train)), 'fit_seconds': round(fit_seconds, 3),
+    }
+    classes = np.asarray(estimator.classes_)
+    if members is None:
+        pred = classes[np.argmax(estimator.predict_proba(X_val), axis=1)]
+        result['accuracy'] = float(np.mean(pred == y_val))
+    else:
+        rf_proba, gb_proba = (member.predict_proba(X_val) for member in members)
+        result['accuracy_by_weight'] = [
+            float(np.mean(classes[np.argmax(w * rf_proba + (1 - w) * gb_proba, axis=1)] == y_val))
+            for w in task['weight_grid']
+        ]
+    if task['measure_latency']:
+        result['latency_ms'] = round(_single_row_latency_ms(estimator, X_val), 4)
+    return result
+
+# ======================================================
+# SUCCESSIVE HALVING
+# ======================================================
+
+def rung_fraction(rung, n_rungs):
+    """Share of each fold's training rows used at `rung`; the last rung uses all of them."""
+    return float(ETA ** (rung - (n_rungs - 1)))
+
+def pareto_front(scores):
+    """Ids not dominated on (higher accuracy, lower latency)."""
+    front = []
+    for cid, score in scores.items():
+        dominated = any(
+            other['accuracy'] >= score['accuracy'] and other['latency_ms'] <= score['latency_ms']
+            and (other['accuracy'] > score['accuracy'] or other['latency_ms'] < score['latency_ms'])
+            for oid, other in scores.items() if oid != cid
+        )
+        if not dominated:
+            front.append(cid)
+    return sorted(front)
+
+def aggregate_rung(results, rung, candidate_ids, weight_grid):
+    """Mean accuracy over folds per candidate; Model A also picks its best vote weight."""
+    scores = {}
+    for cid in candidate_ids:
+        rows = [r for r in results if r['candidate'] == cid and r['rung'] == rung]
+        latency = next((r['latency_ms'] for r in rows if 'latency_ms' in r), None)
+        if 'accuracy_by_weight' in rows[0]:
+            by_weight = np.mean([r['accuracy_by_weight'] for r in rows], axis=0)
+            best = int(np.argmax(by_weight))
+            per_fold = [r['accuracy_by_weight'][best] for r in rows]
+            weight = weight_grid[best]
+        else:
+            per_fold = [r['accuracy'] for r in rows]
+            weight = None
+        scores[cid] = {
+            'accuracy': float(np.mean(per_fold)),
+            'accuracy_std': float(np.std(per_fold)),
+            'vote_weight': weight,
+            'latency_ms': latency,
+            'fit_seconds': round(sum(r['fit_seconds'] for r in rows), 2),
+            'n_train': rows[0]['n_train'],
+        }
+    return scores
+
+def promote(scores):
+    """Top 1/ETA by accuracy, plus anything on the accuracy/latency Pareto front."""
+    keep = max(1, len(scores) // ETA)
+    ranked = sorted(scores, key=lambda cid: (-scores[cid]['accuracy'], scores[cid]['latency_ms']))
+    return sorted(set(ranked[:keep]) | set(pareto_front(scores)))
+
+def _load_checkpoint(path):
+    results = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        results.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A run killed mid-write leaves a partial last line
+                        continue
+    return results
+
+def _run_tasks(tasks, n_jobs, checkpoint_path, results):
+    """Runs tasks on a process pool; every finished task is appended to the checkpoint at once."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if not tasks:
+        return
+    with open(checkpoint_path, "a") as checkpoint:
+        def record(result):
+            results.append(result)
+            checkpoint.write(json.dumps(result) + "\n")
+            checkpoint.flush()
+            print(f"   {result['candidate']} rung {result['rung']} fold {result['fold']} "
+                  f"done in {result['fit_seconds']:.1f}s")
+
+        if n_jobs <= 1:
+            _limit_worker_threads()
+            for task in tasks:
+                record(evaluate_task(task))
+            return
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_limit_worker_threads) as executor:
+            futures = [executor.submit(evaluate_task, task) for task in tasks]
+            for future in as_completed(futures):
+                record(future.result())
+
+def tuned_params(candidate, score):
+    """The candidate in train_model.py's `--params` format."""
+    params = {group: dict(values) for group, values in candidate['params'].items()}
+    if score.get('vote_weight') is not None:
+        params['model_A_vote_weights'] = [score['vote_weight'], round(1 - score['vote_weight'], 2)]
+    return params
+
+def run_search(model='model_A', profile=DEFAULT_PROFILE, n_candidates=DEFAULT_CANDIDATES,
+               n_folds=DEFAULT_FOLDS, n_rungs=DEFAULT_RUNGS, n_jobs=None, seed=DEFAULT_SEED,
+               work_dir=TUNING_DIR, fresh=False, tree_cap=None, latency_budget_ms=None):
+    """
+    Successive-halving search for one model. Every finished (candidate,
+    rung, fold) is checkpointed, so rerunning the same command resumes where
+    the last run stopped. Writes report.json and merges the recommended
+    candidate into tuned_params.json, unless no Pareto candidate meets
+    `latency_budget_ms`.
+    """
+    run_dir = os.path.join(work_dir, f"{model}_{profile}")
+    os.makedirs(run_dir, exist_ok=True)
+    state_path = os.path.join(run_dir, STATE_FILE)
+    checkpoint_path = os.path.join(run_dir, CHECKPOINT_FILE)
+
+    config = {
+        'model': model, 'profile': profile, 'n_candidates': n_candidates, 'n_folds': n_folds,
+        'n_rungs': n_rungs, 'eta': ETA, 'seed': seed, 'tree_cap': tree_cap,
+        'dataset': _dataset_signature(DATASET_FILE),
+        'space': hashlib.sha256(json.dumps(SEARCH_SPACES[model], sort_keys=True).encode()).hexdigest()[:16],
+    }
+
+    state = None
+    if os.path.exists(state_path) and not fresh:
+        with open(state_path) as f:
+            state = json.load(f)
+        if state['config'] != config:
+            raise SystemExit(f"❌ {state_path} was written for a different search; "
+                             f"rerun with --fresh to discard it.")
+        print(f"↩️  Resuming search in '{run_dir}/'")
+    if state is None:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print(f"📦 Preparing {n_folds} scaled folds in '{run_dir}/'")
+        state = {
+            'config': config,
+            'data': prepare_folds(model, run_dir, n_folds, seed),
+            'candidates': sample_candidates(model, profile, n_candidates, seed, tree_cap),
+        }
+        with open(state_path, "w") as f:
+            json.dump(state, f, indent=2)
+
+    candidates = {c['id']: c for c in state['candidates']}
+    fold_paths = state['data']['folds']
+    weight_grid = list(VOTE_WEIGHT_GRID) if model == 'model_A' else []
+    results = _load_checkpoint(checkpoint_path)
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    survivors = sorted(candidates)
+    rungs = []
+    for rung in range(n_rungs):
+        fraction = rung_fraction(rung, n_rungs)
+        done = {(r['candidate'], r['fold']) for r in results if r['rung'] == rung}
+        tasks = [
+            {
+                'model': model, 'profile': profile, 'candidate': cid, 'params': candidates[cid]['params'],
+                'rung': rung, 'fold': k, 'fraction': fraction, 'fold_paths': fold_paths[k],
+                'seed': seed, 'weight_grid': weight_grid, 'measure_latency': k == 0,
+            }
+            for cid in survivors for k in range(n_folds) if (cid, k) not in done
+        ]
+        print(f"\n🔎 Rung {rung}: {len(survivors)} candidates x {n_folds} folds on "
+              f"{fraction:.0%} of the rows ({len(tasks)} fits to run)")
+        _run_tasks(tasks, n_jobs, checkpoint_path, results)
+
+        scores = aggregate_rung(results, rung, survivors, weight_grid)
+        front = pareto_front(scores)
+        promoted = promote(scores) if rung < n_rungs - 1 else []
+        rungs.append({
+            'rung': rung, 'fraction': fraction,
+            'candidates': {
+                cid: dict(score, pareto=cid in front, promoted=cid in promoted)
+                for cid, score in scores.items()
+            },
+        })
+        if rung < n_rungs - 1:
+            survivors = promoted
+
+    final = rungs[-1]['candidates']
+    front = sorted((cid for cid, s in final.items() if s['pareto']), key=lambda cid: final[cid]['latency_ms'])
+    within_budget = [cid for cid in front if latency_budget_ms is None or final[cid]['latency_ms'] <= latency_budget_ms]
+    recommended = max(within_budget or front, key=lambda cid: final[cid]['accuracy'])
+
+    report = {
+        'config': config,
+        'rungs': rungs,
+        'pareto_front': [
+            {'id': cid, 'accuracy': final[cid]['accuracy'], 'latency_ms': final[cid]['latency_ms'],
+             'params': tuned_params(candidates[cid], final[cid])}
+            for cid in front
+        ],
+        'latency_budget_ms': latency_budget_ms,
+        'within_budget': bool(within_budget),
+        'recommended': recommended,
+    }
+    with open(os.path.join(run_dir, REPORT_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+
+    _print_final(final, candidates, recommended)
+    print(f"\n📄 Report saved as '{os.path.join(run_dir, REPORT_FILE)}'")
+    params_path = os.path.join(work_dir, TUNED_PARAMS_FILE)
+    if not within_budget:
+        print(f"⚠️  No Pareto candidate meets the {latency_budget_ms} ms latency budget (fastest: "
+              f"{front[0]} at {final[front[0]]['latency_ms']:.3f} ms); '{params_path}' was not updated.")
+        return report
+
+    merged = {}
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            merged = json.load(f)
+    merged.update(tuned_params(candidates[recommended], final[recommended]))
+    with open(params_path, "w") as f:
+        json.dump(merged, f, indent=2)
+
+    print(f"💾 {recommended} merged into '{params_path}' "
+          f"(train with: python train_model.py --profile {profile} --params {params_path})")
+    return report
+
+def _print_final(final, candidates, recommended):
+    print(f"\n{'id':<6} {'accuracy':>9} {'± std':>7} {'latency ms':>11} {'weight':>7} {'pareto':>7}  params")
+    for cid in sorted(final, key=lambda c: -final[c]['accuracy']):
+        score = final[cid]
+        weight = f"{score['vote_weight']:.2f}" if score['vote_weight'] is not None else "-"
+        params = "; ".join(
+            ", ".join(f"{k}={v}" for k, v in values.items()) for values in candidates[cid]['params'].values()
+        )
+        marker = "*" if cid == recommended else " "
+        print(f"{cid:<5}{marker} {score['accuracy']*100:>8.2f}% {score['accuracy_std']*100:>6.2f}% "
+              f"{score['latency_ms']:>11.3f} {weight:>7} {'yes' if score['pareto'] else '':>7}  {params}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search for Model A / Model B")
+    parser.add_argument("--model", choices=('model_A', 'model_B'), default='model_A')
+    parser.add_argument("--profile", choices=TRAINING_PROFILES, default=DEFAULT_PROFILE,
+                        help="tune the estimators of this train_model.py profile")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS)
+    parser.add_argument("--rungs", type=int, default=DEFAULT_RUNGS)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="recommend the most accurate Pareto candidate under this single-row latency "
+                             "(tuned_params.json is left unchanged if none is)")
+    parser.add_argument("--work-dir", default=TUNING_DIR, help="folds, checkpoint and reports")
+    parser.add_argument("--fresh", action="store_true", help="discard an existing checkpoint")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"few candidates, 2 folds and at most {QUICK_TREE_CAP} trees per model (smoke test)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.candidates, args.folds = min(args.candidates, 6), 2
+
+    run_search(
+        model=args.model, profile=args.profile, n_candidates=args.candidates, n_folds=args.folds,
+        n_rungs=args.rungs, n_jobs=args.jobs, seed=args.seed, work_dir=args.work_dir,
+        fresh=args.fresh, tree_cap=QUICK_TREE_CAP if args.quick else None,
+        latency_budget_ms=args.latency_budget_ms,
+    )
+    sys.exit(0)
@@ -0,0 +1,411 @@
+import os
+import sys
+import gc
+import json
+import time
+import signal
+import socket
+import selectors
+
+# --- Configuration (environment) ---
+# ML_POOL_WORKERS          forked workers behind `ml_model.py --serve` (default 1 = no pool)
+# ML_POOL_HEALTH_INTERVAL  seconds between health pings to each worker (default 5)
+# ML_POOL_HEALTH_TIMEOUT   seconds a ping may stay unanswered before the worker is replaced (default 20)
+DEFAULT_HEALTH_INTERVAL = 5.0
+DEFAULT_HEALTH_TIMEOUT = 20.0
+
+# A worker that dies this soon after being forked is replaced only after a back-off
+MIN_HEALTHY_UPTIME = 5.0
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+READ_CHUNK = 65536
+
+class _Worker:
+    """Parent-side view of one forked worker."""
+
+    def __init__(self, slot, pid, sock):
+        self.slot = slot
+        self.pid = pid
+        self.sock = sock
+        self.started = time.monotonic()
+        self.ready = False
+        self.inbox = b""
+        self.outbox = bytearray()
+        self.in_flight = {}  # pool id -> (client id, load)
+        self.load = 0
+        self.served = 0
+        self.ping_id = None
+        self.ping_sent = 0.0
+        self.last_ping = time.monotonic()
+
+class PreforkPool:
+    """
+    Serves the NDJSON worker protocol from a parent that loaded the models
+    once and forked `n_workers` children, which share the model memory
+    copy-on-write (and the memory-mapped store through the page cache).
+    Each child runs ml_model.serve_forever on its own socket. The parent is
+    a single-threaded selector loop: it hands every request to the worker
+    with the least in-flight rows, rewrites ids on the way back, pings each
+    worker periodically, and forks a replacement when one dies or hangs.
+    """
+
+    def __init__(self, n_workers, serve, stream_in=None, stream_out=None,
+                 health_interval=DEFAULT_HEALTH_INTERVAL, health_timeout=DEFAULT_HEALTH_TIMEOUT):
+        self.n_workers = max(int(n_workers), 1)
+        self.serve = serve
+        self.stream_in = stream_in or sys.stdin
+        self.stream_out = stream_out or sys.stdout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.selector = selectors.DefaultSelector()
+        self.workers = {}
+        self.respawn_at = {}  # slot -> monotonic time
+        self.restart_delay = {}  # slot -> current back-off
+        self.backlog = []
+        self.next_id = 1
+        self.input_open = True
+        self.stdin_buffer = b""
+        self.announced = False
+        self.stats_counters = {'dispatched': 0, 'restarts': 0, 'health_kills': 0, 'failed_in_flight': 0}
+
+    # --- Worker lifecycle ---
+
+    def _spawn(self, slot):
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            self._run_child(child_sock)
+        child_sock.close()
+        parent_sock.setblocking(False)
+        worker = _Worker(slot, pid, parent_sock)
+        self.workers[slot] = worker
+        self.selector.register(parent_sock, selectors.EVENT_READ, worker)
+        return worker
+
+    def _run_child(self, sock):
+        code = 0
+        try:
+            for worker in self.workers.values():
+                worker.sock.close()
+            self.selector.close()
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # The parent owns stdin/stdout; stray prints go to stderr
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(2, 1)
+            sys.stdout = sys.stderr
+            self.serve(sock.makefile("r", encoding="utf-8"), sock.makefile("w", encoding="utf-8"))
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _retire(self, worker, reason):
+        """Unregisters a dead worker, fails its in-flight requests and schedules a replacement."""
+        self.selector.unregister(worker.sock)
+        worker.sock.close()
+        try:
+            os.kill(worker.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        try:
+            os.waitpid(worker.pid, 0)
+        except ChildProcessError:
+            pass
+        del self.workers[worker.slot]
+
+        for client_id, _ in worker.in_flight.values():
+            # Not retried: the input may be what crashed the worker
+            self._respond({"id": client_id, "error": f"ML pool worker exited before answering ({reason})."})
+            self.stats_counters['failed_in_flight'] += 1
+
+        if not self.input_open and not self.backlog:
+            return
+        uptime = time.monotonic() - worker.started
+        delay = self.restart_delay.get(worker.slot, RESTART_DELAY)
+        if uptime >= MIN_HEALTHY_UPTIME:
+            delay = 0.0
+            self.restart_delay[worker.slot] = RESTART_DELAY
+        else:
+            self.restart_delay[worker.slot] = min(delay * 2, MAX_RESTART_DELAY)
+        self.respawn_at[worker.slot] = time.monotonic() + delay
+        print(f"[ml-pool] worker {worker.pid} retired ({reason}); replacing in {delay:.1f}s", file=sys.stderr)
+
+    def _respawn_due(self):
+        now = time.monotonic()
+        for slot, due in list(self.respawn_at.items()):
+            if due <= now:
+                del self.respawn_at[slot]
+                self._spawn(slot)
+                self.stats_counters['restarts'] += 1
+
+    def _check_health(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.ping_id is not None:
+                if now - worker.ping_sent > self.health_timeout:
+                    self.stats_counters['health_kills'] += 1
+                    self._retire(worker, "health check timed out")
+                continue
+            if now - worker.last_ping >= self.health_interval:
+                worker.ping_id = self.next_id
+                self.next_id += 1
+                worker.ping_sent = now
+                self._send(worker, {"id": worker.ping_id, "op": "ping"})
+
+    # --- I/O ---
+
+    def _respond(self, message):
+        self.stream_out.write(json.dumps(message) + "\n")
+        self.stream_out.flush()
+
+    def _send(self, worker, message):
+        worker.outbox += (json.dumps(message) + "\n").encode("utf-8")
+        self._flush_outbox(worker)
+
+    def _flush_outbox(self, worker):
+        if worker.outbox:
+            try:
+                sent = worker.sock.send(worker.outbox)
+                del worker.outbox[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                # Worker is gone; the read side sees EOF and retires it
+                worker.outbox.clear()
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if worker.outbox else 0)
+        self.selector.modify(worker.sock, events, worker)
+
+    def _read_worker(self, worker):
+        try:
+            data = worker.sock.recv(READ_CHUNK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._retire(worker, "connection closed")
+            return
+        worker.inbox += data
+        *lines, worker.inbox = worker.inbox.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self._on_worker_message(worker, json.loads(line))
+
+    def _on_worker_message(self, worker, message):
+        if message.get("event") == "ready":
+            worker.ready = True
+            if not self.announced and all(w.ready for w in self.workers.values()) \
+                    and len(self.workers) == self.n_workers:
+                self.announced = True
+                self._respond({"event": "ready", "models_loaded": self.models_loaded,
+                               "pool_workers": self.n_workers})
+            return
+
+        pool_id = message.get("id")
+        if pool_id is not None and pool_id == worker.ping_id:
+            worker.ping_id = None
+            worker.last_ping = time.monotonic()
+            return
+
+        entry = worker.in_flight.pop(pool_id, None)
+        if entry is None:
+            return
+        client_id, load = entry
+        worker.load -= load
+        worker.served += 1
+        message["id"] = client_id
+        self._respond(message)
+
+    # --- Dispatch ---
+
+    def _dispatch(self, request):
+        if not self.workers:
+            self.backlog.append(request)
+            return
+        # Least-loaded: fewest rows in flight, oldest worker on ties
+        worker = min(self.workers.values(), key=lambda w: (w.load, w.started))
+        load = len(request.get("inputs") or []) if request.get("op") == "predict_batch" else 1
+        pool_id = self.next_id
+        self.next_id += 1
+        worker.in_flight[pool_id] = (request.get("id"), max(load, 1))
+        worker.load += max(load, 1)
+        self.stats_counters['dispatched'] += 1
+        self._send(worker, dict(request, id=pool_id))
+
+    def _on_client_line(self, line):
+        try:
+            request = json.loads(line)
+        except Exception as e:
+            self._respond({"id": None, "error": f"Invalid JSON input: {e}"})
+            return
+        if not isinstance(request, dict):
+            self._respond({"id": None, "error": "Request must be a JSON object"})
+            return
+        if request.get("op") == "pool_stats":
+            self._respond({"id": request.get("id"), "result": self.stats()})
+            return
+        self._dispatch(request)
+
+    def _read_client(self):
+        data = os.read(self.stream_in.fileno(), READ_CHUNK)
+        if not data:
+            self.input_open = False
+            self.selector.unregister(self.stream_in)
+            return
+        self.stdin_buffer += data
+        *lines, self.stdin_buffer = self.stdin_buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self._on_client_line(line.decode("utf-8"))
+
+    def stats(self):
+        stats = dict(self.stats_counters)
+        stats['workers'] = [
+            {'pid': w.pid, 'ready': w.ready, 'in_flight': len(w.in_flight), 'load': w.load,
+             'served': w.served, 'uptime_seconds': round(time.monotonic() - w.started, 1)}
+            for w in sorted(self.workers.values(), key=lambda w: w.slot)
+        ]
+        stats['pool_workers'] = self.n_workers
+        stats['backlog'] = len(self.backlog)
+        return stats
+
+    # --- Main loop ---
+
+    def run(self, models_loaded):
+        self.models_loaded = models_loaded
+        # Objects that exist now never move to a younger generation, so the
+        # children's garbage collector does not dirty the shared model pages
+        gc.collect()
+        gc.freeze()
+        for slot in range(self.n_workers):
+            self._spawn(slot)
+        self.selector.register(self.stream_in, selectors.EVENT_READ, None)
+
+        try:
+            while self.input_open or self.backlog or any(w.in_flight for w in self.workers.values()):
+                for key, events in self.selector.select(timeout=min(self.health_interval, 1.0)):
+                    if key.data is None:
+                        self._read_client()
+                        continue
+                    worker = key.data
+                    if worker.slot not in self.workers or self.workers[worker.slot] is not worker:
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._flush_outbox(worker)
+                    if events & selectors.EVENT_READ:
+                        self._read_worker(worker)
+                self._respawn_due()
+                if self.backlog and self.workers:
+                    backlog, self.backlog = self.backlog, []
+                    for request in backlog:
+                        self._dispatch(request)
+                self._check_health()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Closing a worker's socket ends its serve loop after it answers what it holds."""
+        for worker in list(self.workers.values()):
+            try:
+                worker.sock.setblocking(True)
+                if worker.outbox:
+                    worker.sock.sendall(worker.outbox)
+                worker.sock.close()
+            except OSError:
+                pass
+        for worker in list(self.workers.values()):
+            try:
+                os.waitpid(worker.pid, 0)
+            except ChildProcessError:
+                pass
+        self.workers.clear()
+
+def pool_size_from_env():
+    return int(os.environ.get("ML_POOL_WORKERS", 1))
+
+def serve_pool(n_workers, serve, load_models):
+    """Loads the models in this process, then forks the pool and serves stdin/stdout."""
+    components = load_models()
+    if components is not None:
+        # Map the compiled sub-models before forking so children share them
+        for key in ('model_A', 'ft_model'):
+            load = getattr(components[key], 'load', None)
+            if callable(load):
+                load()
+    pool = PreforkPool(
+        n_workers, serve,
+        health_interval=float(os.environ.get("ML_POOL_HEALTH_INTERVAL", DEFAULT_HEALTH_INTERVAL)),
+        health_timeout=float(os.environ.get("ML_POOL_HEALTH_TIMEOUT", DEFAULT_HEALTH_TIMEOUT)),
+    )
+    pool.run(models_loaded=components is not None)
+
+# ======================================================
+# MEASUREMENT: throughput and memory per pool size
+# ======================================================
+
+def _smaps_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return sum(int(line.split()[1]) for line in f if line.startswith(field + ":"))
+    except OSError:
+        return 0
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def measure_pool(script_dir, pool_sizes, n_requests=2000):
+    """
+    Streams `n_requests` single predictions through `ml_model.py --serve`
+    for each pool size and reports requests/second and the proportional
+    (shared pages split between processes) memory of the whole tree.
+    """
+    import subprocess
+    from model_store import MEASURE_RECORDS
+
+    records = [MEASURE_RECORDS['model_A'], MEASURE_RECORDS['model_B']]
+    report = {}
+    for size in pool_sizes:
+        env = dict(os.environ, ML_POOL_WORKERS=str(size), ML_CACHE_SIZE="0")
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(script_dir, "ml_model.py"), "--serve"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env,
+        )
+        proc.stdout.readline()  # ready
+        start = time.perf_counter()
+        for i in range(n_requests):
+            record = dict(records[i % 2], age=20 + i % 25)
+            proc.stdin.write(json.dumps({"id": i, "input": record}) + "\n")
+        proc.stdin.flush()
+        for _ in range(n_requests):
+            proc.stdout.readline()
+        elapsed = time.perf_counter() - start
+
+        pids = [proc.pid] + _children(proc.pid)
+        report[f"{size} worker(s)"] = {
+            'requests_per_second': round(n_requests / elapsed, 1),
+            'processes': len(pids),
+            'pss_mb': round(sum(_smaps_kb(pid, "Pss") for pid in pids) / 1024, 1),
+            'rss_mb': round(sum(_smaps_kb(pid, "Rss") for pid in pids) / 1024, 1),
+        }
+        proc.stdin.close()
+        proc.wait()
+    report['cpu_count'] = os.cpu_count()
+    return report
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        sizes = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+        print(json.dumps(measure_pool(script_dir, sizes), indent=2))
+    else:
+        print("Usage: python worker_pool.py --measure [pool sizes...]")
@@ -188,6 +188,11 @@ const patientDataSchema = mongoose.Schema({
     confidenceScore: {
         type: Number,
         default: 0.0,
+    },
+    // Registry version (or artifact stamp) of the model that produced the prediction
+    predictionModelVersion: {
+        type: String,
+        default: null,
     }
 }, {
     timestamps: true,
@@ -1,6 +1,6 @@
 // backend/routes/prediction.js
 import express from 'express';
-import { runPrediction } from '../controllers/predictionController.js';
+import { runPrediction, getPredictionMetrics, getPredictionDrift } from '../controllers/predictionController.js';
 import { protect, authorize } from '../controllers/authController.js';
 
 const router = express.Router();
@@ -8,4 +8,10 @@ const router = express.Router();
 // Prediction: Doctor, Admin only
 router.post('/patient/:id', protect, authorize(['doctor', 'admin']), runPrediction);
 
+// ML service metrics: Admin only
+router.get('/metrics', protect, authorize(['admin']), getPredictionMetrics);
+
+// Input drift and prediction mix vs. training data: Admin only
+router.get('/drift', protect, authorize(['admin']), getPredictionDrift);
+
 export default router;
\ No newline at end of file
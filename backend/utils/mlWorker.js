@@ -0,0 +1,162 @@
+// backend/utils/mlWorker.js
+import { PythonShell } from 'python-shell';
+import path from 'path';
+import { fileURLToPath } from 'url';
+
+// Define __dirname for ES Modules
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const SCRIPT_PATH = path.join(__dirname, '..', 'ml_service');
+const REQUEST_TIMEOUT_MS = Number(process.env.ML_WORKER_TIMEOUT_MS) || 30000;
+const RESTART_DELAY_MS = 1000;
+const MAX_RESTART_DELAY_MS = 30000;
+
+let worker = null;
+let restartTimer = null;
+let restartDelay = RESTART_DELAY_MS;
+let shuttingDown = false;
+let nextRequestId = 1;
+const pending = new Map();
+
+const failPending = (error) => {
+  for (const [id, entry] of pending) {
+    clearTimeout(entry.timer);
+    entry.reject(error);
+    pending.delete(id);
+  }
+};
+
+const handleMessage = (line) => {
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch (error) {
+    console.error('ML Worker Output Error:', line);
+    return;
+  }
+
+  if (message.event === 'ready') {
+    // A healthy start resets the crash back-off.
+    restartDelay = RESTART_DELAY_MS;
+    return;
+  }
+
+  const entry = pending.get(message.id);
+  if (!entry) return;
+
+  pending.delete(message.id);
+  clearTimeout(entry.timer);
+
+  if (message.error) {
+    entry.reject(new Error(message.error));
+  } else {
+    entry.resolve(message.result);
+  }
+};
+
+const scheduleRestart = () => {
+  if (shuttingDown || restartTimer) return;
+
+  restartTimer = setTimeout(() => {
+    restartTimer = null;
+    if (!worker) startWorker();
+  }, restartDelay);
+  restartDelay = Math.min(restartDelay * 2, MAX_RESTART_DELAY_MS);
+};
+
+/**
+ * @desc Spawns `ml_model.py --serve`, which loads the models once and then
+ *       answers newline-delimited JSON requests for the life of the process.
+ */
+const startWorker = () => {
+  const shell = new PythonShell('ml_model.py', {
+    mode: 'text',
+    pythonOptions: ['-u'],
+    scriptPath: SCRIPT_PATH,
+    args: ['--serve'],
+  });
+
+  shell.on('message', handleMessage);
+  shell.on('stderr', (line) => console.error(`[ml-worker] ${line}`));
+  shell.on('error', (error) => console.error('ML Worker Error:', error));
+  shell.on('pythonError', (error) => console.error('ML Worker Crashed:', error));
+  shell.on('close', () => {
+    if (worker !== shell) return;
+    worker = null;
+    failPending(new Error('ML worker exited before answering.'));
+    scheduleRestart();
+  });
+
+  worker = shell;
+  return shell;
+};
+
+const killWorker = () => {
+  if (!worker) return;
+  const shell = worker;
+  worker = null;
+  shell.kill();
+};
+
+/**
+ * @desc Sends one request object to the persistent worker and resolves with
+ *       its `result` field. The request id is assigned here.
+ */
+const requestWorker = (request) => {
+  if (shuttingDown) {
+    return Promise.reject(new Error('ML worker is shutting down.'));
+  }
+
+  const shell = worker || startWorker();
+  const id = nextRequestId++;
+
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      reject(new Error(`ML worker timed out after ${REQUEST_TIMEOUT_MS} ms.`));
+      // A stuck worker is replaced rather than left holding the queue.
+      killWorker();
+      failPending(new Error('ML worker was restarted after a timeout.'));
+      scheduleRestart();
+    }, REQUEST_TIMEOUT_MS);
+
+    pending.set(id, { resolve, reject, timer });
+    shell.send(JSON.stringify({ ...request, id }));
+  });
+};
+
+/**
+ * @desc Sends one feature payload to the persistent worker and resolves with
+ *       the prediction object produced by `predict_delivery_type_merged`.
+ *       With `explain`, model-scored results also carry `top_features`.
+ */
+const predictWithWorker = (mlFeatures, { explain = false, topK } = {}) => requestWorker({
+  op: 'predict',
+  input: mlFeatures,
+  ...(explain ? { explain: true, top_k: topK } : {}),
+});
+
+/**
+ * @desc Fetches the worker's per-stage latency and route metrics
+ *       ('json' snapshot or 'prometheus' text).
+ */
+const getWorkerMetrics = (format = 'json') => requestWorker({ op: 'metrics', format });
+
+/**
+ * @desc Fetches the worker's input-drift and prediction-mix snapshot
+ *       (per-feature PSI/KS against the training data, class mix, rule overrides).
+ */
+const getWorkerDrift = () => requestWorker({ op: 'drift' });
+
+const stopWorker = () => {
+  shuttingDown = true;
+  clearTimeout(restartTimer);
+  restartTimer = null;
+  failPending(new Error('ML worker is shutting down.'));
+  killWorker();
+};
+
+process.once('exit', stopWorker);
+
+export { predictWithWorker, getWorkerMetrics, getWorkerDrift, stopWorker };